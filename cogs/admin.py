@@ -120,6 +120,25 @@ class Admin(commands.Cog):
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @app_commands.command(name="battle_record", description="Show a user's stored battle record (admin only)")
+    @app_commands.describe(user_id="User ID to report on", recent="How many recent battles to list")
+    async def battle_record(self, interaction: discord.Interaction, user_id: str,
+                            recent: app_commands.Range[int, 0, 20] = 5):
+        if not self._is_admin(interaction):
+            await interaction.response.send_message("Only the bot owner or users with 'mod' role can use this command.", ephemeral=True)
+            return
+        from utils.sheets_sync import battle_record, find_battles
+        record = battle_record(user_id)
+        # Each battle is stored when it starts and again with its winner; list the finished ones.
+        finished = [b for b in find_battles(player=user_id, limit=recent * 2) if b.get("winner") is not None][:recent]
+        lines = [f"**{record['wins']}** wins in **{record['battles']}** finished battles"]
+        for battle in finished:
+            result = "won" if str(battle.get("sides", {}).get(user_id, user_id)) == str(battle["winner"]) else "lost"
+            lines.append(f"• `{battle.get('id')}` — {result}")
+        embed = discord.Embed(title=f"⚔️ Battle record of {user_id}", description="\n".join(lines),
+                              color=discord.Color.blue())
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="resources_view", description="View your resources (admin: for any user) in this game thread")
     @app_commands.describe(user_id="Optional: user id to view (admin only)")
     async def resources_view(self, interaction: discord.Interaction, user_id: str = ""):
@@ -1,12 +1,24 @@
+import asyncio
+import multiprocessing
+import os
 import discord
+from concurrent.futures import ProcessPoolExecutor
 from discord.ext import commands
 from discord import app_commands
 from game.game_manager import game_manager
+from game.win_probability import estimate_win_probability
 
 
 class Army(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Odds simulations share these workers. They are spawned, not forked from the threaded bot,
+        # and start once, on first use, instead of per command.
+        self.odds_pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                                             mp_context=multiprocessing.get_context("spawn"))
+
+    def cog_unload(self):
+        self.odds_pool.shutdown(wait=False, cancel_futures=True)
 
     @app_commands.command(name="army_create", description="Create a new army for 1 labor.")
     async def army_create(self, interaction: discord.Interaction):
@@ -100,6 +112,37 @@ class Army(commands.Cog):
         else:
             await interaction.response.send_message(result['message'], ephemeral=True)
 
+    @app_commands.command(name="army_odds", description="Estimate your army's chance to beat another army.")
+    @app_commands.describe(
+        army_id="The ID of your army",
+        opponent="The owner of the army to compare against",
+        opponent_army_id="The ID of the opponent's army"
+    )
+    async def army_odds(
+        self,
+        interaction: discord.Interaction,
+        army_id: int,
+        opponent: discord.Member,
+        opponent_army_id: int
+    ):
+        army = game_manager.get_global_army(interaction.user.id, army_id)
+        opponent_army = game_manager.get_global_army(opponent.id, opponent_army_id)
+        if not army or not opponent_army:
+            await interaction.response.send_message("Army not found.", ephemeral=True)
+            return
+
+        # Simulations take a few seconds, so acknowledge first and run them off the event loop
+        await interaction.response.defer(thinking=True)
+        result = await asyncio.to_thread(
+            estimate_win_probability, army['units'], opponent_army['units'], 200, 8.0, executor=self.odds_pool
+        )
+        if result['success']:
+            await interaction.followup.send(
+                f"🎲 **Army #{army_id} vs {opponent.display_name}'s Army #{opponent_army_id}**\n{result['message']}"
+            )
+        else:
+            await interaction.followup.send(result['message'], ephemeral=True)
+
     @app_commands.command(name="spawn_resource", description="Spawn resources from your tiles using labor")
     @app_commands.describe(
         resource_type="Type of resource to spawn",
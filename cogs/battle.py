@@ -1,7 +1,14 @@
+import asyncio
+import multiprocessing
 import discord
+from concurrent.futures import ProcessPoolExecutor
 from discord.ext import commands
 from discord import app_commands
-from game.game_manager import game_manager
+from game.ai import DIFFICULTIES, plan_turn
+from game.enums import Phase
+from game.game_manager import LARGE_BOARD_SIZE, STANDARD_BOARD_SIZE, game_manager
+from game.replay import BattleReplay
+from game.simulation import apply_action
 from utils.battlefield_renderer import BattlefieldRenderer
 from typing import Optional
 
@@ -9,6 +16,60 @@ from typing import Optional
 class Battle(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Replays of battles in progress: thread id -> BattleReplay, kept in step with the log
+        self.replays = {}
+        # Bot searches run here so they never block the event loop. The workers are spawned: forking the
+        # bot once its store and compaction threads run could hand a child a lock held by one of them.
+        self.ai_pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+
+    def cog_unload(self):
+        self.ai_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _end_battle(self, channel_id):
+        """End the finished battle in this thread and drop its replay, which holds the whole log."""
+        self.replays.pop(channel_id, None)
+        return game_manager.end_battle(channel_id)
+
+    async def play_bot_turn(self, channel, game):
+        """Let the bot act while it is its turn in a practice battle, posting what it did."""
+        difficulty = game.bot_difficulty
+        battle = game.battle
+        bot_id = game.defender['id']
+        if difficulty is None or not battle:
+            return
+        loop = asyncio.get_running_loop()
+        while battle.phase != Phase.ENDED and battle.current_player == bot_id:
+            actions = await loop.run_in_executor(self.ai_pool, plan_turn, battle, bot_id, difficulty)
+            if game.battle is not battle:
+                return
+            messages = []
+            result = None
+            for action in actions:
+                result = apply_action(battle, bot_id, action)
+                if not result['success']:
+                    break
+                messages.append(result['message'].split('\n')[0])
+            if not result or not result['success']:
+                # Never leave the player waiting on a bot that cannot move.
+                result = battle.end_turn(bot_id) if battle.phase == Phase.BATTLE else battle.forfeit_battle(bot_id)
+                messages.append(result['message'])
+
+            game_manager.checkpoint(channel.id)
+            if result.get('battle_ended'):
+                winner_user = game.aggressor if result['winner'] == game.aggressor['id'] else game.defender
+                embed = discord.Embed(
+                    title='🏆 Battle Concluded!',
+                    description=f"**{winner_user['name']} has won the battle!**\n\n" + '\n'.join(messages),
+                    color=discord.Color.red() if result['winner'] == game.aggressor['id'] else discord.Color.blue()
+                )
+                self._end_battle(channel.id)
+            else:
+                embed = discord.Embed(title=f"{game.defender['name']} acted", description='\n'.join(messages))
+
+            renderer = BattlefieldRenderer(battle.board)
+            image = renderer.render_board()
+            embed.set_image(url="attachment://battlefield.png")
+            await channel.send(embed=embed, file=discord.File(image, filename="battlefield.png"))
 
     @app_commands.command(name="battle_create_thread", description="Create a new battle thread.")
     @app_commands.describe(
@@ -58,6 +119,7 @@ class Battle(commands.Cog):
         # Create initial armies for both players
         game.add_army(interaction.user.id)
         game.add_army(opponent.id)
+        game_manager.checkpoint(thread.id)
 
         embed = discord.Embed(
             title="⚔️ Battle Thread Created!",
@@ -87,16 +149,81 @@ class Battle(commands.Cog):
         )
         await thread.send(embed=embed)
 
+    @app_commands.command(name="battle_practice", description="Create a practice battle thread against the bot.")
+    @app_commands.describe(difficulty="How strong the bot should play")
+    @app_commands.choices(difficulty=[
+        app_commands.Choice(name=name.capitalize(), value=name) for name in DIFFICULTIES
+    ])
+    async def battle_practice(self, interaction: discord.Interaction, difficulty: str = "normal"):
+        bot_user = self.bot.user
+        thread = await interaction.channel.create_thread(  # type: ignore[reportCallIssue]
+            name=f"Practice: {interaction.user.display_name} vs Bot ({difficulty})",
+            type=discord.ChannelType.public_thread  # type: ignore[reportCallIssue]
+        )
+        await thread.add_user(interaction.user)
+
+        aggressor = {'id': interaction.user.id, 'name': interaction.user.display_name}
+        defender = {'id': bot_user.id, 'name': f"{bot_user.display_name} ({difficulty})"}
+        game = game_manager.create_game(thread.id, aggressor, defender)
+        if not game:
+            await thread.delete()
+            return await interaction.response.send_message(
+                "Failed to create practice thread. A game might already exist.",
+                ephemeral=True
+            )
+        game.bot_difficulty = difficulty
+        # The bot always fields a fresh starter army
+        bot_army = game_manager.add_global_army(bot_user.id)
+        game_manager.checkpoint(thread.id)
+
+        embed = discord.Embed(
+            title="🤖 Practice Battle Created!",
+            description=(
+                f"**{interaction.user.display_name}** is practicing against the bot on **{difficulty}**.\n\n"
+                f"• Use `/army_view` to see your armies\n"
+                f"• Use `/battle_start` with your army ID and defender army **{bot_army['id']}** to begin\n"
+                f"• The bot places and moves its units after each of your actions"
+            ),
+            color=discord.Color.green()
+        )
+        await interaction.response.send_message(
+            f"Practice thread created: {thread.mention}",
+            ephemeral=True
+        )
+        await thread.send(embed=embed)
+
+    @app_commands.command(name="battle_join", description="Join this war as an ally with one of your armies.")
+    @app_commands.describe(side="The side you fight for", army="ID of the army you bring")
+    @app_commands.choices(side=[
+        app_commands.Choice(name="Aggressor", value="aggressor"),
+        app_commands.Choice(name="Defender", value="defender")
+    ])
+    async def battle_join(self, interaction: discord.Interaction, side: str, army: int):
+        game = game_manager.get_game(interaction.channel_id)
+        if not game:
+            return await interaction.response.send_message(
+                "This command can only be used inside a battle thread.",
+                ephemeral=True
+            )
+        side_id = game.aggressor['id'] if side == "aggressor" else game.defender['id']
+        result = game.join_war(interaction.user.id, side_id, army)
+        if not result['success']:
+            return await interaction.response.send_message(result['message'], ephemeral=True)
+        game_manager.checkpoint(interaction.channel_id)
+        await interaction.response.send_message(result['message'])
+
     @app_commands.command(name="battle_start", description="Start a battle between your armies.")
     @app_commands.describe(
-        aggressor_army="ID of the aggressor's army",
-        defender_army="ID of the defender's army"
+        aggressor_army="ID of the aggressor's army, or several separated by commas (e.g. 1,3)",
+        defender_army="ID of the defender's army, or several separated by commas",
+        size="Battlefield width and height in tiles (9 is the standard field, up to 64 for large battles)"
     )
     async def battle_start(
         self,
         interaction: discord.Interaction,
-        aggressor_army: int,
-        defender_army: int
+        aggressor_army: str,
+        defender_army: str,
+        size: app_commands.Range[int, STANDARD_BOARD_SIZE, LARGE_BOARD_SIZE] = STANDARD_BOARD_SIZE
     ):
         game = game_manager.get_game(interaction.channel_id)
         if not game:
@@ -111,9 +238,18 @@ class Battle(commands.Cog):
                 ephemeral=True
             )
 
-        result = game.start_battle(aggressor_army, defender_army)
+        try:
+            aggressor_armies = [int(part) for part in aggressor_army.split(',')]
+            defender_armies = [int(part) for part in defender_army.split(',')]
+        except ValueError:
+            return await interaction.response.send_message(
+                "Army IDs must be numbers separated by commas.",
+                ephemeral=True
+            )
+        result = game.start_battle(aggressor_armies, defender_armies, size)
         if not result['success']:
             return await interaction.response.send_message(result['message'], ephemeral=True)
+        game_manager.checkpoint(interaction.channel_id)
 
         renderer = BattlefieldRenderer(game.battle.board)
         image = renderer.render_board()
@@ -132,6 +268,7 @@ class Battle(commands.Cog):
             embed=embed,
             file=discord.File(image, filename="battlefield.png")
         )
+        await self.play_bot_turn(interaction.channel, game)
 
     @app_commands.command(name="battle_place", description="Place a unit on the battlefield.")
     @app_commands.describe(
@@ -174,6 +311,7 @@ class Battle(commands.Cog):
         )
         if not result['success']:
             return await interaction.response.send_message(result['message'], ephemeral=True)
+        game_manager.checkpoint(interaction.channel_id)
 
         renderer = BattlefieldRenderer(game.battle.board)
         image = renderer.render_board()
@@ -188,6 +326,7 @@ class Battle(commands.Cog):
             embed=embed,
             file=discord.File(image, filename="battlefield.png")
         )
+        await self.play_bot_turn(interaction.channel, game)
 
     @app_commands.command(name="battle_action", description="Perform a battle action.")
     @app_commands.describe(
@@ -238,6 +377,7 @@ class Battle(commands.Cog):
                 result['message'] if result else "Invalid action.",
                 ephemeral=True
             )
+        game_manager.checkpoint(interaction.channel_id)
 
         if result.get('battle_ended'):
             winner_user = (
@@ -256,7 +396,7 @@ class Battle(commands.Cog):
                     else discord.Color.blue()
                 )
             )
-            game_manager.end_battle(interaction.channel_id)
+            self._end_battle(interaction.channel_id)
         else:
             embed = discord.Embed(
                 title="Action Taken!",
@@ -271,6 +411,68 @@ class Battle(commands.Cog):
             embed=embed,
             file=discord.File(image, filename="battlefield.png")
         )
+        await self.play_bot_turn(interaction.channel, game)
+
+    @app_commands.command(name="battle_undo", description="Take back your last move or turn this turn.")
+    async def battle_undo(self, interaction: discord.Interaction):
+        game = game_manager.get_game(interaction.channel_id)
+        if not game or not game.battle:
+            return await interaction.response.send_message(
+                "There is no battle in progress.",
+                ephemeral=True
+            )
+
+        result = game.battle.undo(interaction.user.id)
+        if not result['success']:
+            return await interaction.response.send_message(result['message'], ephemeral=True)
+        game_manager.checkpoint(interaction.channel_id)
+
+        renderer = BattlefieldRenderer(game.battle.board)
+        image = renderer.render_board()
+
+        embed = discord.Embed(
+            title="Action Undone",
+            description=result['message']
+        )
+        embed.set_image(url="attachment://battlefield.png")
+
+        await interaction.response.send_message(
+            embed=embed,
+            file=discord.File(image, filename="battlefield.png")
+        )
+
+    @app_commands.command(name="battle_replay", description="Show the battlefield as it was at the start of a turn.")
+    @app_commands.describe(turn="Turn number (0 is the placement phase)")
+    async def battle_replay(self, interaction: discord.Interaction, turn: int):
+        game = game_manager.get_game(interaction.channel_id)
+        if not game or not game.battle:
+            return await interaction.response.send_message(
+                "There is no battle in progress.",
+                ephemeral=True
+            )
+
+        replay = self.replays.get(interaction.channel_id)
+        if replay is None or replay.log is not game.battle.log:
+            replay = self.replays[interaction.channel_id] = BattleReplay.from_battle(game.battle)
+        replay.sync()
+        try:
+            state = replay.position_at_turn(turn)
+        except IndexError as e:
+            return await interaction.response.send_message(str(e), ephemeral=True)
+
+        renderer = BattlefieldRenderer(state.to_board())
+        image = renderer.render_board()
+
+        embed = discord.Embed(
+            title=f"Replay: Turn {turn}",
+            description=f"Phase: {state.phase.value} ({replay.turns} turns played so far)"
+        )
+        embed.set_image(url="attachment://battlefield.png")
+
+        await interaction.response.send_message(
+            embed=embed,
+            file=discord.File(image, filename="battlefield.png")
+        )
 
     @app_commands.command(name="battle_forfeit", description="Forfeit the current battle.")
     async def battle_forfeit(self, interaction: discord.Interaction):
@@ -284,8 +486,9 @@ class Battle(commands.Cog):
         result = game.battle.forfeit_battle(interaction.user.id)
         if not result['success']:
             return await interaction.response.send_message(result['message'], ephemeral=True)
+        game_manager.checkpoint(interaction.channel_id)
 
-        game_manager.end_battle(interaction.channel_id)
+        self._end_battle(interaction.channel_id)
         # lock the thread to prevent further messages
         try:
             await interaction.channel.edit(locked=True)  # type: ignore
@@ -0,0 +1,335 @@
+"""Computer opponent for battles.
+
+``AIPlayer`` picks one action at a time with iterative-deepening alpha-beta
+search over single actions (a move, a turn or ending the turn) under a hard
+time budget. Lines are explored in place with ``Battle.unmake``. Positions are shared through a bounded LRU transposition
+table keyed by the battle's Zobrist hash.
+
+``plan_turn`` is the entry point for worker processes: it takes a battle,
+plays the bot's side on a private copy until it is no longer the bot's
+turn and returns the actions to replay on the real battle.
+"""
+import copy
+import random
+import time
+from collections import OrderedDict
+
+from game.attacks import resolve_attacks
+from game.board import DIRECTION_DELTAS
+from game.enums import Phase, UnitStatus, UnitType
+from game.movegen import reach_tables
+from game.simulation import apply_action, deployment_tiles
+from game.units import UNIT_SPECS
+from game.zobrist import acted_key
+
+DIFFICULTIES = {
+    # time_budget is seconds per action; noise is random jitter added to root scores
+    'easy': {"time_budget": 0.1, "max_depth": 1, "tt_size": 20_000, "noise": 1.0},
+    'normal': {"time_budget": 0.5, "max_depth": 3, "tt_size": 100_000, "noise": 0.1},
+    'hard': {"time_budget": 2.0, "max_depth": 8, "tt_size": 400_000, "noise": 0.0},
+}
+
+UNIT_VALUES = {
+    UnitType.INFANTRY: 1.0,
+    UnitType.SHOCK: 1.5,
+    UnitType.ARCHER: 1.0,
+    UnitType.COMMANDER: 5.0,
+    UnitType.CAVALRY: 2.0,
+    UnitType.CHARIOT: 2.5,
+}
+
+WIN = 1000.0
+
+# Transposition table bound types
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class _Timeout(Exception):
+    pass
+
+
+class TranspositionTable:
+    """Bounded map from position key to (depth, value, bound, best action).
+
+    Holds at most ``max_entries`` positions and evicts the least recently
+    used one when full. A stored entry is only replaced by a search that
+    went at least as deep.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, depth, value, bound, action):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            if entry[0] > depth:
+                return
+        self._entries[key] = (depth, value, bound, action)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def threatened_tiles(battle, player_id):
+    """Tiles the player's attackers could strike next turn by moving or by turning in place."""
+    tiles = set()
+    board = battle.board
+    for x, y in battle.positions.get(player_id, ()):
+        unit = board.get(x, y)
+        spec = UNIT_SPECS[unit['type']]
+        if spec.range:
+            # Archers shoot along each ray they could turn to face, up to the first unit.
+            for ray in reach_tables(board.width, board.height).rays(y * board.width + x):
+                for cell in ray[:spec.range]:
+                    ty, tx = divmod(cell, board.width)
+                    tiles.add((tx, ty))
+                    if board.get(tx, ty):
+                        break
+            continue
+        if not spec.can_attack:
+            continue
+        dx, dy = DIRECTION_DELTAS[unit['orientation']]
+        for tx, ty in battle.reachable_tiles(x, y):
+            tiles.add((tx + dx, ty + dy))
+        for dx, dy in DIRECTION_DELTAS.values():
+            tiles.add((x + dx, y + dy))
+    return tiles
+
+
+def evaluate(battle, player_id):
+    """Score the position for ``player_id``: material, pending attacks and pressure on the enemy commander."""
+    if battle.phase == Phase.ENDED:
+        return WIN if battle.winner == player_id else -WIN
+    # Attacks resolve when the current turn ends, so count them as (almost) done.
+    destroyed, damaged = resolve_attacks(battle.board)
+    destroyed, damaged = set(destroyed), set(damaged)
+    targets = {}
+    for owner in (battle.aggressor_id, battle.defender_id):
+        targets[owner] = battle.commander_position(owner)
+    # Whoever moves after this turn ends can strike the tiles its units reach or turn to face.
+    waiting = battle.defender_id if battle.current_player == battle.aggressor_id else battle.aggressor_id
+    threatened = threatened_tiles(battle, waiting)
+
+    score = 0.0
+    for x, y, unit in battle.board.units():
+        own = unit['owner'] == player_id
+        value = UNIT_VALUES[unit['type']]
+        if (x, y) in destroyed:
+            value *= 0.2
+            if unit['type'] == UnitType.COMMANDER:
+                value -= WIN / 2
+        else:
+            if unit['status'] == UnitStatus.DAMAGED or (x, y) in damaged:
+                value *= 0.6
+            if unit['owner'] != waiting and (x, y) in threatened:
+                value *= 0.5 if unit['type'] != UnitType.COMMANDER else 0.1
+        spec = UNIT_SPECS[unit['type']]
+        enemy = battle.defender_id if unit['owner'] == battle.aggressor_id else battle.aggressor_id
+        target = targets.get(enemy)
+        if target and spec.can_attack and unit['type'] != UnitType.COMMANDER:
+            value += 0.02 * (16 - abs(target[0] - x) - abs(target[1] - y))
+        score += value if own else -value
+    return score
+
+
+class AIPlayer:
+    """Plays one side of a battle at the given difficulty."""
+
+    def __init__(self, player_id, difficulty='normal', seed=None):
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"Unknown difficulty '{difficulty}'. Choose from: {', '.join(DIFFICULTIES)}.")
+        self.player_id = player_id
+        self.difficulty = difficulty
+        settings = DIFFICULTIES[difficulty]
+        self.time_budget = settings['time_budget']
+        self.max_depth = settings['max_depth']
+        self.noise = settings['noise']
+        self.table = TranspositionTable(settings['tt_size'])
+        self.rng = random.Random(seed)
+        self.nodes = 0
+        self.depth_reached = 0
+        self._deadline = None
+
+    def choose_action(self, battle):
+        """Return the next action tuple for this player, or None if it is not their turn."""
+        if battle.current_player != self.player_id:
+            return None
+        if battle.phase == Phase.PLACEMENT:
+            return self._placement(battle)
+        if battle.phase != Phase.BATTLE:
+            return None
+
+        self._deadline = time.perf_counter() + self.time_budget
+        self.nodes = 0
+        self.depth_reached = 0
+        actions = self._actions(battle)
+        best = actions[0]
+        scores = {}
+        for depth in range(1, self.max_depth + 1):
+            try:
+                best, scores = self._search_root(battle, actions, depth)
+            except _Timeout:
+                break
+            self.depth_reached = depth
+            if abs(scores[best]) >= WIN / 2:
+                break
+            # Search the best lines first next time round.
+            actions.sort(key=scores.get, reverse=True)
+        return best
+
+    def _placement(self, battle):
+        remaining = battle.remaining_units[self.player_id]
+        unit_type = UnitType.COMMANDER if remaining.get(UnitType.COMMANDER) else \
+            max((t for t, n in remaining.items() if n > 0), key=lambda t: (remaining[t], t.value))
+        aggressor = self.player_id == battle.aggressor_id
+        first_row, last_row = battle.deployment_zones[self.player_id]
+        back, front = (last_row, first_row) if aggressor else (first_row, last_row)
+        rows = (back, front) if unit_type == UnitType.COMMANDER else (front, back)
+        centre = (battle.board.width - 1) / 2
+        tiles = deployment_tiles(battle, self.player_id)
+        x, y = min(tiles, key=lambda t: (rows.index(t[1]) if t[1] in rows else 2, abs(t[0] - centre), t[0]))
+        return ('place', unit_type.value, x, y, 'north' if aggressor else 'south')
+
+    def _actions(self, battle):
+        actions = []
+        for action in battle.legal_actions():
+            if action[0] == 'turn':
+                spec = UNIT_SPECS[battle.board.get(action[1], action[2])['type']]
+                # Facing only matters for units that attack.
+                if not (spec.can_attack or spec.range):
+                    continue
+            actions.append(action)
+        actions.append(('end_turn',))
+        return actions
+
+    def _key(self, battle):
+        key = battle.zobrist
+        width, height = battle.board.width, battle.board.height
+        for x, y in battle.positions.get(battle.current_player, ()):
+            if battle.board.get(x, y)['has_acted']:
+                key ^= acted_key(width, height, y * width + x)
+        return key
+
+    def _value_after(self, battle, action, depth, alpha, beta):
+        # Play the action, search the resulting position and take it back again.
+        result = apply_action(battle, battle.current_player, action)
+        if not result['success']:
+            raise ValueError(f"Search produced an illegal action {action!r}: {result['message']}")
+        try:
+            return self._search(battle, depth, alpha, beta)
+        finally:
+            battle.unmake()
+
+    def _search_root(self, battle, actions, depth):
+        alpha, beta = -float('inf'), float('inf')
+        scores = {}
+        best, best_score = actions[0], -float('inf')
+        for action in actions:
+            value = self._value_after(battle, action, depth - 1, alpha, beta)
+            scores[action] = value
+            noisy = value + self.rng.uniform(-self.noise, self.noise) if self.noise else value
+            if noisy > best_score:
+                best, best_score = action, noisy
+            # Alpha follows the real scores, kept 2 * noise below the best: a move scoring less cannot win
+            # the noisy comparison, and every move that can gets an exact score rather than a bound.
+            alpha = max(alpha, value - 2 * self.noise)
+        # The best real score is exact: the first move is searched with an open window, later ones only
+        # beat it with a score above alpha.
+        self.table.put(self._key(battle), depth, max(scores.values()), EXACT, best)
+        return best, scores
+
+    def _search(self, battle, depth, alpha, beta):
+        self.nodes += 1
+        if time.perf_counter() > self._deadline:
+            raise _Timeout()
+        if depth == 0 or battle.phase != Phase.BATTLE:
+            return evaluate(battle, self.player_id)
+
+        key = self._key(battle)
+        entry = self.table.get(key)
+        hint = None
+        if entry is not None:
+            entry_depth, value, bound, hint = entry
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return value
+                if bound == LOWER:
+                    alpha = max(alpha, value)
+                elif bound == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        actions = self._actions(battle)
+        if hint in actions:
+            actions.remove(hint)
+            actions.insert(0, hint)
+
+        # Scores are always from this player's point of view: maximise on our turn, minimise on theirs.
+        maximising = battle.current_player == self.player_id
+        alpha_start, beta_start = alpha, beta
+        best_action = None
+        best = -float('inf') if maximising else float('inf')
+        for action in actions:
+            value = self._value_after(battle, action, depth - 1, alpha, beta)
+            if maximising:
+                if value > best:
+                    best, best_action = value, action
+                alpha = max(alpha, value)
+            else:
+                if value < best:
+                    best, best_action = value, action
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        if best <= alpha_start:
+            bound = UPPER
+        elif best >= beta_start:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.put(key, depth, best, bound, best_action)
+        return best
+
+
+# AI players kept alive per worker process so their transposition tables are reused between turns.
+_PLAYERS = {}
+
+
+def plan_turn(battle, player_id, difficulty='normal', seed=None):
+    """Return the actions ``player_id`` takes until it is no longer their turn.
+
+    Works on a copy, so ``battle`` is left untouched; replay the result with
+    ``game.simulation.apply_action``.
+    """
+    player = _PLAYERS.get((player_id, difficulty))
+    if player is None:
+        player = _PLAYERS[(player_id, difficulty)] = AIPlayer(player_id, difficulty, seed)
+    battle = copy.deepcopy(battle)
+    planned = []
+    # A turn never takes more actions than the player has units, plus ending it.
+    for _ in range(battle.total_unit_count + 1):
+        action = player.choose_action(battle)
+        if action is None:
+            break
+        result = apply_action(battle, player_id, action)
+        if not result['success']:
+            break
+        planned.append(action)
+        if action[0] == 'end_turn':
+            break
+    return planned
@@ -0,0 +1,165 @@
+from game.board import DIRECTION_DELTAS
+from game.enums import Orientation, UnitStatus
+from game.units import ATTACKERS, IMMUNE_AGAINST, RANGED, UNIT_SPECS
+
+# Geometry masks per (width, height, lane), built on first use.
+_GEOMETRY = {}
+
+
+def _geometry(width, height, lane):
+    """Return (all cells, column 0, last column) masks for a board shape."""
+    key = (width, height, lane)
+    geometry = _GEOMETRY.get(key)
+    if geometry is None:
+        full = col_first = col_last = 0
+        for y in range(height):
+            row = y * width
+            col_first |= 1 << (row * lane)
+            col_last |= 1 << ((row + width - 1) * lane)
+            for x in range(width):
+                full |= 1 << ((row + x) * lane)
+        geometry = (full, col_first, col_last)
+        _GEOMETRY[key] = geometry
+    return geometry
+
+
+def shift(mask, orientation, width, height, lane):
+    """Move every cell in ``mask`` one tile in ``orientation``, dropping cells that leave the board."""
+    full, col_first, col_last = _geometry(width, height, lane)
+    if orientation == Orientation.NORTH:
+        return mask >> (width * lane)
+    if orientation == Orientation.SOUTH:
+        return (mask << (width * lane)) & full
+    if orientation == Orientation.EAST:
+        return (mask << lane) & full & ~col_first
+    return (mask >> lane) & ~col_last
+
+
+def cells(mask, width, lane):
+    """Yield (x, y) for every cell set in ``mask``, in row-major order."""
+    while mask:
+        low = mask & -mask
+        y, x = divmod((low.bit_length() - 1) // lane, width)
+        yield x, y
+        mask ^= low
+
+
+def ranged_hits(source, orientation, occupied, width, height, lane, reach):
+    """Cells hit by the ranged units in ``source`` shooting ``orientation``.
+
+    Each shot travels up to ``reach`` tiles and stops at the first occupied
+    tile, which is the one it hits. All shooters advance together, one mask
+    shift per tile of range, so the cost does not grow with their number.
+    """
+    hits = 0
+    for _ in range(reach):
+        source = shift(source, orientation, width, height, lane)
+        hits |= source & occupied
+        source &= ~occupied
+        if not source:
+            break
+    return hits
+
+
+def resolve_attacks(board):
+    """Resolve every melee and ranged attack on the board at once.
+
+    Each unit that can attack hits the tile it faces, and each ranged unit
+    hits the first unit within its range in the direction it faces (any unit
+    in between blocks the shot). Enemies hit are destroyed unless they are
+    immune to the attacker's type, in which case they become DAMAGED, and a
+    unit that is already damaged (or is hit by two such attackers in the same
+    resolution) is destroyed.
+
+    Attacks are computed per orientation and attacker type by shifting the
+    attacker mask and intersecting it with the enemy mask, so the work does
+    not depend on how many units are on the board.
+
+    Sparse boards are resolved unit by unit instead (see
+    ``resolve_attacks_by_unit``), since their masks would span the whole
+    board area however few units it holds.
+
+    Returns (destroyed, damaged) lists of (x, y) in row-major order.
+    """
+    if board.kind == 'sparse':
+        return resolve_attacks_by_unit(board)
+    masks = board.masks()
+    width, height, lane = masks.width, masks.height, masks.lane
+
+    types = masks.types
+    attackers = [t for t in ATTACKERS if types.get(t)]
+    shooters = [t for t in RANGED if types.get(t)]
+    # For each attacker type, the cells holding units that are immune to it.
+    immune_targets = {}
+    for attacker_type in attackers + shooters:
+        mask = 0
+        for target_type in IMMUNE_AGAINST[attacker_type]:
+            mask |= types.get(target_type, 0)
+        immune_targets[attacker_type] = mask
+
+    destroyed = hit_once = hit_twice = 0
+    for owner_mask in masks.owners.values():
+        enemies = masks.occupied & ~owner_mask
+        for orientation, orientation_mask in masks.orientations.items():
+            facing = owner_mask & orientation_mask
+            if not facing:
+                continue
+            for attacker_type in attackers + shooters:
+                source = facing & types[attacker_type]
+                if not source:
+                    continue
+                if attacker_type in shooters:
+                    hits = ranged_hits(source, orientation, masks.occupied, width, height, lane,
+                                       UNIT_SPECS[attacker_type].range) & enemies
+                else:
+                    hits = shift(source, orientation, width, height, lane) & enemies
+                if not hits:
+                    continue
+                immune = hits & immune_targets[attacker_type]
+                destroyed |= hits & ~immune
+                # Only the nearest unit behind a target can reach it from one direction, so each
+                # orientation hits a target at most once.
+                hit_twice |= hit_once & immune
+                hit_once |= immune
+
+    destroyed |= hit_twice | (hit_once & masks.damaged)
+    damaged = hit_once & ~destroyed & ~masks.damaged
+    return list(cells(destroyed, width, lane)), list(cells(damaged, width, lane))
+
+
+def resolve_attacks_by_unit(board):
+    """``resolve_attacks`` with one lookup per attacker, for boards where units are few and tiles many.
+
+    Each melee attacker checks the tile it faces and each ranged unit walks
+    its line of sight up to its range, so the work grows with the number of
+    units, not the board area. The rules and result are the same.
+    """
+    width, height = board.width, board.height
+    destroyed, immune_hits = set(), {}
+    for x, y, unit in board.units():
+        spec = UNIT_SPECS[unit['type']]
+        reach = 1 if spec.can_attack else spec.range
+        dx, dy = DIRECTION_DELTAS[unit['orientation']]
+        tx, ty, target = x, y, None
+        for _ in range(reach):
+            tx, ty = tx + dx, ty + dy
+            if not (0 <= tx < width and 0 <= ty < height):
+                break
+            target = board.get(tx, ty)
+            if target:
+                break
+        if not target or target['owner'] == unit['owner']:
+            continue
+        if target['type'] in IMMUNE_AGAINST[unit['type']]:
+            immune_hits[(tx, ty)] = immune_hits.get((tx, ty), 0) + 1
+        else:
+            destroyed.add((tx, ty))
+
+    damaged = set()
+    for (x, y), hits in immune_hits.items():
+        if hits > 1 or board.get(x, y)['status'] == UnitStatus.DAMAGED:
+            destroyed.add((x, y))
+        elif (x, y) not in destroyed:
+            damaged.add((x, y))
+    row_major = lambda pos: (pos[1], pos[0])
+    return sorted(destroyed, key=row_major), sorted(damaged, key=row_major)
@@ -0,0 +1,299 @@
+"""Structured battle log.
+
+Battles record typed ``LogEvent``s instead of dicts holding pre-formatted
+messages: an event keeps its kind and a tuple of field values, and the
+human-readable message is only rendered when someone reads it. Events still
+behave like the read-only dicts the log used to hold (``event['type']``,
+``event['message']``, ``dict(event)``), so cogs and exports need no changes.
+
+``BattleLog`` can cap how many events it keeps in memory; older events are
+spilled in chunks to an archive (compressed in memory by default) and loaded
+back transparently when read.
+"""
+import pickle
+import zlib
+from bisect import bisect_right
+from collections.abc import Mapping
+
+# Fields of each event kind, in the order Battle records them.
+EVENT_FIELDS = {
+    'place': ('player_id', 'unit_type', 'x', 'y', 'orientation'),
+    'move': ('player_id', 'unit_type', 'from_x', 'from_y', 'to_x', 'to_y'),
+    'turn': ('player_id', 'unit_type', 'x', 'y', 'orientation'),
+    'damage': ('x', 'y'),
+    'destroy': ('x', 'y'),
+    'end_turn': ('player_id',),
+    'end': ('winner',),
+    'forfeit': ('player_id',),
+}
+
+# Messages rendered on demand from an event's fields; kinds without one carry their text.
+MESSAGES = {
+    'place': lambda e: f"Placed {e['unit_type']} at ({e['x']},{e['y']}) facing {e['orientation']}.",
+    'move': lambda e: f"Moved {e['unit_type']} from ({e['from_x']},{e['from_y']}) to ({e['to_x']},{e['to_y']}).",
+    'turn': lambda e: f"Turned {e['unit_type']} at ({e['x']},{e['y']}) to face {e['orientation']}.",
+    'damage': lambda e: f"Unit at ({e['x']},{e['y']}) was damaged during attack resolution.",
+    'destroy': lambda e: f"Unit at ({e['x']},{e['y']}) was destroyed during attack resolution.",
+    'end_turn': lambda e: "Turn ended. Attacks resolved. It is now the other player's turn.",
+}
+
+
+class LogEvent(Mapping):
+    """One log entry: its kind, field values and, if it has no message template, its text."""
+
+    __slots__ = ('kind', 'values', 'text')
+
+    def __init__(self, kind, values, text=None):
+        self.kind = kind
+        self.values = values
+        self.text = text
+
+    @property
+    def fields(self):
+        return EVENT_FIELDS[self.kind]
+
+    @property
+    def message(self):
+        if self.text is not None:
+            return self.text
+        template = MESSAGES.get(self.kind)
+        return template(self) if template else None
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return self.kind
+        if key == 'message':
+            message = self.message
+            if message is None:
+                raise KeyError(key)
+            return message
+        try:
+            return self.values[EVENT_FIELDS[self.kind].index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield 'type'
+        yield from EVENT_FIELDS[self.kind]
+        if self.text is not None or self.kind in MESSAGES:
+            yield 'message'
+
+    def __len__(self):
+        return 1 + len(self.values) + (self.text is not None or self.kind in MESSAGES)
+
+    def __repr__(self):
+        return f"LogEvent({dict(self)!r})"
+
+    def __reduce__(self):
+        return LogEvent, (self.kind, self.values, self.text)
+
+
+def to_event(entry):
+    """Turn a log dict into a LogEvent when it has the fields of a known kind; other dicts are kept as they are."""
+    if isinstance(entry, LogEvent):
+        return entry
+    fields = EVENT_FIELDS.get(entry.get('type'))
+    if fields is None or set(entry) - {'type', 'message'} != set(fields):
+        return entry
+    event = LogEvent(entry['type'], tuple(entry[name] for name in fields))
+    if 'message' in entry and entry['message'] != event.message:
+        event.text = entry['message']
+    elif 'message' not in entry and entry['type'] in MESSAGES:
+        return entry
+    return event
+
+
+class DeferredResult(dict):
+    """An action result dict whose 'message' is only formatted when it is first read.
+
+    Looking up other keys leaves it unformatted; anything that sees the whole
+    dict (iteration, ``items()``, ``len()``, ``==``, ``dict(result)``, JSON
+    dumps) formats it first, so it always sees the same dict.
+    """
+
+    __slots__ = ('_render',)
+
+    def __init__(self, render, **items):
+        super().__init__(items)
+        self._render = render
+
+    def __missing__(self, key):
+        if key != 'message':
+            raise KeyError(key)
+        message = self['message'] = self._render()
+        return message
+
+    def _rendered(self):
+        if not super().__contains__('message'):
+            self['message']
+
+    def __contains__(self, key):
+        return key == 'message' or super().__contains__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        self._rendered()
+        return super().__iter__()
+
+    def __len__(self):
+        self._rendered()
+        return super().__len__()
+
+    def keys(self):
+        self._rendered()
+        return super().keys()
+
+    def values(self):
+        self._rendered()
+        return super().values()
+
+    def items(self):
+        self._rendered()
+        return super().items()
+
+    def copy(self):
+        return dict(self)
+
+    def __eq__(self, other):
+        for result in (self, other):
+            if isinstance(result, DeferredResult):
+                result._rendered()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        for result in (self, other):
+            if isinstance(result, DeferredResult):
+                result._rendered()
+        return super().__ne__(other)
+
+    def __repr__(self):
+        self._rendered()
+        return super().__repr__()
+
+
+class MemoryArchive:
+    """Keeps spilled chunks of events pickled and zlib-compressed in memory."""
+
+    def __init__(self):
+        self._chunks = {}
+        self._next = 0
+
+    def store(self, events):
+        key = self._next
+        self._next += 1
+        self._chunks[key] = zlib.compress(pickle.dumps(events, pickle.HIGHEST_PROTOCOL))
+        return key
+
+    def load(self, key):
+        return pickle.loads(zlib.decompress(self._chunks[key]))
+
+    def discard(self, key):
+        del self._chunks[key]
+
+
+class BattleLog:
+    """Append-only event log with optional spilling of old events to an archive.
+
+    With ``cap`` set, at most ``cap`` events stay in memory; the oldest
+    ``chunk`` events are handed to ``archive`` whenever the cap is exceeded.
+    Indexing, iteration and truncation (``del log[n:]``) work across the
+    archived part as well. ``unsaved`` and ``mark_saved`` track what changed
+    since the log was last saved, so it can be saved incrementally.
+    """
+
+    def __init__(self, cap=None, chunk=256, archive=None):
+        self.cap = cap
+        self.chunk = min(chunk, cap) if cap else chunk
+        self.archive = archive if archive is not None else MemoryArchive()
+        self._events = []
+        # First index of each archived chunk, its archive key and size
+        self._spilled_starts = []
+        self._spilled = []
+        self._offset = 0
+        self._cached = (None, None)
+        # Events before this index are unchanged since mark_saved()
+        self._saved = 0
+
+    def add(self, kind, *values, text=None):
+        """Record and return an event of a known kind; its message is rendered when read."""
+        event = LogEvent(kind, values, text)
+        self._events.append(event)
+        if self.cap and len(self._events) > self.cap:
+            self._spill()
+        return event
+
+    def append(self, entry):
+        self._events.append(to_event(entry))
+        if self.cap and len(self._events) > self.cap:
+            self._spill()
+
+    def unsaved(self):
+        """Return (start, events): the events from the first one added or replaced since ``mark_saved`` on."""
+        return self._saved, self[self._saved:]
+
+    def mark_saved(self):
+        self._saved = len(self)
+
+    def export(self):
+        """Plain dicts with rendered messages, for JSON storage."""
+        return [dict(event) for event in self]
+
+    def _spill(self):
+        events, self._events = self._events[:self.chunk], self._events[self.chunk:]
+        self._spilled_starts.append(self._offset)
+        self._spilled.append((self.archive.store(events), len(events)))
+        self._offset += len(events)
+
+    def _unspill(self):
+        self._spilled_starts.pop()
+        key, count = self._spilled.pop()
+        self._events[:0] = self._load(key)
+        self.archive.discard(key)
+        self._cached = (None, None)
+        self._offset -= count
+
+    def _load(self, key):
+        if self._cached[0] != key:
+            self._cached = (key, self.archive.load(key))
+        return self._cached[1]
+
+    def __len__(self):
+        return self._offset + len(self._events)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index >= self._offset:
+            return self._events[index - self._offset]
+        if index < 0:
+            raise IndexError("log index out of range")
+        slot = bisect_right(self._spilled_starts, index) - 1
+        return self._load(self._spilled[slot][0])[index - self._spilled_starts[slot]]
+
+    def __iter__(self):
+        for key, _ in list(self._spilled):
+            yield from self._load(key)
+        yield from list(self._events)
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None or index.stop is not None:
+            raise TypeError("Only truncation (del log[n:]) is supported.")
+        start = index.start or 0
+        if start < 0:
+            start = max(0, start + len(self))
+        self._saved = min(self._saved, start)
+        while start < self._offset:
+            self._unspill()
+        del self._events[start - self._offset:]
+
+    def __eq__(self, other):
+        if isinstance(other, (BattleLog, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"BattleLog({len(self)} events, {self._offset} archived)"
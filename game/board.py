@@ -0,0 +1,610 @@
+from array import array
+
+from game.enums import Orientation, UnitStatus, UnitType
+
+# Small integer codes used by the compact board backends.
+UNIT_TYPES = tuple(UnitType)
+ORIENTATIONS = tuple(Orientation)
+STATUSES = tuple(UnitStatus)
+UNIT_TYPE_CODES = {t: i for i, t in enumerate(UNIT_TYPES)}
+ORIENTATION_CODES = {o: i for i, o in enumerate(ORIENTATIONS)}
+STATUS_CODES = {s: i for i, s in enumerate(STATUSES)}
+
+# Owner slot 0 marks an empty cell on the compact backends.
+EMPTY = 0
+
+# (dx, dy) of the tile a unit faces; north is towards y = 0.
+DIRECTION_DELTAS = {
+    Orientation.NORTH: (0, -1),
+    Orientation.EAST: (1, 0),
+    Orientation.SOUTH: (0, 1),
+    Orientation.WEST: (-1, 0),
+}
+
+
+class BoardMasks:
+    """Occupancy masks of a board, one bit group ("lane") per cell in row-major order.
+
+    Cell ``i`` is set in a mask when bit ``i * lane`` is set. Compact backends
+    use wider lanes so masks can be built straight from their byte planes.
+    """
+
+    __slots__ = ('width', 'height', 'lane', 'occupied', 'owners', 'types', 'orientations', 'damaged')
+
+    def __init__(self, width, height, lane, occupied, owners, types, orientations, damaged):
+        self.width = width
+        self.height = height
+        self.lane = lane
+        self.occupied = occupied
+        self.owners = owners
+        self.types = types
+        self.orientations = orientations
+        self.damaged = damaged
+
+
+class DictBoard:
+    """The original board: a grid of rows holding one unit dict per occupied tile."""
+
+    kind = 'dict'
+
+    def __init__(self, width=9, height=9):
+        self.width = width
+        self.height = height
+        self.rows = [[None for _ in range(width)] for _ in range(height)]
+
+    def __getitem__(self, y):
+        return self.rows[y]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return self.height
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        return self.rows[y][x]
+
+    def is_occupied(self, x, y):
+        return self.rows[y][x] is not None
+
+    def place(self, x, y, unit_type, owner, orientation, status=UnitStatus.HEALTHY, has_acted=False):
+        self.rows[y][x] = {
+            "type": unit_type,
+            "owner": owner,
+            "orientation": orientation,
+            "has_acted": has_acted,
+            "status": status
+        }
+
+    def remove(self, x, y):
+        unit = self.rows[y][x]
+        self.rows[y][x] = None
+        return unit
+
+    def move(self, from_x, from_y, to_x, to_y):
+        self.rows[to_y][to_x] = self.rows[from_y][from_x]
+        self.rows[from_y][from_x] = None
+
+    def set_orientation(self, x, y, orientation):
+        self.rows[y][x]['orientation'] = orientation
+
+    def set_status(self, x, y, status):
+        self.rows[y][x]['status'] = status
+
+    def set_acted(self, x, y, has_acted):
+        self.rows[y][x]['has_acted'] = has_acted
+
+    def reset_acted(self, owner, positions=None):
+        """Clear the acted flag of the owner's units; ``positions`` limits the work to those tiles."""
+        if positions is not None:
+            for x, y in positions:
+                unit = self.rows[y][x]
+                if unit:
+                    unit['has_acted'] = False
+            return
+        for row in self.rows:
+            for unit in row:
+                if unit and unit['owner'] == owner:
+                    unit['has_acted'] = False
+
+    def count(self, owner, unit_type=None):
+        """Number of units belonging to ``owner``, optionally of one type only."""
+        return sum(1 for _, _, unit in self.units()
+                   if unit['owner'] == owner and (unit_type is None or unit['type'] == unit_type))
+
+    def masks(self):
+        """Build one-bit-per-cell occupancy masks with a single scan of the grid."""
+        occupied = damaged = 0
+        owners, types, orientations = {}, {}, {}
+        for x, y, unit in self.units():
+            bit = 1 << (y * self.width + x)
+            occupied |= bit
+            owners[unit['owner']] = owners.get(unit['owner'], 0) | bit
+            types[unit['type']] = types.get(unit['type'], 0) | bit
+            orientations[unit['orientation']] = orientations.get(unit['orientation'], 0) | bit
+            if unit['status'] == UnitStatus.DAMAGED:
+                damaged |= bit
+        return BoardMasks(self.width, self.height, 1, occupied, owners, types, orientations, damaged)
+
+    def units(self):
+        """Yield (x, y, unit) for every occupied tile in row-major order."""
+        for y, row in enumerate(self.rows):
+            for x, unit in enumerate(row):
+                if unit:
+                    yield x, y, unit
+
+    def units_in(self, x0, y0, x1, y1):
+        """Yield (x, y, unit) for every unit inside the rectangle, corners included, in row-major order."""
+        for y in range(max(0, y0), min(self.height - 1, y1) + 1):
+            row = self.rows[y]
+            for x in range(max(0, x0), min(self.width - 1, x1) + 1):
+                if row[x]:
+                    yield x, y, row[x]
+
+
+class _RowView:
+    """One row of a compact board, shaped like a list of unit dicts."""
+
+    def __init__(self, board, y):
+        self._board = board
+        self._y = y
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self._board.width
+        if not 0 <= x < self._board.width:
+            raise IndexError("board column out of range")
+        return self._board.get(x, self._y)
+
+    def __setitem__(self, x, unit):
+        if unit is None:
+            self._board.remove(x, self._y)
+        else:
+            self._board.place(x, self._y, unit['type'], unit['owner'], unit['orientation'],
+                              unit.get('status', UnitStatus.HEALTHY), unit.get('has_acted', False))
+
+    def __iter__(self):
+        for x in range(self._board.width):
+            yield self._board.get(x, self._y)
+
+    def __len__(self):
+        return self._board.width
+
+
+class _CompactBoard:
+    """Row access and bounds checks shared by the backends that do not keep a grid of rows.
+
+    ``get`` on the array and bitboard backends returns a unit dict built on
+    demand, so mutations must go through the setter methods.
+    """
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.height
+        if not 0 <= y < self.height:
+            raise IndexError("board row out of range")
+        return _RowView(self, y)
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield _RowView(self, y)
+
+    def __len__(self):
+        return self.height
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def units_in(self, x0, y0, x1, y1):
+        """Yield (x, y, unit) for every unit inside the rectangle, corners included, in row-major order."""
+        for y in range(max(0, y0), min(self.height - 1, y1) + 1):
+            for x in range(max(0, x0), min(self.width - 1, x1) + 1):
+                if self.is_occupied(x, y):
+                    yield x, y, self.get(x, y)
+
+
+class ArrayBoard(_CompactBoard):
+    """Compact board backed by flat byte planes, one byte per cell per field.
+
+    Owners are interned into small slots (0 = empty), unit types, orientations
+    and statuses are stored as their index in the enum.
+    """
+
+    kind = 'array'
+
+    def __init__(self, width=9, height=9):
+        self.width = width
+        self.height = height
+        size = width * height
+        self.owner = array('B', bytes(size))
+        self.unit_type = array('B', bytes(size))
+        self.orientation = array('B', bytes(size))
+        self.status = array('B', bytes(size))
+        self.acted = array('B', bytes(size))
+        self._slot_owner = [None]
+        self._owner_slot = {}
+
+    def slot(self, owner):
+        """Return the small integer slot for a player id, registering it on first use."""
+        slot = self._owner_slot.get(owner)
+        if slot is None:
+            slot = len(self._slot_owner)
+            if slot > 255:
+                raise ValueError("ArrayBoard supports at most 255 players.")
+            self._owner_slot[owner] = slot
+            self._slot_owner.append(owner)
+        return slot
+
+    def get(self, x, y):
+        i = y * self.width + x
+        slot = self.owner[i]
+        if slot == EMPTY:
+            return None
+        return {
+            "type": UNIT_TYPES[self.unit_type[i]],
+            "owner": self._slot_owner[slot],
+            "orientation": ORIENTATIONS[self.orientation[i]],
+            "has_acted": bool(self.acted[i]),
+            "status": STATUSES[self.status[i]]
+        }
+
+    def is_occupied(self, x, y):
+        return self.owner[y * self.width + x] != EMPTY
+
+    def place(self, x, y, unit_type, owner, orientation, status=UnitStatus.HEALTHY, has_acted=False):
+        i = y * self.width + x
+        self.owner[i] = self.slot(owner)
+        self.unit_type[i] = UNIT_TYPE_CODES[unit_type]
+        self.orientation[i] = ORIENTATION_CODES[orientation]
+        self.status[i] = STATUS_CODES[status]
+        self.acted[i] = 1 if has_acted else 0
+
+    def remove(self, x, y):
+        unit = self.get(x, y)
+        i = y * self.width + x
+        self.owner[i] = EMPTY
+        self.unit_type[i] = self.orientation[i] = self.status[i] = self.acted[i] = 0
+        return unit
+
+    def move(self, from_x, from_y, to_x, to_y):
+        src = from_y * self.width + from_x
+        dst = to_y * self.width + to_x
+        for plane in (self.owner, self.unit_type, self.orientation, self.status, self.acted):
+            plane[dst] = plane[src]
+            plane[src] = 0
+
+    def set_orientation(self, x, y, orientation):
+        self.orientation[y * self.width + x] = ORIENTATION_CODES[orientation]
+
+    def set_status(self, x, y, status):
+        self.status[y * self.width + x] = STATUS_CODES[status]
+
+    def set_acted(self, x, y, has_acted):
+        self.acted[y * self.width + x] = 1 if has_acted else 0
+
+    def reset_acted(self, owner, positions=None):
+        slot = self._owner_slot.get(owner)
+        if slot is None:
+            return
+        # Clear the flag for every cell of this owner in one pass over the planes:
+        # translate the owner plane into a keep-mask and AND it with the flags.
+        keep = self.owner.tobytes().translate(_keep_table(slot))
+        flags = int.from_bytes(self.acted.tobytes(), 'little') & int.from_bytes(keep, 'little')
+        self.acted = array('B', flags.to_bytes(len(self.acted), 'little'))
+
+    def count(self, owner, unit_type=None):
+        """Number of units belonging to ``owner``, optionally of one type only."""
+        slot = self._owner_slot.get(owner)
+        if slot is None:
+            return 0
+        if unit_type is None:
+            return self.owner.count(slot)
+        mask = _lane_mask(self.owner, _eq_table(slot)) & _lane_mask(self.unit_type, _eq_table(UNIT_TYPE_CODES[unit_type]))
+        return popcount(mask)
+
+    def masks(self):
+        """Build occupancy masks with one byte lane per cell, straight from the planes."""
+        occupied = _lane_mask(self.owner, _NONZERO_TABLE)
+        owners = {}
+        for slot in range(1, len(self._slot_owner)):
+            mask = _lane_mask(self.owner, _eq_table(slot))
+            if mask:
+                owners[self._slot_owner[slot]] = mask
+        # Empty cells hold code 0 in every plane, so mask those out with `occupied`.
+        types = {t: _lane_mask(self.unit_type, _eq_table(c)) & occupied for t, c in UNIT_TYPE_CODES.items()}
+        orientations = {o: _lane_mask(self.orientation, _eq_table(c)) & occupied for o, c in ORIENTATION_CODES.items()}
+        damaged = _lane_mask(self.status, _eq_table(STATUS_CODES[UnitStatus.DAMAGED])) & occupied
+        return BoardMasks(self.width, self.height, 8, occupied, owners, types, orientations, damaged)
+
+    def units(self):
+        """Yield (x, y, unit) for every occupied tile in row-major order."""
+        owner = self.owner
+        width = self.width
+        for i in range(len(owner)):
+            if owner[i] != EMPTY:
+                y, x = divmod(i, width)
+                yield x, y, self.get(x, y)
+
+
+class BitBoard(_CompactBoard):
+    """Board kept entirely as bitboards: one int per player, unit type, orientation and flag.
+
+    Cell ``(x, y)`` is bit ``y * width + x``. The masks are updated on every
+    mutation, so attack resolution and unit counts never walk the board.
+    """
+
+    kind = 'bitboard'
+
+    def __init__(self, width=9, height=9):
+        self.width = width
+        self.height = height
+        self.occupied = 0
+        self.owners = {}
+        self.types = {t: 0 for t in UnitType}
+        self.orientations = {o: 0 for o in Orientation}
+        self.statuses = {s: 0 for s in UnitStatus if s != UnitStatus.HEALTHY}
+        self.acted = 0
+
+    def get(self, x, y):
+        bit = 1 << (y * self.width + x)
+        if not self.occupied & bit:
+            return None
+        return {
+            "type": next(t for t, mask in self.types.items() if mask & bit),
+            "owner": next(o for o, mask in self.owners.items() if mask & bit),
+            "orientation": next(o for o, mask in self.orientations.items() if mask & bit),
+            "has_acted": bool(self.acted & bit),
+            "status": next((s for s, mask in self.statuses.items() if mask & bit), UnitStatus.HEALTHY)
+        }
+
+    def is_occupied(self, x, y):
+        return bool(self.occupied >> (y * self.width + x) & 1)
+
+    def place(self, x, y, unit_type, owner, orientation, status=UnitStatus.HEALTHY, has_acted=False):
+        if self.is_occupied(x, y):
+            self.remove(x, y)
+        bit = 1 << (y * self.width + x)
+        self.occupied |= bit
+        self.owners[owner] = self.owners.get(owner, 0) | bit
+        self.types[unit_type] |= bit
+        self.orientations[orientation] |= bit
+        if status != UnitStatus.HEALTHY:
+            self.statuses[status] |= bit
+        if has_acted:
+            self.acted |= bit
+
+    def remove(self, x, y):
+        unit = self.get(x, y)
+        if unit:
+            keep = ~(1 << (y * self.width + x))
+            self.occupied &= keep
+            self.owners[unit['owner']] &= keep
+            self.types[unit['type']] &= keep
+            self.orientations[unit['orientation']] &= keep
+            for status in self.statuses:
+                self.statuses[status] &= keep
+            self.acted &= keep
+        return unit
+
+    def move(self, from_x, from_y, to_x, to_y):
+        unit = self.remove(from_x, from_y)
+        self.place(to_x, to_y, unit['type'], unit['owner'], unit['orientation'], unit['status'], unit['has_acted'])
+
+    def set_orientation(self, x, y, orientation):
+        bit = 1 << (y * self.width + x)
+        for o in self.orientations:
+            self.orientations[o] &= ~bit
+        self.orientations[orientation] |= bit
+
+    def set_status(self, x, y, status):
+        bit = 1 << (y * self.width + x)
+        for s in self.statuses:
+            self.statuses[s] &= ~bit
+        if status != UnitStatus.HEALTHY:
+            self.statuses[status] |= bit
+
+    def set_acted(self, x, y, has_acted):
+        bit = 1 << (y * self.width + x)
+        self.acted = self.acted | bit if has_acted else self.acted & ~bit
+
+    def reset_acted(self, owner, positions=None):
+        self.acted &= ~self.owners.get(owner, 0)
+
+    def count(self, owner, unit_type=None):
+        """Number of units belonging to ``owner``, optionally of one type only."""
+        mask = self.owners.get(owner, 0)
+        if unit_type is not None:
+            mask &= self.types[unit_type]
+        return popcount(mask)
+
+    def masks(self):
+        """Return the live masks; ints are immutable, so only the dicts are copied."""
+        return BoardMasks(self.width, self.height, 1, self.occupied, dict(self.owners), dict(self.types),
+                          dict(self.orientations), self.statuses[UnitStatus.DAMAGED])
+
+    def units(self):
+        """Yield (x, y, unit) for every occupied tile in row-major order."""
+        mask = self.occupied
+        while mask:
+            low = mask & -mask
+            y, x = divmod(low.bit_length() - 1, self.width)
+            yield x, y, self.get(x, y)
+            mask ^= low
+
+
+class SparseBoard(_CompactBoard):
+    """Board for large maps: unit dicts keyed by cell index, plus a spatial hash of the occupied cells.
+
+    Nothing is stored for empty tiles, so memory and full scans (``units``,
+    ``count``, ``masks``) scale with the number of units rather than the
+    board area. The spatial hash groups cells into ``BUCKET``-by-``BUCKET``
+    squares so ``units_in`` only visits the squares a rectangle overlaps.
+    Like DictBoard, ``get`` returns the live unit dict.
+    """
+
+    kind = 'sparse'
+    BUCKET_SHIFT = 3
+    BUCKET = 1 << BUCKET_SHIFT
+
+    def __init__(self, width=9, height=9):
+        self.width = width
+        self.height = height
+        self.cells = {}
+        # (x >> BUCKET_SHIFT, y >> BUCKET_SHIFT) -> occupied cell indexes in that square
+        self.buckets = {}
+
+    def _bucket(self, cell):
+        y, x = divmod(cell, self.width)
+        return x >> self.BUCKET_SHIFT, y >> self.BUCKET_SHIFT
+
+    def get(self, x, y):
+        return self.cells.get(y * self.width + x)
+
+    def is_occupied(self, x, y):
+        return y * self.width + x in self.cells
+
+    def place(self, x, y, unit_type, owner, orientation, status=UnitStatus.HEALTHY, has_acted=False):
+        cell = y * self.width + x
+        self.cells[cell] = {
+            "type": unit_type,
+            "owner": owner,
+            "orientation": orientation,
+            "has_acted": has_acted,
+            "status": status
+        }
+        self.buckets.setdefault(self._bucket(cell), set()).add(cell)
+
+    def remove(self, x, y):
+        cell = y * self.width + x
+        unit = self.cells.pop(cell, None)
+        if unit:
+            self._unbucket(cell)
+        return unit
+
+    def _unbucket(self, cell):
+        key = self._bucket(cell)
+        bucket = self.buckets[key]
+        bucket.discard(cell)
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, from_x, from_y, to_x, to_y):
+        source, target = from_y * self.width + from_x, to_y * self.width + to_x
+        self.cells[target] = self.cells.pop(source)
+        self._unbucket(source)
+        self.buckets.setdefault(self._bucket(target), set()).add(target)
+
+    def set_orientation(self, x, y, orientation):
+        self.cells[y * self.width + x]['orientation'] = orientation
+
+    def set_status(self, x, y, status):
+        self.cells[y * self.width + x]['status'] = status
+
+    def set_acted(self, x, y, has_acted):
+        self.cells[y * self.width + x]['has_acted'] = has_acted
+
+    def reset_acted(self, owner, positions=None):
+        """Clear the acted flag of the owner's units; ``positions`` limits the work to those tiles."""
+        if positions is not None:
+            for x, y in positions:
+                unit = self.cells.get(y * self.width + x)
+                if unit:
+                    unit['has_acted'] = False
+            return
+        for unit in self.cells.values():
+            if unit['owner'] == owner:
+                unit['has_acted'] = False
+
+    def count(self, owner, unit_type=None):
+        """Number of units belonging to ``owner``, optionally of one type only."""
+        return sum(1 for unit in self.cells.values()
+                   if unit['owner'] == owner and (unit_type is None or unit['type'] == unit_type))
+
+    def masks(self):
+        """Build one-bit-per-cell occupancy masks from the stored units only."""
+        occupied = damaged = 0
+        owners, types, orientations = {}, {}, {}
+        for cell, unit in self.cells.items():
+            bit = 1 << cell
+            occupied |= bit
+            owners[unit['owner']] = owners.get(unit['owner'], 0) | bit
+            types[unit['type']] = types.get(unit['type'], 0) | bit
+            orientations[unit['orientation']] = orientations.get(unit['orientation'], 0) | bit
+            if unit['status'] == UnitStatus.DAMAGED:
+                damaged |= bit
+        return BoardMasks(self.width, self.height, 1, occupied, owners, types, orientations, damaged)
+
+    def units(self):
+        """Yield (x, y, unit) for every occupied tile in row-major order."""
+        width = self.width
+        for cell in sorted(self.cells):
+            y, x = divmod(cell, width)
+            yield x, y, self.cells[cell]
+
+    def units_in(self, x0, y0, x1, y1):
+        """Yield (x, y, unit) for every unit inside the rectangle, corners included, in row-major order."""
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width - 1, x1), min(self.height - 1, y1)
+        found = []
+        for by in range(y0 >> self.BUCKET_SHIFT, (y1 >> self.BUCKET_SHIFT) + 1):
+            for bx in range(x0 >> self.BUCKET_SHIFT, (x1 >> self.BUCKET_SHIFT) + 1):
+                for cell in self.buckets.get((bx, by), ()):
+                    y, x = divmod(cell, self.width)
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        found.append(cell)
+        for cell in sorted(found):
+            y, x = divmod(cell, self.width)
+            yield x, y, self.cells[cell]
+
+
+def popcount(mask):
+    """Number of set bits in ``mask``."""
+    return bin(mask).count('1')
+
+
+_KEEP_TABLES = {}
+_EQ_TABLES = {}
+_NONZERO_TABLE = bytes([0]) + bytes([1]) * 255
+
+
+def _eq_table(value):
+    """Translate table mapping ``value`` to 0x01 and every other byte to 0x00."""
+    table = _EQ_TABLES.get(value)
+    if table is None:
+        table = bytes(1 if b == value else 0 for b in range(256))
+        _EQ_TABLES[value] = table
+    return table
+
+
+def _lane_mask(plane, table):
+    """Translate a byte plane through ``table`` and read the result as one little-endian int."""
+    return int.from_bytes(plane.tobytes().translate(table), 'little')
+
+
+def _keep_table(slot):
+    """Translate table mapping ``slot`` to 0x00 and every other byte to 0xFF."""
+    table = _KEEP_TABLES.get(slot)
+    if table is None:
+        table = bytes(0x00 if b == slot else 0xFF for b in range(256))
+        _KEEP_TABLES[slot] = table
+    return table
+
+
+BOARD_BACKENDS = {
+    DictBoard.kind: DictBoard,
+    ArrayBoard.kind: ArrayBoard,
+    BitBoard.kind: BitBoard,
+    SparseBoard.kind: SparseBoard,
+}
+
+
+def make_board(kind='dict', width=9, height=9):
+    """Create an empty board of the given backend kind."""
+    try:
+        backend = BOARD_BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown board backend '{kind}'. Choose from: {', '.join(BOARD_BACKENDS)}.")
+    return backend(width, height)
@@ -0,0 +1,385 @@
+"""Compact binary checkpoints of battles and games in progress.
+
+``encode_battle``/``decode_battle`` and ``encode_game``/``decode_game`` turn a
+Battle or GameState into bytes and back without losing anything a player
+can see: board cells are packed into four bytes each, enums are stored as
+small ints, integers are varints and the two players' ids shrink to a single
+tag byte. Log events are stored as their kind and field values; only events
+without a message template (end and forfeit) carry their text.
+
+A game's battle log can also be kept apart from the rest of the game, in a
+log segment: ``encode_game(game, log=False)`` leaves the events out and
+``encode_log`` turns the events added since the last save into a record to
+append to the segment. That way each action only encodes what it added,
+however long the battle has run.
+
+The make/unmake journal is not saved, so a restored battle starts with an
+empty undo history.
+"""
+from enum import Enum
+
+from game.battle_log import EVENT_FIELDS, BattleLog, LogEvent
+from game.board import (ORIENTATIONS, ORIENTATION_CODES, STATUSES, STATUS_CODES, UNIT_TYPES, UNIT_TYPE_CODES)
+from game.enums import Orientation, Phase, UnitStatus, UnitType
+
+BATTLE_MAGIC = b'BSB\x04'
+GAME_MAGIC = b'BSG\x05'
+
+BOARD_KINDS = ('dict', 'array', 'bitboard', 'sparse')
+PHASES = tuple(Phase)
+PHASE_CODES = {p: i for i, p in enumerate(PHASES)}
+ENUMS = (UnitType, Orientation, Phase, UnitStatus)
+
+EVENT_TYPES = tuple(EVENT_FIELDS)
+EVENT_CODES = {t: i for i, t in enumerate(EVENT_TYPES)}
+
+# Strings common enough in logs and armies to store as a one-byte index.
+NAMES = tuple(dict.fromkeys([o.value for o in Orientation] + [t.value for t in UnitType]
+                            + [t.value.lower() for t in UnitType] + ['id', 'owner', 'units', 'type', 'count']))
+NAME_CODES = {name: i for i, name in enumerate(NAMES)}
+
+# Value tags
+(T_NONE, T_FALSE, T_TRUE, T_INT, T_STR, T_LIST, T_DICT, T_ENUM, T_AGGRESSOR, T_DEFENDER,
+ T_FLOAT, T_NAME) = range(12)
+
+# Flags byte after each log event code: a LogEvent with its text, one without, or a plain dict.
+EVENT_TEXT, EVENT_NO_TEXT, EVENT_DICT = 0, 1, 2
+
+# Byte after a game's fields: no battle, a battle with its log, or one whose log is in a log segment.
+NO_BATTLE, BATTLE_WITH_LOG, BATTLE_LOG_SEGMENT = 0, 1, 2
+
+
+class CheckpointError(ValueError):
+    """Raised when checkpoint bytes are malformed or of an unknown version."""
+
+
+class _Writer:
+    def __init__(self, players=()):
+        self.data = bytearray()
+        self.players = players
+
+    def uint(self, n):
+        while n > 0x7F:
+            self.data.append(n & 0x7F | 0x80)
+            n >>= 7
+        self.data.append(n)
+
+    def int(self, n):
+        self.uint(n << 1 if n >= 0 else (-n << 1) - 1)
+
+    def str(self, text):
+        raw = text.encode('utf-8')
+        self.uint(len(raw))
+        self.data += raw
+
+    def value(self, value):
+        data = self.data
+        if value is None:
+            data.append(T_NONE)
+        elif value is True or value is False:
+            data.append(T_TRUE if value else T_FALSE)
+        elif isinstance(value, Enum):
+            data.append(T_ENUM)
+            data.append(ENUMS.index(type(value)))
+            data.append(tuple(type(value)).index(value))
+        elif isinstance(value, int):
+            if self.players and value == self.players[0]:
+                data.append(T_AGGRESSOR)
+            elif self.players and value == self.players[1]:
+                data.append(T_DEFENDER)
+            else:
+                data.append(T_INT)
+                self.int(value)
+        elif isinstance(value, float):
+            data.append(T_FLOAT)
+            self.str(repr(value))
+        elif isinstance(value, str):
+            code = NAME_CODES.get(value)
+            if code is None:
+                data.append(T_STR)
+                self.str(value)
+            else:
+                data.append(T_NAME)
+                data.append(code)
+        elif isinstance(value, (list, tuple)):
+            data.append(T_LIST)
+            self.uint(len(value))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, dict):
+            data.append(T_DICT)
+            self.uint(len(value))
+            for key, item in value.items():
+                self.value(key)
+                self.value(item)
+        else:
+            raise TypeError(f"Cannot checkpoint a value of type {type(value).__name__}.")
+
+
+class _Reader:
+    def __init__(self, data, players=()):
+        self.data = data
+        self.pos = 0
+        self.players = players
+
+    def byte(self):
+        try:
+            b = self.data[self.pos]
+        except IndexError:
+            raise CheckpointError("Checkpoint is truncated.")
+        self.pos += 1
+        return b
+
+    def bytes(self, n):
+        if self.pos + n > len(self.data):
+            raise CheckpointError("Checkpoint is truncated.")
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def uint(self):
+        n = shift = 0
+        while True:
+            b = self.byte()
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def int(self):
+        n = self.uint()
+        return -((n + 1) >> 1) if n & 1 else n >> 1
+
+    def str(self):
+        return bytes(self.bytes(self.uint())).decode('utf-8')
+
+    def value(self):
+        tag = self.byte()
+        if tag == T_NONE:
+            return None
+        if tag == T_FALSE:
+            return False
+        if tag == T_TRUE:
+            return True
+        if tag == T_INT:
+            return self.int()
+        if tag == T_AGGRESSOR:
+            return self.players[0]
+        if tag == T_DEFENDER:
+            return self.players[1]
+        if tag == T_FLOAT:
+            return float(self.str())
+        if tag == T_STR:
+            return self.str()
+        if tag == T_NAME:
+            return NAMES[self.byte()]
+        if tag == T_ENUM:
+            enum = ENUMS[self.byte()]
+            return tuple(enum)[self.byte()]
+        if tag == T_LIST:
+            return [self.value() for _ in range(self.uint())]
+        if tag == T_DICT:
+            result = {}
+            for _ in range(self.uint()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        raise CheckpointError(f"Unknown value tag {tag}.")
+
+
+def _slot(battle, player_id):
+    return 0 if player_id is None else 1 if player_id == battle.aggressor_id else 2
+
+
+def _write_battle(w, battle, log=True):
+    w.int(battle.aggressor_id)
+    w.int(battle.defender_id)
+    w.players = (battle.aggressor_id, battle.defender_id)
+    board = battle.board
+    w.data += bytes((BOARD_KINDS.index(board.kind), PHASE_CODES[battle.phase],
+                     _slot(battle, battle.current_player), _slot(battle, battle.winner)))
+    w.uint(board.width)
+    w.uint(board.height)
+    w.uint(battle.deployment_depth)
+    w.uint(battle.total_unit_count)
+    w.uint(battle.placed_count)
+    w.value(battle.armies)
+    w.value({player: side for player, side in battle.sides.items() if player != side})
+    w.value(battle.placed_units)
+    w.value(battle.remaining_units)
+    w.value(battle._remaining_by_type)
+
+    units = list(board.units())
+    w.uint(len(units))
+    for x, y, unit in units:
+        w.uint(y * board.width + x)
+        w.data += bytes((_slot(battle, unit['owner']), UNIT_TYPE_CODES[unit['type']],
+                         ORIENTATION_CODES[unit['orientation']],
+                         STATUS_CODES[unit['status']] | unit['has_acted'] << 4))
+
+    # Without its events, the log's length tells how much of the log segment belongs to this state.
+    w.uint(len(battle.log))
+    if log:
+        _write_events(w, battle.log)
+
+
+def _write_events(w, events):
+    for event in events:
+        if isinstance(event, LogEvent):
+            w.data.append(EVENT_CODES[event.kind])
+            w.data.append(EVENT_NO_TEXT if event.text is None else EVENT_TEXT)
+            for value in event.values:
+                w.value(value)
+            if event.text is not None:
+                w.str(event.text)
+        else:
+            w.data.append(0)
+            w.data.append(EVENT_DICT)
+            w.value(dict(event))
+
+
+def _read_battle(r, segment=None):
+    from game.game_manager import Battle
+
+    aggressor_id, defender_id = r.int(), r.int()
+    r.players = (aggressor_id, defender_id)
+    kind, phase, current, winner = (r.byte() for _ in range(4))
+    width, height, deployment_depth = r.uint(), r.uint(), r.uint()
+    total_unit_count, placed_count = r.uint(), r.uint()
+    armies = r.value()
+    allies = r.value()
+    # Battle.__init__ rebuilds the placement sources and remaining counts from the armies as they are now.
+    try:
+        battle = Battle(aggressor_id, defender_id, armies, board=BOARD_KINDS[kind], width=width, height=height,
+                        deployment_depth=deployment_depth, allies=allies)
+    except (IndexError, ValueError) as e:
+        raise CheckpointError(f"Cannot restore a {width}x{height} board: {e}")
+    battle.total_unit_count = total_unit_count
+    battle.placed_count = placed_count
+    battle.placed_units = r.value()
+    battle.remaining_units = r.value()
+    battle._remaining_by_type = r.value()
+    battle._remaining_by_side = {aggressor_id: 0, defender_id: 0}
+    for player, remaining in battle.remaining_units.items():
+        battle._remaining_by_side[battle.sides[player]] += sum(remaining.values())
+    players = (None, aggressor_id, defender_id)
+    battle.phase = PHASES[phase]
+    battle.current_player = players[current]
+    battle.winner = players[winner]
+
+    for _ in range(r.uint()):
+        y, x = divmod(r.uint(), width)
+        slot, unit_type, orientation, flags = r.bytes(4)
+        battle._put_unit(x, y, UNIT_TYPES[unit_type], players[slot], ORIENTATIONS[orientation],
+                         STATUSES[flags & 0xF], bool(flags >> 4))
+    battle._journal.clear()
+    battle.zobrist = battle.compute_zobrist()
+
+    count = r.uint()
+    if segment is None:
+        _read_events(r, battle.log, count)
+    else:
+        _read_log(_Reader(segment, r.players), battle.log)
+        # The segment is written before the state, so after a crash it may run past it.
+        del battle.log[count:]
+    battle.log.mark_saved()
+    return battle
+
+
+def _read_events(r, log, count):
+    for _ in range(count):
+        code, flags = r.byte(), r.byte()
+        if flags == EVENT_DICT:
+            log.append(r.value())
+            continue
+        kind = EVENT_TYPES[code]
+        values = tuple(r.value() for _ in EVENT_FIELDS[kind])
+        log.add(kind, *values, text=r.str() if flags == EVENT_TEXT else None)
+
+
+def encode_battle(battle):
+    """Return the checkpoint bytes of a Battle."""
+    w = _Writer()
+    w.data += BATTLE_MAGIC
+    _write_battle(w, battle)
+    return bytes(w.data)
+
+
+def decode_battle(data):
+    """Rebuild a Battle from ``encode_battle`` bytes."""
+    if bytes(data[:4]) != BATTLE_MAGIC:
+        raise CheckpointError("Not a battle checkpoint.")
+    r = _Reader(data)
+    r.pos = 4
+    return _read_battle(r)
+
+
+GAME_FIELDS = ('aggressor', 'defender', 'turn', 'phase', 'current_player', 'armies', 'resources', 'treaty',
+               'ceasefire', 'bot_difficulty', 'allies')
+
+
+def encode_game(game, log=True):
+    """Return the checkpoint bytes of a GameState, including its battle if one is running.
+
+    With ``log`` False the battle's log events are left out, to be kept in a
+    log segment built with ``encode_log``.
+    """
+    w = _Writer()
+    w.data += GAME_MAGIC
+    w.int(game.aggressor['id'])
+    w.int(game.defender['id'])
+    w.players = (game.aggressor['id'], game.defender['id'])
+    w.value({name: getattr(game, name) for name in GAME_FIELDS})
+    if game.battle is None:
+        w.data.append(NO_BATTLE)
+    else:
+        w.data.append(BATTLE_WITH_LOG if log else BATTLE_LOG_SEGMENT)
+        _write_battle(w, game.battle, log)
+    return bytes(w.data)
+
+
+def encode_log(battle, start, events):
+    """Return a log segment record: ``events`` replacing the battle's log from index ``start`` on.
+
+    A segment is these records one after another; the first is usually the
+    whole log (``start`` 0) and each later one what an action added.
+    """
+    w = _Writer((battle.aggressor_id, battle.defender_id))
+    w.uint(start)
+    w.uint(len(events))
+    _write_events(w, events)
+    return bytes(w.data)
+
+
+def _read_log(r, log):
+    # Replay the records of a log segment onto ``log``. A record cut short by a crash mid-append is
+    # dropped, along with anything after it.
+    while r.pos < len(r.data):
+        try:
+            start, events = r.uint(), BattleLog()
+            _read_events(r, events, r.uint())
+        except CheckpointError:
+            break
+        del log[start:]
+        for event in events:
+            log.append(event)
+
+
+def decode_game(data, log=b''):
+    """Rebuild a GameState from ``encode_game`` bytes, and ``log``, its log segment if it was kept in one."""
+    from game.game_manager import GameState
+
+    if bytes(data[:4]) != GAME_MAGIC:
+        raise CheckpointError("Not a game checkpoint.")
+    r = _Reader(data)
+    r.pos = 4
+    r.players = (r.int(), r.int())
+    fields = r.value()
+    game = GameState(fields['aggressor'], fields['defender'])
+    for name in GAME_FIELDS:
+        if name in fields:
+            setattr(game, name, fields[name])
+    kind = r.byte()
+    if kind != NO_BATTLE:
+        game.battle = _read_battle(r, log if kind == BATTLE_LOG_SEGMENT else None)
+    return game
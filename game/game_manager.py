@@ -1,49 +1,337 @@
+import copy
+from collections import OrderedDict
 from game.enums import Phase, Orientation, UnitStatus, UnitType
+from game.board import make_board
+from game.attacks import resolve_attacks
+from game.battle_log import BattleLog, DeferredResult
+from game.movegen import ReachCache
+from game.units import UNIT_PROPERTIES, UNIT_SPECS, resolve_unit_type, unit_spec
+from game.zobrist import SIDE_TO_MOVE, zobrist_key
+
+# Side length of the standard battlefield; larger battles use the sparse backend.
+STANDARD_BOARD_SIZE = 9
+LARGE_BOARD_SIZE = 64
+DEPLOYMENT_DEPTH = 2
+# Players held in memory at once; the least recently used one is dropped for a new one and read back
+# from the store when needed again.
+PLAYER_CACHE_SIZE = 10_000
+# Records appended to a battle's log segment before it is rewritten as one
+LOG_SEGMENT_RECORDS = 256
+
 
 class Battle:
-    def __init__(self, aggressor_id, defender_id, armies):
+    def __init__(self, aggressor_id, defender_id, armies, board='dict', log_cap=None,
+                 width=STANDARD_BOARD_SIZE, height=STANDARD_BOARD_SIZE, deployment_depth=DEPLOYMENT_DEPTH,
+                 allies=None):
         self.aggressor_id = aggressor_id
         self.defender_id = defender_id
         self.armies = armies
-        self.board = [[None for _ in range(9)] for _ in range(9)]
+        # Side of every participant, keyed by player id: the aggressor or defender id. Allies place and
+        # command their side's units on its turn; on the board every unit is owned by its side.
+        self.sides = {aggressor_id: aggressor_id, defender_id: defender_id}
+        for ally, side in (allies or {}).items():
+            if side not in (aggressor_id, defender_id):
+                raise ValueError(f"Ally {ally} must fight for the aggressor or the defender.")
+            self.sides.setdefault(ally, side)
+        # 'dict' keeps the original grid of unit dicts; 'array' stores compact byte planes,
+        # 'bitboard' keeps per-player, per-type and per-orientation masks (fastest for bulk simulation)
+        # and 'sparse' stores only occupied tiles, for large boards with few units per tile
+        self.board = make_board(board, width, height)
+        if not 0 < deployment_depth <= height // 2:
+            raise ValueError(f"Deployment zones must be 1-{height // 2} rows deep on a board {height} rows high.")
+        # First and last row of each player's deployment zone: the aggressor deploys along the
+        # bottom edge, the defender along the top
+        self.deployment_depth = deployment_depth
+        self.deployment_zones = {aggressor_id: (height - deployment_depth, height - 1),
+                                 defender_id: (0, deployment_depth - 1)}
         self.phase = Phase.PLACEMENT
         self.current_player = aggressor_id
-        self.placed_units = {aggressor_id: [], defender_id: []}
+        self.winner = None
+        self.placed_units = {player: [] for player in self.sides}
         self.total_unit_count = self.count_total_units()
-        self.log = []
+        self.placed_count = 0
+        # Placement bookkeeping, built once and updated on every placement instead of recounted:
+        # army unit entries to draw from per (player, type), units left to place per player and type,
+        # and units left per side
+        self._unit_sources = {}
+        self.remaining_units = {player: {} for player in self.sides}
+        self._remaining_by_type = {}
+        self._remaining_by_side = {aggressor_id: 0, defender_id: 0}
+        for army in armies:
+            if army['owner'] not in self.sides:
+                raise ValueError(f"Army {army.get('id', '?')} belongs to {army['owner']}, who is on neither side.")
+            remaining = self.remaining_units[army['owner']]
+            for unit in army['units']:
+                unit_type = resolve_unit_type(unit['type'])
+                if unit_type is None or unit['count'] <= 0:
+                    continue
+                self._unit_sources.setdefault((army['owner'], unit_type), []).append(unit)
+                remaining[unit_type] = remaining.get(unit_type, 0) + unit['count']
+                self._remaining_by_type[unit_type] = self._remaining_by_type.get(unit_type, 0) + unit['count']
+                self._remaining_by_side[self.sides[army['owner']]] += unit['count']
+        # Where each player's units and commanders stand, maintained on place, move and destroy
+        self.positions = {aggressor_id: set(), defender_id: set()}
+        self.commander_positions = {aggressor_id: set(), defender_id: set()}
+        # Reachable tiles per (cell, movement), dropped only where occupancy changes
+        self._reach = ReachCache(self.board.width, self.board.height)
+        # Zobrist hash of the position and side to move, updated with every mutation below
+        self._owner_slots = {aggressor_id: 0, defender_id: 1}
+        self.zobrist = 0
+        # Typed events whose messages are rendered on read; past ``log_cap`` events older ones are archived
+        self.log = BattleLog(cap=log_cap)
+        # Make/unmake journal: every mutation below pushes the delta that reverts it, and each
+        # successful action pushes a frame of (journal length, log length) from before it ran
+        self._journal = []
+        self._frames = []
+
+    # Bot searches get the battle pickled into a worker and deep-copied there. Both leave out the
+    # reach cache: its tables are shared per board shape and its results are rebuilt where needed.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_reach']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reach = ReachCache(self.board.width, self.board.height)
+
+    def __deepcopy__(self, memo):
+        battle = Battle.__new__(Battle)
+        memo[id(self)] = battle
+        battle.__setstate__(copy.deepcopy(self.__getstate__(), memo))
+        return battle
 
     def count_total_units(self):
         return sum(sum(unit['count'] for unit in army['units']) for army in self.armies)
 
+    def _unit_key(self, x, y, unit_type, owner, orientation, status):
+        width = self.board.width
+        return zobrist_key(width, self.board.height, y * width + x, self._owner_slots[owner], unit_type, orientation, status)
+
+    def compute_zobrist(self):
+        """Hash the position from scratch; ``self.zobrist`` should always equal this."""
+        h = SIDE_TO_MOVE if self.current_player == self.defender_id else 0
+        for x, y, unit in self.board.units():
+            h ^= self._unit_key(x, y, unit['type'], unit['owner'], unit['orientation'], unit['status'])
+        return h
+
+    # Board mutations go through these helpers so the position indexes, hash and journal stay in sync.
+    def _put_unit(self, x, y, unit_type, owner, orientation, status=UnitStatus.HEALTHY, has_acted=False):
+        self.board.place(x, y, unit_type, owner, orientation, status, has_acted)
+        self.zobrist ^= self._unit_key(x, y, unit_type, owner, orientation, status)
+        self._journal.append(('put', x, y))
+        self._reach.invalidate(y * self.board.width + x)
+        self.positions.setdefault(owner, set()).add((x, y))
+        if unit_type == UnitType.COMMANDER:
+            self.commander_positions.setdefault(owner, set()).add((x, y))
+
+    def _remove_unit(self, x, y):
+        unit = self.board.remove(x, y)
+        if unit:
+            self._journal.append(('remove', x, y, unit['type'], unit['owner'], unit['orientation'],
+                                  unit['status'], unit['has_acted']))
+            self._reach.invalidate(y * self.board.width + x)
+            self.zobrist ^= self._unit_key(x, y, unit['type'], unit['owner'], unit['orientation'], unit['status'])
+            self.positions[unit['owner']].discard((x, y))
+            if unit['type'] == UnitType.COMMANDER:
+                self.commander_positions[unit['owner']].discard((x, y))
+        return unit
+
+    def _relocate_unit(self, unit, from_x, from_y, to_x, to_y):
+        self.board.move(from_x, from_y, to_x, to_y)
+        self._journal.append(('move', from_x, from_y, to_x, to_y))
+        self._reach.invalidate(from_y * self.board.width + from_x)
+        self._reach.invalidate(to_y * self.board.width + to_x)
+        self.zobrist ^= self._unit_key(from_x, from_y, unit['type'], unit['owner'], unit['orientation'], unit['status']) \
+            ^ self._unit_key(to_x, to_y, unit['type'], unit['owner'], unit['orientation'], unit['status'])
+        positions = self.positions[unit['owner']]
+        positions.discard((from_x, from_y))
+        positions.add((to_x, to_y))
+        if unit['type'] == UnitType.COMMANDER:
+            commanders = self.commander_positions[unit['owner']]
+            commanders.discard((from_x, from_y))
+            commanders.add((to_x, to_y))
+
+    # DictBoard hands out the live unit dict, so hash the old state before mutating it.
+    def _set_orientation(self, x, y, unit, orientation):
+        self.zobrist ^= self._unit_key(x, y, unit['type'], unit['owner'], unit['orientation'], unit['status']) \
+            ^ self._unit_key(x, y, unit['type'], unit['owner'], orientation, unit['status'])
+        self._journal.append(('orientation', x, y, unit['orientation']))
+        self.board.set_orientation(x, y, orientation)
+
+    def _set_status(self, x, y, status):
+        unit = self.board.get(x, y)
+        self.zobrist ^= self._unit_key(x, y, unit['type'], unit['owner'], unit['orientation'], unit['status']) \
+            ^ self._unit_key(x, y, unit['type'], unit['owner'], unit['orientation'], status)
+        self._journal.append(('status', x, y, unit['status']))
+        self.board.set_status(x, y, status)
+
+    def _set_acted(self, x, y, has_acted):
+        self._journal.append(('acted', x, y, self.board.get(x, y)['has_acted']))
+        self.board.set_acted(x, y, has_acted)
+
+    def _reset_acted(self, player_id):
+        positions = self.positions.get(player_id, ())
+        acted = [(x, y) for x, y in positions if self.board.get(x, y)['has_acted']]
+        if acted:
+            self._journal.append(('reset_acted', acted))
+        self.board.reset_acted(player_id, positions)
+
+    def _set_current_player(self, player_id):
+        if (self.current_player == self.defender_id) != (player_id == self.defender_id):
+            self.zobrist ^= SIDE_TO_MOVE
+        self._journal.append(('player', self.current_player))
+        self.current_player = player_id
+
+    def _set_phase(self, phase, winner=None):
+        self._journal.append(('phase', self.phase, self.winner))
+        self.phase = phase
+        self.winner = winner
+
+    def _push_frame(self):
+        # Actions validate before they mutate, so a frame is only pushed for actions that succeed.
+        self._frames.append((len(self._journal), len(self.log)))
+
+    def unmake(self):
+        """Revert the last successful place, move, turn, end_turn or forfeit.
+
+        Only the cells the action changed are touched, so this costs
+        O(changed cells) and never copies the board. Returns False when there
+        is nothing left to revert.
+        """
+        if not self._frames:
+            return False
+        journal_length, log_length = self._frames.pop()
+        entries = self._journal[journal_length:]
+        for entry in reversed(entries):
+            self._revert(entry)
+        # The helpers journal the reverting mutations too; drop them along with the action.
+        del self._journal[journal_length:]
+        del self.log[log_length:]
+        return True
+
+    def _revert(self, entry):
+        kind = entry[0]
+        if kind == 'put':
+            self._remove_unit(entry[1], entry[2])
+        elif kind == 'remove':
+            self._put_unit(*entry[1:])
+        elif kind == 'move':
+            _, from_x, from_y, to_x, to_y = entry
+            self._relocate_unit(self.board.get(to_x, to_y), to_x, to_y, from_x, from_y)
+        elif kind == 'orientation':
+            self._set_orientation(entry[1], entry[2], self.board.get(entry[1], entry[2]), entry[3])
+        elif kind == 'status':
+            self._set_status(entry[1], entry[2], entry[3])
+        elif kind == 'acted':
+            self.board.set_acted(entry[1], entry[2], entry[3])
+        elif kind == 'reset_acted':
+            for x, y in entry[1]:
+                self.board.set_acted(x, y, True)
+        elif kind == 'player':
+            self._set_current_player(entry[1])
+        elif kind == 'phase':
+            self.phase, self.winner = entry[1], entry[2]
+        elif kind == 'placed':
+            _, player_id, unit_type, source, exhausted = entry
+            source['count'] += 1
+            if exhausted:
+                self._unit_sources[(player_id, unit_type)].insert(0, source)
+            self.remaining_units[player_id][unit_type] += 1
+            self._remaining_by_type[unit_type] += 1
+            self._remaining_by_side[self.sides[player_id]] += 1
+            self.placed_count -= 1
+            self.placed_units[player_id].pop()
+
+    def undo(self, player_id):
+        """Take back the player's last move or turn, as long as it is still their turn."""
+        if self.phase != Phase.BATTLE:
+            return {"success": False, "message": "You can only undo actions during the battle phase."}
+        if self.current_player != self.sides.get(player_id):
+            return {"success": False, "message": "It's not your turn."}
+        if not self._frames:
+            return {"success": False, "message": "There is nothing to undo."}
+        action = self.log[self._frames[-1][1]] if self._frames[-1][1] < len(self.log) else None
+        if not action or action['type'] not in ('move', 'turn') or action['player_id'] != player_id:
+            return {"success": False, "message": "You can only undo moves and turns made this turn."}
+        self.unmake()
+        return {"success": True, "message": f"Undid: {action['message']}"}
+
+    def commander_position(self, player_id):
+        """Return the (x, y) of one of the player's commanders, or None if none is alive."""
+        for x, y in list(self.commander_positions.get(player_id, ())):
+            unit = self.board.get(x, y)
+            if unit and unit['type'] == UnitType.COMMANDER and unit['owner'] == player_id:
+                return x, y
+            # The board was changed without going through Battle; drop the stale entry.
+            self.commander_positions[player_id].discard((x, y))
+        return None
+
+    def reachable_tiles(self, x, y):
+        """Return the (x, y) tiles the unit at (x, y) can move to, ignoring whose turn it is.
+
+        Units move through empty tiles only; cardinal-only units move in a straight line.
+        """
+        unit = self.board.get(x, y)
+        if not unit:
+            return []
+        width = self.board.width
+        spec = UNIT_SPECS[unit['type']]
+        reach = self._reach.reachable(y * width + x, spec.movement, spec.cardinal_only, self._cell_occupied)
+        return [(cell % width, cell // width) for cell in reach]
+
+    def _cell_occupied(self, cell):
+        y, x = divmod(cell, self.board.width)
+        return self.board.is_occupied(x, y)
+
+    def legal_actions(self, player_id=None):
+        """Every move and turn the player can make right now (the current player by default).
+
+        Actions are tuples: ('move', from_x, from_y, to_x, to_y) or
+        ('turn', x, y, orientation_value), ordered by unit position. Ending the
+        turn is always legal during the battle phase and is not listed.
+        """
+        if player_id is None:
+            player_id = self.current_player
+        if self.phase != Phase.BATTLE or player_id != self.current_player:
+            return []
+        actions = []
+        for x, y in sorted(self.positions.get(player_id, ())):
+            unit = self.board.get(x, y)
+            if unit['has_acted']:
+                continue
+            for tx, ty in self.reachable_tiles(x, y):
+                actions.append(('move', x, y, tx, ty))
+            for orientation in Orientation:
+                if orientation != unit['orientation']:
+                    actions.append(('turn', x, y, orientation.value))
+        return actions
+
     def place_unit(self, player_id, unit_type, x, y, orientation):
         if self.phase != Phase.PLACEMENT:
             return {"success": False, "message": "It is not the placement phase."}
-        if self.current_player != player_id:
+        side = self.sides.get(player_id)
+        if self.current_player != side:
             return {"success": False, "message": "It's not your turn to place units."}
 
-        is_aggressor = player_id == self.aggressor_id
-        valid_y = (y >= 7 and y <= 8) if is_aggressor else (y >= 0 and y <= 1)
-        if not valid_y or x < 0 or x > 8:
-            return {"success": False, "message": f"You can only place units in your deployment zone. Your zone is y: {'7-8' if is_aggressor else '0-1'}."}
+        first_row, last_row = self.deployment_zones[side]
+        if not (first_row <= y <= last_row and 0 <= x < self.board.width):
+            return {"success": False, "message": f"You can only place units in your deployment zone. Your zone is y: {first_row}-{last_row}."}
 
-        if self.board[y][x]:
+        if self.board.is_occupied(x, y):
             return {"success": False, "message": "This tile is already occupied."}
+        try:
+            enum_orientation = Orientation(orientation) if orientation else Orientation.NORTH
+        except ValueError:
+            return {"success": False, "message": "Orientation must be north, east, south or west."}
+
+        enum_unit_type = resolve_unit_type(unit_type)
+        sources = self._unit_sources.get((player_id, enum_unit_type))
+        unit_source = sources[0] if sources else None
 
-        player_armies = [a for a in self.armies if a['owner'] == player_id]
-        unit_source = None
-        for army in player_armies:
-            for unit in army['units']:
-                # Handle both string and enum unit types for comparison (case-insensitive)
-                unit_type_str = unit['type'].value if hasattr(unit['type'], 'value') else str(unit['type'])
-                search_type_str = unit_type.value if hasattr(unit_type, 'value') else str(unit_type)
-                if unit_type_str.upper() == search_type_str.upper() and unit['count'] > 0:
-                    unit_source = unit
-                    break
-            if unit_source:
-                break
-        
         if not unit_source:
             # Debug: Show what armies and units this player has
+            player_armies = [a for a in self.armies if a['owner'] == player_id]
             debug_armies = []
             for army in player_armies:
                 units_info = []
@@ -54,250 +342,175 @@ class Battle:
             debug_msg = f"Available armies: {'; '.join(debug_armies)}" if debug_armies else "No armies found"
             return {"success": False, "message": f"You do not have any available {unit_type} units to place. {debug_msg}"}
 
+        self._push_frame()
         unit_source['count'] -= 1
-        # Convert unit_type to proper enum, handling case variations
-        if isinstance(unit_type, UnitType):
-            enum_unit_type = unit_type
-        else:
-            # Try to match the unit type case-insensitively
-            unit_type_upper = str(unit_type).upper()
-            try:
-                enum_unit_type = UnitType(unit_type_upper)
-            except ValueError:
-                # Fallback: try to find by name
-                enum_unit_type = next((ut for ut in UnitType if ut.value.upper() == unit_type_upper), UnitType.INFANTRY)
-        
-        self.board[y][x] = {
-            "type": enum_unit_type,
-            "owner": player_id,
-            "orientation": Orientation(orientation) if orientation else Orientation.NORTH,
-            "has_acted": False,
-            "status": UnitStatus.HEALTHY
-        }
+        exhausted = unit_source['count'] <= 0
+        if exhausted:
+            sources.pop(0)
+        self._journal.append(('placed', player_id, enum_unit_type, unit_source, exhausted))
+        player_remaining = self.remaining_units[player_id]
+        player_remaining[enum_unit_type] -= 1
+        self._remaining_by_type[enum_unit_type] -= 1
+        self._remaining_by_side[side] -= 1
+        self.placed_count += 1
+        self._put_unit(x, y, enum_unit_type, side, enum_orientation)
         self.placed_units[player_id].append({"type": unit_type, "x": x, "y": y})
-        self.log.append({
-            "type": 'place',
-            "player_id": player_id,
-            "unit_type": unit_type,
-            "x": x,
-            "y": y,
-            "orientation": orientation or 'north',
-            "message": f"Placed {unit_type} at ({x},{y}) facing {orientation or 'north'}."
-        })
+        self.log.add('place', player_id, unit_type, x, y, orientation or 'north')
 
-        # Calculate units left for this player and total units left
-        from collections import Counter
-        # Player's units left by type
-        player_units_counter = Counter()
-        for army in self.armies:
-            if army['owner'] == player_id:
-                for unit in army['units']:
-                    player_units_counter[unit['type']] += unit['count']
-        # All units left by type
-        all_units_counter = Counter()
-        for army in self.armies:
-            for unit in army['units']:
-                all_units_counter[unit['type']] += unit['count']
-        # Placed units by type
-        placed_units_counter = Counter()
-        for pid, placed_list in self.placed_units.items():
-            for placed in placed_list:
-                placed_units_counter[placed['type']] += 1
-        # Remaining units to place by type
-        units_left_to_place = all_units_counter - placed_units_counter
-        # Format info
-        def fmt_counter(counter):
-            return ', '.join(f"{v} {k.value if hasattr(k, 'value') else k}" for k, v in counter.items() if v > 0) or "None"
-        total_placed = sum(placed_units_counter.values())
-        total_units_left = self.total_unit_count - total_placed
-
-        if total_placed >= self.total_unit_count:
-            self.phase = Phase.BATTLE
-            self.current_player = self.aggressor_id
-            return {
-                "success": True,
-                "phase": Phase.BATTLE.value,
-                "message": (
+        if self.placed_count >= self.total_unit_count:
+            self._set_phase(Phase.BATTLE)
+            self._set_current_player(self.aggressor_id)
+            return DeferredResult(
+                lambda: (
                     f"Placed {unit_type} at ({x},{y}).\n"
                     f"All units have been placed! The battle phase begins. It is now the aggressor's turn."
-                )
-            }
+                ),
+                success=True,
+                phase=Phase.BATTLE.value,
+            )
 
-        self.current_player = self.defender_id if self.current_player == self.aggressor_id else self.aggressor_id
-        return {
-            "success": True,
-            "phase": Phase.PLACEMENT.value,
-            "message": (
+        # Hand over to the other side unless it has nothing left to place
+        other_player = self.defender_id if self.current_player == self.aggressor_id else self.aggressor_id
+        if self._remaining_by_side[other_player]:
+            self._set_current_player(other_player)
+        handed_over = self.current_player == other_player
+        total_units_left = self.total_unit_count - self.placed_count
+        # The summary is only formatted if someone reads the message, from counts as they are now
+        player_left, all_left = dict(player_remaining), dict(self._remaining_by_type)
+
+        def message():
+            def fmt_counts(counts):
+                return ', '.join(f"{v} {k.value}" for k, v in counts.items() if v > 0) or "None"
+            next_turn = "It is now the other player's turn to place a unit." if handed_over \
+                else "Your opponent has placed all their units, so it is your turn again."
+            return (
                 f"Placed {unit_type} at ({x},{y}).\n"
-                f"You have {sum(player_units_counter.values())} units left to place: {fmt_counter(player_units_counter)}.\n"
-                f"Total units left to place: {total_units_left} ({fmt_counter(units_left_to_place)}).\n"
-                f"It is now the other player's turn to place a unit."
+                f"You have {sum(player_left.values())} units left to place: {fmt_counts(player_left)}.\n"
+                f"Total units left to place: {total_units_left} ({fmt_counts(all_left)}).\n"
+                f"{next_turn}"
             )
-        }
+        return DeferredResult(message, success=True, phase=Phase.PLACEMENT.value)
 
     def get_unit_properties(self, unit_type):
-        properties = {
-            UnitType.INFANTRY: {"movement": 1, "hp": 1, "can_attack": True},
-            UnitType.SHOCK: {"movement": 1, "hp": 1, "can_attack": True, "immune_to": [UnitType.INFANTRY, UnitType.CAVALRY, UnitType.COMMANDER]},
-            UnitType.ARCHER: {"movement": 1, "cardinal_only": True, "hp": 1, "can_attack": False, "range": 3},
-            UnitType.COMMANDER: {"movement": 1, "hp": 1, "can_attack": True, "immune_to": [UnitType.INFANTRY, UnitType.CAVALRY]},
-            UnitType.CAVALRY: {"movement": 3, "hp": 1, "can_attack": True},
-            UnitType.CHARIOT: {"movement": 3, "hp": 1, "can_attack": True, "charge_bonus": True, "can_trample": True},
-        }
-        key = unit_type if isinstance(unit_type, UnitType) else UnitType(unit_type)
-        return properties.get(key, {"movement": 0, "hp": 1})
+        return UNIT_PROPERTIES[unit_spec(unit_type).unit_type]
 
     def forfeit_battle(self, player_id):
         if self.phase == Phase.ENDED:
             return {"success": False, "message": 'The battle has already ended.'}
         
-        winner, loser = (None, None)
-        if player_id == self.aggressor_id:
+        # An ally's forfeit concedes for their whole side.
+        side = self.sides.get(player_id)
+        if side == self.aggressor_id:
             winner = self.defender_id
-        elif player_id == self.defender_id:
+        elif side == self.defender_id:
             winner = self.aggressor_id
         else:
             return {"success": False, "message": 'You are not a participant in this battle.'}
         
-        self.phase = Phase.ENDED
+        self._push_frame()
         # record winner for later reference
-        self.winner = winner
-        self.log.append({
-            "type": 'forfeit',
-            "player_id": player_id,
-            "message": f"Player <@{player_id}> forfeited the battle. <@{winner}> is the winner!"
-        })
+        self._set_phase(Phase.ENDED, winner)
+        self.log.add('forfeit', side,
+                     text=f"Player <@{player_id}> forfeited the battle. <@{winner}> is the winner!")
         return {"success": True, "battle_ended": True, "winner": winner, "message": f"<@{player_id}> forfeited. <@{winner}> wins the battle!"}
 
     def move_unit(self, player_id, from_x, from_y, to_x, to_y):
         if self.phase != Phase.BATTLE:
             return {"success": False, "message": "It is not the battle phase."}
-        if self.current_player != player_id:
+        if self.current_player != self.sides.get(player_id):
             return {"success": False, "message": "It's not your turn."}
 
-        unit = self.board[from_y][from_x]
+        if not self.board.in_bounds(from_x, from_y) or not self.board.in_bounds(to_x, to_y):
+            return {"success": False, "message": "That position is outside the battlefield."}
+
+        unit = self.board.get(from_x, from_y)
         if not unit:
             return {"success": False, "message": "There is no unit at the specified starting position."}
-        if unit['owner'] != player_id:
+        if unit['owner'] != self.current_player:
             return {"success": False, "message": "You do not own that unit."}
         if unit['has_acted']:
             return {"success": False, "message": "That unit has already acted this turn."}
         
-        props = self.get_unit_properties(unit['type'])
+        spec = UNIT_SPECS[unit['type']]
         distance = abs(from_x - to_x) + abs(from_y - to_y)
 
-        if props.get('cardinal_only') and (from_x != to_x and from_y != to_y):
+        if spec.cardinal_only and (from_x != to_x and from_y != to_y):
             return {"success": False, "message": f"{unit['type']} can only move in cardinal directions (not diagonally)."}
-        if distance > props['movement']:
-            return {"success": False, "message": f"{unit['type']} can only move {props['movement']} tile(s). You tried to move {distance}."}
-
-        self.board[to_y][to_x] = unit
-        self.board[from_y][from_x] = None
-        unit['has_acted'] = True
-        self.log.append({
-            "type": 'move',
-            "player_id": player_id,
-            "unit_type": unit['type'],
-            "from_x": from_x,
-            "from_y": from_y,
-            "to_x": to_x,
-            "to_y": to_y,
-            "message": f"Moved {unit['type']} from ({from_x},{from_y}) to ({to_x},{to_y})."
-        })
-        return {"success": True, "message": f"Moved {unit['type']} from ({from_x},{from_y}) to ({to_x},{to_y})."}
-
-    def end_turn(self, player_id):
+        if distance > spec.movement:
+            return {"success": False, "message": f"{unit['type']} can only move {spec.movement} tile(s). You tried to move {distance}."}
+        if distance == 0:
+            return {"success": False, "message": "The unit is already on that tile."}
+        if self.board.is_occupied(to_x, to_y):
+            return {"success": False, "message": "That tile is already occupied."}
+        if (to_x, to_y) not in self.reachable_tiles(from_x, from_y):
+            return {"success": False, "message": f"{unit['type']} cannot reach ({to_x},{to_y}): the path is blocked."}
+
+        self._push_frame()
+        self._relocate_unit(unit, from_x, from_y, to_x, to_y)
+        self._set_acted(to_x, to_y, True)
+        event = self.log.add('move', player_id, unit['type'], from_x, from_y, to_x, to_y)
+        return DeferredResult(lambda: event.message, success=True)
+
+    def turn_unit(self, player_id, x, y, orientation):
         if self.phase != Phase.BATTLE:
             return {"success": False, "message": "It is not the battle phase."}
-        if self.current_player != player_id:
+        if self.current_player != self.sides.get(player_id):
             return {"success": False, "message": "It's not your turn."}
+        if x is None or y is None or not self.board.in_bounds(x, y):
+            return {"success": False, "message": "That position is outside the battlefield."}
+        try:
+            new_orientation = Orientation(orientation.lower() if isinstance(orientation, str) else orientation)
+        except ValueError:
+            return {"success": False, "message": "You must choose a direction to face: north, east, south or west."}
 
-        to_remove = []
-        for y in range(9):
-            for x in range(9):
-                unit = self.board[y][x]
-                if not unit or not self.get_unit_properties(unit['type']).get('can_attack'):
-                    continue
-                
-                tx, ty = x, y
-                if unit['orientation'] == Orientation.NORTH:
-                    ty -= 1
-                elif unit['orientation'] == Orientation.SOUTH:
-                    ty += 1
-                elif unit['orientation'] == Orientation.EAST:
-                    tx += 1
-                elif unit['orientation'] == Orientation.WEST:
-                    tx -= 1
-
-                if not (0 <= tx <= 8 and 0 <= ty <= 8):
-                    continue
+        unit = self.board.get(x, y)
+        if not unit:
+            return {"success": False, "message": "There is no unit at the specified position."}
+        if unit['owner'] != self.current_player:
+            return {"success": False, "message": "You do not own that unit."}
+        if unit['has_acted']:
+            return {"success": False, "message": "That unit has already acted this turn."}
 
-                target = self.board[ty][tx]
-                if not target or target['owner'] == unit['owner']:
-                    continue
+        self._push_frame()
+        self._set_orientation(x, y, unit, new_orientation)
+        self._set_acted(x, y, True)
+        event = self.log.add('turn', player_id, unit['type'], x, y, new_orientation.value)
+        return DeferredResult(lambda: event.message, success=True)
 
-                props = self.get_unit_properties(target['type'])
-                if 'immune_to' in props and unit['type'] in props['immune_to']:
-                    if target.get('status') == UnitStatus.DAMAGED:
-                        to_remove.append((tx, ty))
-                    else:
-                        target['status'] = UnitStatus.DAMAGED
-                else:
-                    to_remove.append((tx, ty))
+    def end_turn(self, player_id):
+        if self.phase != Phase.BATTLE:
+            return {"success": False, "message": "It is not the battle phase."}
+        side = self.sides.get(player_id)
+        if self.current_player != side:
+            return {"success": False, "message": "It's not your turn."}
+
+        self._push_frame()
+        to_remove, damaged = resolve_attacks(self.board)
+        for x, y in damaged:
+            self._set_status(x, y, UnitStatus.DAMAGED)
+            self.log.add('damage', x, y)
 
         for x, y in to_remove:
-            self.log.append({
-                "type": 'destroy',
-                "x": x,
-                "y": y,
-                "message": f"Unit at ({x},{y}) was destroyed during attack resolution."
-            })
-            self.board[y][x] = None
+            self.log.add('destroy', x, y)
+            self._remove_unit(x, y)
 
         battle_result = self.check_battle_end()
         if battle_result['ended']:
-            self.phase = Phase.ENDED
-            self.log.append({
-                "type": 'end',
-                "winner": battle_result['winner'],
-                "message": battle_result['message']
-            })
+            self._set_phase(Phase.ENDED, battle_result['winner'])
+            self.log.add('end', battle_result['winner'], text=battle_result['message'])
             return {"success": True, "battle_ended": True, "winner": battle_result['winner'], "message": battle_result['message']}
 
-        self.current_player = self.defender_id if self.current_player == self.aggressor_id else self.aggressor_id
-        for y in range(9):
-            for x in range(9):
-                unit = self.board[y][x]
-                if unit and unit['owner'] == self.current_player:
-                    unit['has_acted'] = False
-        
-        self.log.append({
-            "type": 'end_turn',
-            "player_id": player_id,
-            "message": "Turn ended. Attacks resolved. It is now the other player's turn."
-        })
+        self._set_current_player(self.defender_id if self.current_player == self.aggressor_id else self.aggressor_id)
+        self._reset_acted(self.current_player)
+
+        self.log.add('end_turn', side)
         return {"success": True, "message": "Turn ended. Attacks resolved. It is now the other player's turn."}
 
     def check_battle_end(self):
-        aggressor_commander = None
-        defender_commander = None
-        aggressor_units = 0
-        defender_units = 0
-
-        for y in range(9):
-            for x in range(9):
-                unit = self.board[y][x]
-                if not unit:
-                    continue
-
-                if unit['owner'] == self.aggressor_id:
-                    aggressor_units += 1
-                    if unit['type'] == UnitType.COMMANDER:
-                        aggressor_commander = unit
-                elif unit['owner'] == self.defender_id:
-                    defender_units += 1
-                    if unit['type'] == UnitType.COMMANDER:
-                        defender_commander = unit
+        aggressor_units = len(self.positions[self.aggressor_id])
+        defender_units = len(self.positions[self.defender_id])
+        aggressor_commander = self.commander_position(self.aggressor_id)
+        defender_commander = self.commander_position(self.defender_id)
 
         if not aggressor_commander:
             return {"ended": True, "winner": self.defender_id, "message": "The aggressor's commander has fallen! The defender wins!"}
@@ -313,6 +526,63 @@ class Battle:
         return {"ended": False}
 
 
+def _battle_record_id(aggressor_id, defender_id, armies):
+    # Battles are stored under the leaders' ids and the first army each leader fielded.
+    first = {}
+    for army in armies:
+        first.setdefault(army['owner'], army['id'])
+    return f"{aggressor_id}_{first.get(aggressor_id)}_vs_{defender_id}_{first.get(defender_id)}"
+
+
+class DirtyRecords:
+    """Army, resource and battle records changed since they were last persisted.
+
+    Methods that change records mark them here and call ``persist`` once at
+    the end, so each command stores only what it touched, in one write.
+    """
+
+    def __init__(self):
+        # (owner, army id) -> army, or None once the army is gone
+        self.armies = {}
+        self.resources = {}
+        self.battles = []
+
+    def __bool__(self):
+        return bool(self.armies or self.resources or self.battles)
+
+    def __eq__(self, other):
+        if not isinstance(other, DirtyRecords):
+            return NotImplemented
+        return (self.armies, self.resources, self.battles) == (other.armies, other.resources, other.battles)
+
+    def army(self, army):
+        self.armies[(army['owner'], army['id'])] = army
+
+    def removed_army(self, owner, army_id):
+        self.armies[(owner, army_id)] = None
+
+    def player_resources(self, player_id, resources):
+        self.resources[player_id] = resources
+
+    def battle(self, record):
+        self.battles.append(record)
+
+    def persist(self):
+        """Hand every dirty record to the store as one write and start clean."""
+        if not self:
+            return
+        armies, resources, battles = self.armies, self.resources, self.battles
+        self.armies, self.resources, self.battles = {}, {}, []
+        try:
+            from utils.sheets_sync import sync_records
+            sync_records(armies=[army for army in armies.values() if army is not None],
+                         removed_armies=[key for key, army in armies.items() if army is None],
+                         resources=resources, battles=battles)
+        except Exception as e:
+            print(f"[Sheets Sync] Failed to sync {len(armies)} armies, {len(resources)} players' resources "
+                  f"and {len(battles)} battles: {e}")
+
+
 class GameState:
     def __init__(self, aggressor, defender):
         self.aggressor = aggressor
@@ -331,6 +601,13 @@ class GameState:
         self.battle = None
         self.treaty = None
         self.ceasefire = None
+        # Battle records not yet persisted. The game's own armies and resources
+        # are saved with its checkpoint; the store's army records are the players' global armies.
+        self.dirty = DirtyRecords()
+        # Set for practice games where the bot plays the defender
+        self.bot_difficulty = None
+        # Players fighting alongside the aggressor or defender: {player_id: {"side": leader id, "armies": [ids]}}
+        self.allies = {}
 
     def _create_initial_resources(self):
         """Create default resource allocation for a new player."""
@@ -374,11 +651,6 @@ class GameState:
             ],
         }
         self.armies[player_id].append(army)
-        try:
-            from utils.sheets_sync import sync_army
-            sync_army(army)
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync army: {e}")
         return army
 
     def get_army(self, player_id, army_id):
@@ -402,12 +674,6 @@ class GameState:
         def unit_display_name(unit_type):
             return unit_type.value if hasattr(unit_type, 'value') else str(unit_type)
         army_list = '\n'.join(f"Army #{a['id']}: " + ', '.join(f"{u['count']} {unit_display_name(u['type'])}" for u in a['units']) for a in remaining)
-        try:
-            from utils.sheets_sync import sync_army
-            for a in remaining:
-                sync_army(a)
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync armies after disband: {e}")
         return {"success": True, "message": f"Army #{army_id} has been disbanded.\nYour remaining armies:\n{army_list}"}
 
     def modify_army(self, player_id, army_id, modification, quantity: int = 1):
@@ -457,18 +723,14 @@ class GameState:
             player_resources[resource] -= amount
 
         for new_unit in new_units:
-            existing_unit = next((u for u in army['units'] if u['type'] == new_unit['type']), None)
+            # Stored armies hold UnitType members, new units plain names; compare what they resolve to.
+            new_type = resolve_unit_type(new_unit['type'])
+            existing_unit = next((u for u in army['units'] if resolve_unit_type(u['type']) is new_type), None)
             if existing_unit:
                 existing_unit['count'] += new_unit['count']
             else:
                 army['units'].append(new_unit)
 
-        try:
-            from utils.sheets_sync import sync_army
-            sync_army(army)
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync army: {e}")
-
         # Detailed info: show new army composition and resources
         def unit_display_name(unit_type):
             return unit_type.value if hasattr(unit_type, 'value') else str(unit_type)
@@ -608,44 +870,74 @@ class GameState:
             "message": f"Food production: +{food_produced}, consumption: -{food_consumed}, net: {net_food}"
         }
 
-    def start_battle(self, aggressor_army_id, defender_army_id):
-        # Get armies from global system instead of local game armies
-        aggressor_army = game_manager.get_global_army(self.aggressor['id'], aggressor_army_id)
-        defender_army = game_manager.get_global_army(self.defender['id'], defender_army_id)
-        
-        if not aggressor_army:
-            return {"success": False, "message": "Aggressor army not found."}
-        if not defender_army:
-            return {"success": False, "message": "Defender army not found."}
+    def join_war(self, player_id, side_id, army_id):
+        """Bring one of the player's armies into the next battle on the aggressor's or defender's side."""
+        if side_id not in (self.aggressor['id'], self.defender['id']):
+            return {"success": False, "message": "Allies must join the aggressor or the defender."}
+        if player_id in (self.aggressor['id'], self.defender['id']):
+            return {"success": False, "message": "You are already leading a side in this war."}
+        ally = self.allies.get(player_id)
+        if ally and ally['side'] != side_id:
+            return {"success": False, "message": "You are already fighting for the other side."}
+        if self.battle:
+            return {"success": False, "message": "Allies can only join before a battle starts."}
+        if not game_manager.get_global_army(player_id, army_id):
+            return {"success": False, "message": f"Army #{army_id} not found."}
+        ally = self.allies.setdefault(player_id, {"side": side_id, "armies": []})
+        if army_id not in ally['armies']:
+            ally['armies'].append(army_id)
+        side_name = self.aggressor['name'] if side_id == self.aggressor['id'] else self.defender['name']
+        return {"success": True, "message": f"Army #{army_id} will fight for {side_name} in the next battle."}
+
+    def start_battle(self, aggressor_army_id, defender_army_id, size=STANDARD_BOARD_SIZE):
+        """Start a battle; each side fields one army id or a list of them, plus its allies' armies."""
         if self.battle:
             return {"success": False, "message": "A battle is already in progress in this war."}
+        if not STANDARD_BOARD_SIZE <= size <= LARGE_BOARD_SIZE:
+            return {"success": False, "message": f"The battlefield must be {STANDARD_BOARD_SIZE}-{LARGE_BOARD_SIZE} tiles wide."}
+
+        # Get armies from global system instead of local game armies
+        def as_ids(army_ids):
+            return list(army_ids) if isinstance(army_ids, (list, tuple)) else [army_ids]
+        fielded = [(self.aggressor['id'], army_id, "Aggressor") for army_id in as_ids(aggressor_army_id)]
+        fielded += [(self.defender['id'], army_id, "Defender") for army_id in as_ids(defender_army_id)]
+        for player_id, ally in self.allies.items():
+            fielded += [(player_id, army_id, f"<@{player_id}>'s") for army_id in ally['armies']]
+        battle_armies = []
+        for player_id, army_id, label in fielded:
+            army = game_manager.get_global_army(player_id, army_id)
+            if not army:
+                return {"success": False, "message": f"{label} army not found."}
+            battle_armies.append(army)
+
+        self.battle = Battle(self.aggressor['id'], self.defender['id'], battle_armies,
+                             board='dict' if size == STANDARD_BOARD_SIZE else 'sparse', width=size, height=size,
+                             allies={player_id: ally['side'] for player_id, ally in self.allies.items()})
         
-        battle_armies = [aggressor_army, defender_army]
-        self.battle = Battle(self.aggressor['id'], self.defender['id'], battle_armies)
-        
-        # Detailed info: show both armies' compositions
+        # Detailed info: show both sides' compositions
         def army_comp(army):
             def unit_display_name(unit_type):
                 return unit_type.value if hasattr(unit_type, 'value') else str(unit_type)
             return ', '.join(f"{u['count']} {unit_display_name(u['type'])}" for u in army['units'])
-        try:
-            from utils.sheets_sync import sync_battle
-            sync_battle({
-                "id": f"{self.aggressor['id']}_{aggressor_army_id}_vs_{self.defender['id']}_{defender_army_id}",
-                "aggressor": self.aggressor['id'],
-                "defender": self.defender['id'],
-                "winner": None,
-                "armies": battle_armies,
-                "log": []
-            })
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync battle: {e}")
+
+        def side_comp(side_id):
+            return '; '.join(army_comp(army) for army in battle_armies if self.battle.sides[army['owner']] == side_id)
+        self.dirty.battle({
+            "id": _battle_record_id(self.aggressor['id'], self.defender['id'], battle_armies),
+            "aggressor": self.aggressor['id'],
+            "defender": self.defender['id'],
+            "winner": None,
+            "armies": battle_armies,
+            "sides": dict(self.battle.sides),
+            "log": []
+        })
+        self.dirty.persist()
         return {
             "success": True,
             "message": (
                 "Battle initiated! The placement phase begins.\n"
-                f"Aggressor Army: {army_comp(aggressor_army)}\n"
-                f"Defender Army: {army_comp(defender_army)}"
+                f"Aggressor Army: {side_comp(self.aggressor['id'])}\n"
+                f"Defender Army: {side_comp(self.defender['id'])}"
             ),
             "battle": self.battle
         }
@@ -654,17 +946,53 @@ class GameState:
 class GameManager:
     def __init__(self):
         self.games = {}
-        # Global player data (accessible from any channel)
-        self.global_players = {}
+        # Thread ids with a checkpoint on disk, read on first use
+        self._threads = None
+        # Per thread: the battle its log segment holds the log of, and how many records it has
+        self._log_segments = {}
+        # Global player data (accessible from any channel), least recently used first
+        self.global_players = OrderedDict()
+        # Each player's armies by id, in the order of their army list
+        self._army_index = {}
+        # Global records changed by the current command, not yet persisted
+        self.dirty = DirtyRecords()
+
+    def _armies_by_id(self, player_id):
+        index = self._army_index.get(player_id)
+        if index is None:
+            index = self._army_index[player_id] = {
+                army['id']: army for army in self._ensure_player(player_id)["armies"]}
+        return index
 
     def _ensure_player(self, player_id):
-        """Ensure a player exists in global system."""
-        if player_id not in self.global_players:
-            self.global_players[player_id] = {
-                "armies": [],
-                "resources": self._create_initial_resources()
-            }
-        return self.global_players[player_id]
+        """Ensure a player exists in global system, restoring their stored record on first use."""
+        player = self.global_players.get(player_id)
+        if player is not None:
+            self.global_players.move_to_end(player_id)
+            return player
+        player = self.global_players[player_id] = self._load_player(player_id)
+        # Every change is persisted as its command ends, so a dropped player reads back as they were.
+        while len(self.global_players) > PLAYER_CACHE_SIZE:
+            idle, _ = self.global_players.popitem(last=False)
+            self._army_index.pop(idle, None)
+        return player
+
+    def _load_player(self, player_id):
+        # Players are read from the store one at a time, when first needed, and the least recently used
+        # are dropped again, so only active players are held.
+        armies, resources = [], None
+        try:
+            from utils.sheets_sync import load_player
+            armies, resources = load_player(player_id)
+        except Exception as e:
+            print(f"[Local Store] Failed to restore player {player_id}: {e}")
+        for army in armies:
+            for unit in army['units']:
+                unit['type'] = resolve_unit_type(unit['type']) or unit['type']
+        return {
+            "armies": sorted(armies, key=lambda army: army['id']),
+            "resources": resources if resources is not None else self._create_initial_resources()
+        }
 
     def _create_initial_resources(self):
         """Create default resource allocation for a new player."""
@@ -699,21 +1027,95 @@ class GameManager:
         }
 
     def create_game(self, channel_id, aggressor, defender):
-        if channel_id in self.games:
+        if self.get_game(channel_id):
             return None
         new_game = GameState(aggressor, defender)
         self.games[channel_id] = new_game
+        self.checkpoint(channel_id)
         return new_game
 
     def get_game(self, channel_id):
-        return self.games.get(channel_id)
+        game = self.games.get(channel_id)
+        if game is None and channel_id is not None:
+            game = self._load_game(channel_id)
+        return game
 
     def end_game(self, channel_id):
-        if channel_id in self.games:
+        if self.get_game(channel_id):
             del self.games[channel_id]
+            self._log_segments.pop(channel_id, None)
+            try:
+                from utils.sheets_sync import delete_checkpoint, set_active_battle_threads
+                delete_checkpoint(channel_id)
+                self._checkpointed().discard(str(channel_id))
+                set_active_battle_threads(self._checkpointed())
+            except Exception as e:
+                print(f"[Local Store] Failed to drop checkpoint: {e}")
             return True
         return False
 
+    def checkpoint(self, channel_id):
+        """Write the game in this thread to its binary checkpoint; call after every change.
+
+        The battle log goes to a log segment that only gets the events added
+        since the last checkpoint, so an action costs the same however long
+        the battle has run; the segment is rewritten whole for a new battle
+        and every ``LOG_SEGMENT_RECORDS`` checkpoints.
+        """
+        game = self.games.get(channel_id)
+        if game is None:
+            return
+        try:
+            from game.checkpoint import encode_game, encode_log
+            from utils.sheets_sync import save_checkpoint, save_log_segment, set_active_battle_threads
+            battle = game.battle
+            if battle is None:
+                # The segment on disk is ignored without a battle, and rewritten for the next one.
+                self._log_segments.pop(channel_id, None)
+            else:
+                segment = self._log_segments.get(channel_id)
+                if segment is None or segment[0] is not battle or segment[1] >= LOG_SEGMENT_RECORDS:
+                    save_log_segment(channel_id, encode_log(battle, 0, battle.log))
+                    self._log_segments[channel_id] = [battle, 1]
+                else:
+                    start, events = battle.log.unsaved()
+                    if events:
+                        save_log_segment(channel_id, encode_log(battle, start, events), append=True)
+                        segment[1] += 1
+                battle.log.mark_saved()
+            save_checkpoint(channel_id, encode_game(game, log=False))
+            threads = self._checkpointed()
+            if str(channel_id) not in threads:
+                threads.add(str(channel_id))
+                set_active_battle_threads(threads)
+        except Exception as e:
+            print(f"[Local Store] Failed to checkpoint game {channel_id}: {e}")
+
+    def _checkpointed(self):
+        # Thread ids (as strings) that have a checkpoint on disk, read once per process.
+        if self._threads is None:
+            from utils.sheets_sync import get_active_battle_threads
+            self._threads = get_active_battle_threads()
+        return self._threads
+
+    def _load_game(self, channel_id):
+        # Games survive restarts as checkpoints; each is decoded the first time its thread is used.
+        try:
+            if str(channel_id) not in self._checkpointed():
+                return None
+            from game.checkpoint import decode_game
+            from utils.sheets_sync import load_checkpoint, load_log_segment
+            data = load_checkpoint(channel_id)
+            if data is None:
+                return None
+            # Not in _log_segments, so the next checkpoint rewrites the segment, dropping any record a
+            # crash cut short.
+            game = self.games[channel_id] = decode_game(data, load_log_segment(channel_id) or b'')
+            return game
+        except Exception as e:
+            print(f"[Local Store] Failed to restore game {channel_id}: {e}")
+            return None
+
     def end_battle(self, channel_id):
         game = self.get_game(channel_id)
         if not game or not game.battle:
@@ -724,27 +1126,37 @@ class GameManager:
             return {"success": False, "message": "Battle is not finished yet."}
         
         loser_id = game.defender['id'] if battle.winner == game.aggressor['id'] else game.aggressor['id']
-        
-        loser_armies = game.armies[loser_id]
-        battle_army_ids = [army['id'] for army in battle.armies if army['owner'] == loser_id]
-        
-        game.armies[loser_id] = [army for army in loser_armies if army['id'] not in battle_army_ids]
 
-        # Sync battle result to Google Sheets
-        try:
-            from utils.sheets_sync import sync_battle
-            sync_battle({
-                "id": f"{game.aggressor['id']}_{battle.armies[0]['id']}_vs_{game.defender['id']}_{battle.armies[1]['id']}",
-                "aggressor": game.aggressor['id'],
-                "defender": game.defender['id'],
-                "winner": battle.winner if hasattr(battle, 'winner') else None,
-                "armies": battle.armies,
-                "log": getattr(battle, 'log', [])
-            })
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync battle result: {e}")
+        # Every army that fought on the losing side is lost, allies' included.
+        lost = [(army['owner'], army['id']) for army in battle.armies if battle.sides.get(army['owner']) == loser_id]
+        removed = list(lost)
+        # Practice games give the bot a fresh army, which is not kept after the battle whoever wins.
+        if game.bot_difficulty is not None:
+            removed += [(army['owner'], army['id']) for army in battle.armies
+                        if army['owner'] == game.defender['id'] and game.defender['id'] != loser_id]
+        self.remove_global_armies(removed)
+        lost_ids = {army_id for owner, army_id in lost if owner == loser_id}
+        game.armies[loser_id] = [army for army in game.armies[loser_id] if army['id'] not in lost_ids]
+        # Allies whose armies were all lost leave the war; the rest keep fighting with what survived.
+        for ally_id, ally in list(game.allies.items()):
+            ally['armies'] = [army_id for army_id in ally['armies'] if (ally_id, army_id) not in lost]
+            if not ally['armies']:
+                del game.allies[ally_id]
+
+        # The result and the lost armies are stored together
+        self.dirty.battle({
+            "id": _battle_record_id(game.aggressor['id'], game.defender['id'], battle.armies),
+            "aggressor": game.aggressor['id'],
+            "defender": game.defender['id'],
+            "winner": battle.winner if hasattr(battle, 'winner') else None,
+            "armies": battle.armies,
+            "sides": dict(battle.sides),
+            "log": battle.log.export()
+        })
+        self.dirty.persist()
 
         game.battle = None
+        self.checkpoint(channel_id)
 
         return {"success": True, "message": "Battle concluded. Defeated army has been removed."}
 
@@ -757,8 +1169,10 @@ class GameManager:
     def add_global_army(self, player_id):
         """Add an army to a player in global system."""
         player = self._ensure_player(player_id)
+        index = self._armies_by_id(player_id)
         army = {
-            "id": len(player["armies"]) + 1,
+            # Follow the highest id in use so a disbanded army's id never clashes with a live one
+            "id": max(index, default=0) + 1,
             "owner": player_id,
             "units": [
                 {"type": UnitType.INFANTRY, "count": 5},
@@ -766,29 +1180,36 @@ class GameManager:
             ],
         }
         player["armies"].append(army)
-        try:
-            from utils.sheets_sync import sync_army
-            sync_army(army)
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync army: {e}")
+        index[army['id']] = army
+        self.dirty.army(army)
+        self.dirty.persist()
         return army
 
     def get_global_army(self, player_id, army_id):
         """Get a specific army from global system."""
-        player = self._ensure_player(player_id)
-        for army in player["armies"]:
-            if army['id'] == army_id:
-                return army
-        return None
+        return self._armies_by_id(player_id).get(army_id)
+
+    def remove_global_armies(self, armies):
+        """Remove armies given as (player_id, army_id) pairs and return how many players lost one.
+
+        Each army is dropped from the id index directly and each affected
+        player's army list is rebuilt once, however many armies they lost.
+        """
+        touched = set()
+        for player_id, army_id in armies:
+            if self._armies_by_id(player_id).pop(army_id, None) is not None:
+                touched.add(player_id)
+                self.dirty.removed_army(player_id, army_id)
+        for player_id in touched:
+            self.global_players[player_id]["armies"] = list(self._army_index[player_id].values())
+        return len(touched)
 
     def disband_global_army(self, player_id, army_id):
         """Disband an army from global system."""
         player = self._ensure_player(player_id)
-        armies = player["armies"]
-        initial_len = len(armies)
-        player["armies"] = [a for a in armies if a['id'] != army_id]
-        if len(player["armies"]) == initial_len:
+        if not self.remove_global_armies([(player_id, army_id)]):
             return {"success": False, "message": f"Army #{army_id} not found."}
+        self.dirty.persist()
         
         remaining = player["armies"]
         if not remaining:
@@ -796,12 +1217,6 @@ class GameManager:
         def unit_display_name(unit_type):
             return unit_type.value if hasattr(unit_type, 'value') else str(unit_type)
         army_list = '\n'.join(f"Army #{a['id']}: " + ', '.join(f"{u['count']} {unit_display_name(u['type'])}" for u in a['units']) for a in remaining)
-        try:
-            from utils.sheets_sync import sync_army
-            for a in remaining:
-                sync_army(a)
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync armies after disband: {e}")
         return {"success": True, "message": f"Army #{army_id} has been disbanded.\nYour remaining armies:\n{army_list}"}
 
     def modify_global_army(self, player_id, army_id, modification, quantity: int = 1):
@@ -853,17 +1268,17 @@ class GameManager:
             player_resources[resource] -= amount
 
         for new_unit in new_units:
-            existing_unit = next((u for u in army['units'] if u['type'] == new_unit['type']), None)
+            # Stored armies hold UnitType members, new units plain names; compare what they resolve to.
+            new_type = resolve_unit_type(new_unit['type'])
+            existing_unit = next((u for u in army['units'] if resolve_unit_type(u['type']) is new_type), None)
             if existing_unit:
                 existing_unit['count'] += new_unit['count']
             else:
                 army['units'].append(new_unit)
 
-        try:
-            from utils.sheets_sync import sync_army
-            sync_army(army)
-        except Exception as e:
-            print(f"[Sheets Sync] Failed to sync army: {e}")
+        self.dirty.army(army)
+        self.dirty.player_resources(player_id, player_resources)
+        self.dirty.persist()
 
         # Detailed info: show new army composition and resources
         def unit_display_name(unit_type):
@@ -906,6 +1321,8 @@ class GameManager:
                         res[key] = max(0, iv)
                 except (ValueError, TypeError):
                     return {"success": False, "message": f"Invalid value for {key}."}
+        self.dirty.player_resources(player_id, res)
+        self.dirty.persist()
         return {"success": True, "resources": dict(res), "message": "Resources updated."}
 
     def add_global_resources(self, player_id, **kwargs):
@@ -922,6 +1339,8 @@ class GameManager:
                     res[key] = max(0, res.get(key, 0) + iv)
                 except (ValueError, TypeError):
                     return {"success": False, "message": f"Invalid delta for {key}."}
+        self.dirty.player_resources(player_id, res)
+        self.dirty.persist()
         return {"success": True, "resources": dict(res), "message": "Resources adjusted."}
 
     def spawn_global_resource(self, player_id, resource_type: str, tile_count: int = 1):
@@ -939,6 +1358,8 @@ class GameManager:
         res["labor"] -= tile_count
         res[resource_type] = res.get(resource_type, 0) + tile_count
         
+        self.dirty.player_resources(player_id, res)
+        self.dirty.persist()
         return {"success": True, "message": f"Spawned {tile_count} {resource_type} using {tile_count} labor."}
 
     def craft_global_bronze(self, player_id, amount: int = 1):
@@ -959,6 +1380,8 @@ class GameManager:
         res["tin"] -= tin_needed
         res["bronze"] = res.get("bronze", 0) + bronze_produced
         
+        self.dirty.player_resources(player_id, res)
+        self.dirty.persist()
         return {"success": True, "message": f"Crafted {bronze_produced} bronze from {copper_needed} copper and {tin_needed} tin."}
 
     def add_global_unique_resource(self, player_id, resource_name: str, description: str):
@@ -970,6 +1393,8 @@ class GameManager:
             res["unique_resources"] = {}
         
         res["unique_resources"][resource_name] = description
+        self.dirty.player_resources(player_id, res)
+        self.dirty.persist()
         return {"success": True, "message": f"Added unique resource: {resource_name}"}
 
 
@@ -0,0 +1,117 @@
+"""Reachability tables for move generation.
+
+Per-cell lookups (neighbours, straight rays and movement regions) are
+worked out on demand, so a board of any size costs nothing up front:
+rays are ``range`` objects, neighbours are remembered for the cells that
+are used and regions are not kept at all. ``ReachCache`` memoizes the BFS
+result for each (cell, movement, cardinal_only) and drops only the entries
+whose region contains a tile whose occupancy changed.
+"""
+from functools import lru_cache
+
+# Row-major (dx, dy) steps: north, east, south, west.
+_STEPS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+# Board shapes whose tables are kept; battles mostly use one or two.
+TABLES_CACHE_SIZE = 8
+
+
+class ReachTables:
+    """Per-cell lookups for one board shape. Cells are row-major indexes."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._neighbors = {}
+
+    def neighbors(self, cell):
+        """Cells one orthogonal step from ``cell``."""
+        found = self._neighbors.get(cell)
+        if found is None:
+            y, x = divmod(cell, self.width)
+            found = self._neighbors[cell] = tuple(
+                (y + dy) * self.width + x + dx for dx, dy in _STEPS
+                if 0 <= x + dx < self.width and 0 <= y + dy < self.height
+            )
+        return found
+
+    def rays(self, cell):
+        """The cells in a straight line from ``cell`` to the edge, nearest first, in each step direction."""
+        width = self.width
+        row = cell - cell % width
+        return (range(cell - width, -1, -width), range(cell + 1, row + width),
+                range(cell + width, width * self.height, width), range(cell - 1, row - 1, -1))
+
+    def region(self, cell, movement):
+        """Cells within ``movement`` steps of ``cell`` (Manhattan distance), including the cell itself."""
+        y, x = divmod(cell, self.width)
+        return [
+            ty * self.width + tx
+            for ty in range(max(0, y - movement), min(self.height, y + movement + 1))
+            for tx in range(max(0, x - movement), min(self.width, x + movement + 1))
+            if abs(tx - x) + abs(ty - y) <= movement
+        ]
+
+
+@lru_cache(maxsize=TABLES_CACHE_SIZE)
+def reach_tables(width, height):
+    """Shared ReachTables for a board shape."""
+    return ReachTables(width, height)
+
+
+class ReachCache:
+    """Memoized reachable-tile sets for one battle, invalidated per changed tile."""
+
+    def __init__(self, width, height):
+        self.tables = reach_tables(width, height)
+        self._reach = {}
+        # cell -> cache keys whose result depends on that cell's occupancy
+        self._dependents = {}
+
+    def reachable(self, cell, movement, cardinal_only, is_occupied):
+        """Cells a unit on ``cell`` can move to; ``is_occupied(cell)`` reports blockers.
+
+        Units move through empty tiles only. Cardinal-only units move in a
+        straight line.
+        """
+        key = (cell, movement, cardinal_only)
+        reach = self._reach.get(key)
+        if reach is None:
+            reach = self._search(cell, movement, cardinal_only, is_occupied)
+            self._reach[key] = reach
+            for dependency in self.tables.region(cell, movement):
+                self._dependents.setdefault(dependency, set()).add(key)
+        return reach
+
+    def invalidate(self, cell):
+        """Forget every result that depended on ``cell``."""
+        for key in self._dependents.pop(cell, ()):
+            self._reach.pop(key, None)
+
+    def clear(self):
+        self._reach.clear()
+        self._dependents.clear()
+
+    def _search(self, cell, movement, cardinal_only, is_occupied):
+        if cardinal_only:
+            reach = []
+            for ray in self.tables.rays(cell):
+                for target in ray[:movement]:
+                    if is_occupied(target):
+                        break
+                    reach.append(target)
+            return tuple(sorted(reach))
+
+        neighbors = self.tables.neighbors
+        seen = {cell}
+        frontier = [cell]
+        for _ in range(movement):
+            next_frontier = []
+            for current in frontier:
+                for target in neighbors(current):
+                    if target not in seen and not is_occupied(target):
+                        seen.add(target)
+                        next_frontier.append(target)
+            frontier = next_frontier
+        seen.discard(cell)
+        return tuple(sorted(seen))
@@ -0,0 +1,192 @@
+"""Rebuild past positions of a battle from its log.
+
+``BattleReplay`` reads ``Battle.log`` events (place, move, turn, damage,
+destroy, end_turn, end and forfeit) once and stores a compact keyframe of
+the position every ``keyframe_interval`` events. Seeking to any event
+decodes the nearest earlier keyframe and applies only the events after it.
+
+Logs loaded back from JSON work too: unit types and orientations may be
+enum members or their string values.
+"""
+from bisect import bisect_right
+
+from game.board import (ORIENTATIONS, ORIENTATION_CODES, STATUSES, STATUS_CODES, UNIT_TYPES, UNIT_TYPE_CODES,
+                        make_board)
+from game.enums import Orientation, Phase, UnitStatus
+from game.units import resolve_unit_type
+
+PHASES = tuple(Phase)
+PHASE_CODES = {p: i for i, p in enumerate(PHASES)}
+
+
+class ReplayState:
+    """A battle position as seen by the replay: units by cell plus turn bookkeeping.
+
+    ``units`` maps a cell index (``y * width + x``) to a list of
+    [unit_type, owner, orientation, status, has_acted].
+    """
+
+    __slots__ = ('width', 'height', 'units', 'phase', 'turn', 'winner', 'placed')
+
+    def __init__(self, width, height, units=None, phase=Phase.PLACEMENT, turn=0, winner=None, placed=0):
+        self.width = width
+        self.height = height
+        self.units = units if units is not None else {}
+        self.phase = phase
+        self.turn = turn
+        self.winner = winner
+        self.placed = placed
+
+    def to_board(self, kind='dict'):
+        """Return a fresh board of the given backend holding this position."""
+        board = make_board(kind, self.width, self.height)
+        for cell, (unit_type, owner, orientation, status, has_acted) in sorted(self.units.items()):
+            y, x = divmod(cell, self.width)
+            board.place(x, y, unit_type, owner, orientation, status, has_acted)
+        return board
+
+
+class BattleReplay:
+    """Seekable view of a battle's history.
+
+    ``position(n)`` is the state after the first ``n`` log events, so
+    ``position(0)`` is the empty board and ``position(len(log))`` the
+    current one. Call ``sync`` after the log grows or is rolled back with
+    ``Battle.unmake``; only the changed tail is processed again.
+    """
+
+    def __init__(self, log, aggressor_id, defender_id, width=9, height=9, total_units=None, keyframe_interval=32,
+                 sides=None):
+        self.log = log
+        self.aggressor_id = aggressor_id
+        self.defender_id = defender_id
+        # Allies place units for their side; see Battle.sides
+        self.sides = sides or {}
+        self.width = width
+        self.height = height
+        self.total_units = total_units
+        self.keyframe_interval = keyframe_interval
+        # Keyframes sorted by event index; index 0 is always the empty board.
+        self._keyframe_events = [0]
+        self._keyframes = [self._encode(ReplayState(width, height))]
+        # Event index at which each turn starts: turn n begins after the (n - 1)th end_turn.
+        self._turn_starts = [0]
+        self._tail = ReplayState(width, height)
+        self._seen = 0
+        self.sync()
+
+    @classmethod
+    def from_battle(cls, battle, keyframe_interval=32):
+        return cls(battle.log, battle.aggressor_id, battle.defender_id, battle.board.width, battle.board.height,
+                   battle.total_unit_count, keyframe_interval, battle.sides)
+
+    def __len__(self):
+        return len(self.log)
+
+    @property
+    def turns(self):
+        """Number of turns started so far, counting the placement phase as turn 0."""
+        return len(self._turn_starts)
+
+    def sync(self):
+        """Bring the keyframes in line with the log after events were appended or rolled back."""
+        if self._seen > len(self.log):
+            # The log was truncated; drop what came after and restart from the last keyframe still valid.
+            keep = bisect_right(self._keyframe_events, len(self.log))
+            del self._keyframe_events[keep:]
+            del self._keyframes[keep:]
+            self._seen = self._keyframe_events[-1]
+            del self._turn_starts[bisect_right(self._turn_starts, self._seen):]
+            self._tail = self._decode(self._keyframes[-1])
+        for index in range(self._seen, len(self.log)):
+            event = self.log[index]
+            self._apply(self._tail, event)
+            if event['type'] == 'end_turn':
+                self._turn_starts.append(index + 1)
+            if (index + 1) % self.keyframe_interval == 0:
+                self._keyframe_events.append(index + 1)
+                self._keyframes.append(self._encode(self._tail))
+        self._seen = len(self.log)
+
+    def position(self, event_index):
+        """Return the ReplayState after the first ``event_index`` events."""
+        if not 0 <= event_index <= self._seen:
+            raise IndexError(f"Event index {event_index} is outside the replay (0-{self._seen}).")
+        if event_index == self._seen:
+            return self._decode(self._encode(self._tail))
+        slot = bisect_right(self._keyframe_events, event_index) - 1
+        state = self._decode(self._keyframes[slot])
+        for index in range(self._keyframe_events[slot], event_index):
+            self._apply(state, self.log[index])
+        return state
+
+    def board_at(self, event_index, kind='dict'):
+        return self.position(event_index).to_board(kind)
+
+    def turn_start(self, turn):
+        """Event index at which ``turn`` begins (turn 0 is placement and the aggressor's first turn)."""
+        if not 0 <= turn < len(self._turn_starts):
+            raise IndexError(f"Turn {turn} has not been played (0-{len(self._turn_starts) - 1}).")
+        return self._turn_starts[turn]
+
+    def position_at_turn(self, turn):
+        return self.position(self.turn_start(turn))
+
+    def _apply(self, state, event):
+        kind = event['type']
+        width = self.width
+        if kind == 'place':
+            orientation = event.get('orientation') or Orientation.NORTH
+            state.units[event['y'] * width + event['x']] = [
+                resolve_unit_type(event['unit_type']), self.sides.get(event['player_id'], event['player_id']),
+                Orientation(orientation), UnitStatus.HEALTHY, False]
+            state.placed += 1
+            if self.total_units is not None and state.placed >= self.total_units:
+                state.phase = Phase.BATTLE
+        elif kind == 'move':
+            unit = state.units.pop(event['from_y'] * width + event['from_x'])
+            unit[4] = True
+            state.units[event['to_y'] * width + event['to_x']] = unit
+            state.phase = Phase.BATTLE
+        elif kind == 'turn':
+            unit = state.units[event['y'] * width + event['x']]
+            unit[2] = Orientation(event['orientation'])
+            unit[4] = True
+            state.phase = Phase.BATTLE
+        elif kind == 'damage':
+            state.units[event['y'] * width + event['x']][3] = UnitStatus.DAMAGED
+        elif kind == 'destroy':
+            state.units.pop(event['y'] * width + event['x'], None)
+        elif kind == 'end_turn':
+            for unit in state.units.values():
+                if unit[1] != event['player_id']:
+                    unit[4] = False
+            state.turn += 1
+            state.phase = Phase.BATTLE
+        elif kind in ('end', 'forfeit'):
+            state.phase = Phase.ENDED
+            state.winner = event.get('winner')
+            if state.winner is None and kind == 'forfeit':
+                state.winner = self.defender_id if event['player_id'] == self.aggressor_id else self.aggressor_id
+
+    # Keyframes: a header of phase, winner slot, turn and placement count, then six bytes
+    # per unit (two for the cell, owner slot, type, orientation, status and acted flag).
+    def _encode(self, state):
+        winner = 0 if state.winner is None else 1 if state.winner == self.aggressor_id else 2
+        data = bytearray((PHASE_CODES[state.phase], winner))
+        data += state.turn.to_bytes(4, 'little') + state.placed.to_bytes(4, 'little')
+        for cell, (unit_type, owner, orientation, status, has_acted) in sorted(state.units.items()):
+            data += cell.to_bytes(2, 'little')
+            data += bytes((1 if owner == self.aggressor_id else 2, UNIT_TYPE_CODES[unit_type],
+                           ORIENTATION_CODES[orientation], STATUS_CODES[status] | (has_acted << 4)))
+        return bytes(data)
+
+    def _decode(self, data):
+        winner = (None, self.aggressor_id, self.defender_id)[data[1]]
+        units = {}
+        for i in range(10, len(data), 6):
+            slot, unit_type, orientation, flags = data[i + 2:i + 6]
+            units[data[i] | data[i + 1] << 8] = [UNIT_TYPES[unit_type], self.aggressor_id if slot == 1 else self.defender_id,
+                           ORIENTATIONS[orientation], STATUSES[flags & 0xF], bool(flags >> 4)]
+        return ReplayState(self.width, self.height, units, PHASES[data[0]], int.from_bytes(data[2:6], 'little'),
+                           winner, int.from_bytes(data[6:10], 'little'))
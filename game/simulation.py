@@ -0,0 +1,475 @@
+"""Headless battle simulation.
+
+Builds Battle objects from army compositions and plays them out with
+pluggable policies, without Discord. ``run_batch`` spreads games over a
+multiprocessing pool and yields one result record per game as it finishes.
+
+Determinism contract: a game depends only on its job (armies, policies,
+board, size, max_turns) and its seed. All randomness comes from one
+``random.Random(seed)`` per game, never from the clock, worker or hash
+seed, so any record can be played again with ``replay``. Jobs from
+``make_jobs`` get independent seeds derived with ``derive_seed``; with
+``record`` set, a job's record also carries the action stream it played
+and a fingerprint of the final battle, which ``replay`` checks.
+
+Run ``python -m game.simulation --help`` for a command line front end.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from game.board import DIRECTION_DELTAS
+from game.enums import Orientation, Phase, UnitType
+from game.game_manager import Battle
+from game.units import IMMUNE_AGAINST, UNIT_SPECS, resolve_unit_type
+
+AGGRESSOR_ID = 1
+DEFENDER_ID = 2
+
+# Unit compositions use the same {'type', 'count'} format as army dicts.
+DEFAULT_ARMY = [
+    {"type": UnitType.INFANTRY, "count": 5},
+    {"type": UnitType.COMMANDER, "count": 1},
+]
+
+
+class SimulationError(Exception):
+    """Raised when a policy asks for an action the engine rejects."""
+
+
+def build_battle(aggressor_units, defender_units, board='bitboard',
+                 aggressor_id=AGGRESSOR_ID, defender_id=DEFENDER_ID, size=9):
+    """Create a Battle in the placement phase from two unit compositions.
+
+    The compositions are copied, so the caller's lists are never mutated.
+    """
+    armies = [
+        {"id": 1, "owner": aggressor_id,
+         "units": [{"type": resolve_unit_type(u['type']), "count": int(u['count'])} for u in aggressor_units]},
+        {"id": 1, "owner": defender_id,
+         "units": [{"type": resolve_unit_type(u['type']), "count": int(u['count'])} for u in defender_units]},
+    ]
+    return Battle(aggressor_id, defender_id, armies, board=board, width=size, height=size)
+
+
+def deployment_tiles(battle, player_id):
+    """Free tiles in the player's deployment zone, in row-major order."""
+    first_row, last_row = battle.deployment_zones[player_id]
+    width = battle.board.width
+    taken = {(x, y) for x, y, _ in battle.board.units_in(0, first_row, width - 1, last_row)}
+    return [(x, y) for y in range(first_row, last_row + 1) for x in range(width) if (x, y) not in taken]
+
+
+def opponent_of(battle, player_id):
+    return battle.defender_id if player_id == battle.aggressor_id else battle.aggressor_id
+
+
+def derive_seed(seed, *keys):
+    """Reproducible 64-bit seed for the sub-stream ``keys`` of ``seed`` (e.g. one per game).
+
+    Streams for different keys are independent, unlike consecutive seeds,
+    and do not depend on which worker or process asks for them.
+    """
+    digest = hashlib.blake2b(repr((seed,) + keys).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def battle_fingerprint(battle):
+    """Hex digest of a battle's full log and final position; equal for bit-for-bit identical runs."""
+    data = json.dumps(battle.log.export(), default=str, separators=(',', ':'))
+    return hashlib.sha256(f"{data}|{battle.zobrist:x}|{battle.phase.value}|{battle.winner}".encode('utf-8')).hexdigest()
+
+
+def apply_action(battle, player_id, action):
+    """Apply an action tuple through the public Battle API.
+
+    Accepts the Battle.legal_actions tuples plus ('end_turn',) and
+    ('place', unit_type, x, y, orientation).
+    """
+    if action[0] == 'move':
+        return battle.move_unit(player_id, *action[1:])
+    if action[0] == 'turn':
+        return battle.turn_unit(player_id, *action[1:])
+    if action[0] == 'end_turn':
+        return battle.end_turn(player_id)
+    if action[0] == 'place':
+        return battle.place_unit(player_id, *action[1:])
+    raise SimulationError(f"Unknown action {action!r}")
+
+
+class Policy:
+    """Decides placements and actions for one side of a simulated battle."""
+
+    name = 'base'
+
+    def place(self, battle, player_id, rng):
+        """Return (unit_type, x, y, orientation) for the next placement."""
+        remaining = [t for t, n in battle.remaining_units[player_id].items() if n > 0]
+        tiles = deployment_tiles(battle, player_id)
+        if not remaining or not tiles:
+            raise SimulationError(f"Player {player_id} cannot place any more units.")
+        x, y = rng.choice(tiles)
+        facing = 'north' if player_id == battle.aggressor_id else 'south'
+        return rng.choice(remaining), x, y, facing
+
+    def act(self, battle, player_id, rng):
+        """Return the next action tuple, or None to end the turn."""
+        return None
+
+
+class RandomPolicy(Policy):
+    """Places units at random and plays random legal actions."""
+
+    name = 'random'
+
+    def __init__(self, end_turn_chance=0.2):
+        self.end_turn_chance = end_turn_chance
+
+    def act(self, battle, player_id, rng):
+        actions = battle.legal_actions(player_id)
+        if not actions or rng.random() < self.end_turn_chance:
+            return None
+        return rng.choice(actions)
+
+
+class GreedyPolicy(Policy):
+    """Plays the single action that most improves one unit's position.
+
+    A position is scored by the attack it sets up on the tile it faces, the
+    enemy attacks aimed at it and its distance to the nearest enemy. Each
+    turn the policy keeps taking the best improving action and ends the
+    turn when none is left.
+    """
+
+    name = 'greedy'
+
+    def place(self, battle, player_id, rng):
+        unit_type, x, y, facing = super().place(battle, player_id, rng)
+        remaining = battle.remaining_units[player_id]
+        tiles = deployment_tiles(battle, player_id)
+        first_row, last_row = battle.deployment_zones[player_id]
+        front, back = (first_row, last_row) if player_id == battle.aggressor_id else (last_row, first_row)
+        # Commanders go in the back row, everything else in the front row first.
+        if unit_type != UnitType.COMMANDER and remaining.get(UnitType.COMMANDER):
+            unit_type = UnitType.COMMANDER
+        wanted = back if unit_type == UnitType.COMMANDER else front
+        preferred = [t for t in tiles if t[1] == wanted] or tiles
+        x, y = rng.choice(preferred)
+        return unit_type, x, y, facing
+
+    def act(self, battle, player_id, rng):
+        board = battle.board
+        enemy = opponent_of(battle, player_id)
+        enemies = {pos: board.get(*pos)['type'] for pos in battle.positions.get(enemy, ())}
+        if not enemies:
+            return None
+        # Tiles the enemy will attack at the end of this turn, and by which unit types.
+        threats = {}
+        for (ex, ey), enemy_type in enemies.items():
+            if UNIT_SPECS[enemy_type].can_attack:
+                dx, dy = DIRECTION_DELTAS[board.get(ex, ey)['orientation']]
+                threats.setdefault((ex + dx, ey + dy), []).append(enemy_type)
+        commanders = [pos for pos, t in enemies.items() if t == UnitType.COMMANDER] or list(enemies)
+
+        best, best_gain = None, 0
+        for action in battle.legal_actions(player_id):
+            x, y = action[1], action[2]
+            unit = board.get(x, y)
+            before = self._value(unit['type'], x, y, unit['orientation'], enemies, threats, commanders)
+            if action[0] == 'move':
+                after = self._value(unit['type'], action[3], action[4], unit['orientation'], enemies, threats, commanders)
+            else:
+                after = self._value(unit['type'], x, y, Orientation(action[3]), enemies, threats, commanders)
+            gain = after - before
+            if gain > best_gain or (gain == best_gain and best is not None and rng.random() < 0.5):
+                best, best_gain = action, gain
+        return best
+
+    @staticmethod
+    def _value(unit_type, x, y, orientation, enemies, threats, commanders):
+        score = 0.0
+        dx, dy = DIRECTION_DELTAS[orientation]
+        target = enemies.get((x + dx, y + dy))
+        if target is not None and UNIT_SPECS[unit_type].can_attack:
+            if target in IMMUNE_AGAINST[unit_type]:
+                score += 2
+            else:
+                score += 10 if target == UnitType.COMMANDER else 6
+        for attacker_type in threats.get((x, y), ()):
+            score -= 3 if unit_type in IMMUNE_AGAINST[attacker_type] else 7
+        nearest = min(abs(ex - x) + abs(ey - y) for ex, ey in enemies)
+        if unit_type == UnitType.COMMANDER:
+            return score + 0.2 * nearest
+        to_commander = min(abs(cx - x) + abs(cy - y) for cx, cy in commanders)
+        return score - 0.3 * nearest - 0.4 * to_commander
+
+
+class ScriptedPolicy(Policy):
+    """Replays a fixed list of placements and actions.
+
+    ``placements`` holds (unit_type, x, y, orientation) tuples. ``turns`` is a
+    list with one list of action tuples per turn; once a turn's script runs
+    out the policy ends the turn, and once all turns are used it only ends
+    turns. Placements fall back to the default random placement.
+    """
+
+    name = 'scripted'
+
+    def __init__(self, placements=(), turns=()):
+        self.placements = list(placements)
+        self.turns = [list(t) for t in turns]
+        self._placed = 0
+        self._turn = 0
+        self._step = 0
+
+    def place(self, battle, player_id, rng):
+        if self._placed < len(self.placements):
+            self._placed += 1
+            return self.placements[self._placed - 1]
+        return super().place(battle, player_id, rng)
+
+    def act(self, battle, player_id, rng):
+        if self._turn < len(self.turns) and self._step < len(self.turns[self._turn]):
+            self._step += 1
+            return self.turns[self._turn][self._step - 1]
+        self._turn += 1
+        self._step = 0
+        return None
+
+
+POLICIES = {
+    RandomPolicy.name: RandomPolicy,
+    GreedyPolicy.name: GreedyPolicy,
+    ScriptedPolicy.name: ScriptedPolicy,
+}
+
+
+def make_policy(spec):
+    """Build a policy from a name, a (name, kwargs) pair or an existing Policy."""
+    if isinstance(spec, Policy):
+        return spec
+    if isinstance(spec, str):
+        name, kwargs = spec, {}
+    else:
+        name, kwargs = spec
+    try:
+        return POLICIES[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown policy '{name}'. Choose from: {', '.join(POLICIES)}.")
+
+
+def play(battle, policies, rng, max_turns=200, stream=None):
+    """Play a battle to the end (or ``max_turns`` battle turns) and return a summary.
+
+    ``policies`` maps each player id to a Policy. If ``stream`` is a list,
+    every action is appended to it as an ``apply_action`` tuple, including
+    placements and turn ends, so ``replay_stream`` can play it again.
+    """
+    record = stream.append if stream is not None else lambda action: None
+    actions = 0
+    while battle.phase == Phase.PLACEMENT:
+        player = battle.current_player
+        unit_type, x, y, orientation = policies[player].place(battle, player, rng)
+        # Place by unit type enum and orientation string, so a stream read back
+        # from JSON logs exactly the same messages.
+        unit_type = resolve_unit_type(unit_type) or unit_type
+        if isinstance(orientation, Orientation):
+            orientation = orientation.value
+        record(('place', unit_type.value if isinstance(unit_type, UnitType) else unit_type, x, y, orientation))
+        result = battle.place_unit(player, unit_type, x, y, orientation)
+        if not result['success']:
+            raise SimulationError(f"Placement rejected: {result['message']}")
+
+    turns = 0
+    while battle.phase == Phase.BATTLE and turns < max_turns:
+        player = battle.current_player
+        # Every action uses up one unit, so a turn can never take more actions than units.
+        for _ in range(len(battle.positions.get(player, ())) + 1):
+            action = policies[player].act(battle, player, rng)
+            if action is None:
+                break
+            record(tuple(action))
+            result = apply_action(battle, player, action)
+            if not result['success']:
+                raise SimulationError(f"Action {action!r} rejected: {result['message']}")
+            actions += 1
+        record(('end_turn',))
+        battle.end_turn(player)
+        turns += 1
+
+    winner = battle.winner
+    return {
+        "winner": winner,
+        "turns": turns,
+        "actions": actions,
+        "finished": battle.phase == Phase.ENDED,
+        "units_left": {str(p): len(battle.positions.get(p, ())) for p in (battle.aggressor_id, battle.defender_id)},
+    }
+
+
+def simulate(job):
+    """Run one game described by a job dict and return its result record.
+
+    Job keys: ``aggressor`` and ``defender`` unit compositions, ``policies``
+    (pair of policy specs, default greedy vs greedy), ``seed``, ``board``,
+    ``size`` (board side length, default 9), ``max_turns``, an optional
+    ``game`` index copied into the record and ``record``: when true, the
+    record also holds the action ``stream`` and the battle ``fingerprint``.
+    """
+    started = time.perf_counter()
+    seed = job.get('seed')
+    rng = random.Random(seed)
+    aggressor_policy, defender_policy = (make_policy(p) for p in job.get('policies', ('greedy', 'greedy')))
+    battle = _job_battle(job)
+    record = {"game": job.get('game'), "seed": seed}
+    stream = [] if job.get('record') else None
+    try:
+        summary = play(battle, {battle.aggressor_id: aggressor_policy, battle.defender_id: defender_policy},
+                       rng, max_turns=job.get('max_turns', 200), stream=stream)
+    except SimulationError as e:
+        record.update({"winner": None, "finished": False, "error": str(e)})
+    else:
+        record.update(summary)
+        record["side"] = ('aggressor' if summary['winner'] == battle.aggressor_id
+                          else 'defender' if summary['winner'] == battle.defender_id else None)
+    if stream is not None:
+        record["stream"] = [list(action) for action in stream]
+        record["fingerprint"] = battle_fingerprint(battle)
+    record["elapsed"] = time.perf_counter() - started
+    return record
+
+
+def _job_battle(job):
+    return build_battle(job.get('aggressor', DEFAULT_ARMY), job.get('defender', DEFAULT_ARMY),
+                        board=job.get('board', 'bitboard'), size=job.get('size', 9))
+
+
+def replay_stream(job, stream):
+    """Rebuild the job's battle and apply a recorded action stream to it, without any policy or RNG.
+
+    Stops at the first rejected action, as the original run did. Returns the battle.
+    """
+    battle = _job_battle(job)
+    for action in stream:
+        if action[0] == 'place':
+            # play() placed by enum; the stream holds the unit type's value.
+            action = ('place', resolve_unit_type(action[1]) or action[1], *action[2:])
+        result = apply_action(battle, battle.current_player, tuple(action))
+        if not result['success']:
+            break
+    return battle
+
+
+def replay(job, record=None):
+    """Play a job again from its seed and return its record, for debugging or profiling a run.
+
+    Pass the original ``record`` (made with ``record`` set) to also check the
+    run is reproduced bit for bit: the recorded stream is applied to a fresh
+    battle and both it and the re-run must match the recorded fingerprint.
+    Raises SimulationError when they do not.
+    """
+    rerun = simulate(dict(job, record=True))
+    if record is not None and 'fingerprint' in record:
+        streamed = battle_fingerprint(replay_stream(job, record['stream']))
+        if rerun['fingerprint'] != record['fingerprint'] or streamed != record['fingerprint']:
+            raise SimulationError(f"Game {job.get('game')} with seed {job.get('seed')} did not replay identically.")
+    return rerun
+
+
+def run_batch(jobs, processes=None, chunksize=8, ordered=False, executor=None):
+    """Simulate every job and yield result records as games finish.
+
+    Uses one worker per CPU core by default; ``processes=1`` runs the games
+    in this process, which is handy for debugging and tests. ``ordered``
+    yields records in job order instead, so a caller that stops early has
+    played a prefix of the jobs. Pass a long-lived ``executor`` (e.g. a
+    ``ProcessPoolExecutor``) to reuse its workers instead of starting a pool;
+    its records always come in job order.
+    """
+    if executor is not None:
+        # Closing this generator early cancels the chunks not started yet.
+        yield from executor.map(simulate, jobs, chunksize=chunksize)
+        return
+    if processes == 1:
+        for job in jobs:
+            yield simulate(job)
+        return
+    with multiprocessing.Pool(processes or os.cpu_count()) as pool:
+        for record in (pool.imap if ordered else pool.imap_unordered)(simulate, jobs, chunksize):
+            yield record
+
+
+def make_jobs(games, aggressor=DEFAULT_ARMY, defender=DEFAULT_ARMY, policies=('greedy', 'greedy'),
+              seed=0, board='bitboard', max_turns=200, size=9, record=False):
+    """Yield ``games`` job dicts for the same matchup, each with its own seed derived from ``seed``."""
+    for game in range(games):
+        yield {"game": game, "seed": derive_seed(seed, game), "aggressor": aggressor, "defender": defender,
+               "policies": policies, "board": board, "max_turns": max_turns, "size": size, "record": record}
+
+
+def parse_units(text):
+    """Parse a unit composition written as "infantry:5,commander:1"."""
+    units = []
+    for part in text.split(','):
+        unit_type, _, count = part.partition(':')
+        units.append({"type": unit_type.strip(), "count": int(count or 1)})
+    return units
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless battle simulations.")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--aggressor', default='infantry:5,commander:1', help="e.g. infantry:5,shock:3,commander:1")
+    parser.add_argument('--defender', default='infantry:5,commander:1')
+    parser.add_argument('--policies', nargs=2, default=['greedy', 'greedy'], choices=sorted(POLICIES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board', default='bitboard', help="board backend; use sparse for large boards")
+    parser.add_argument('--size', type=int, default=9, help="board side length")
+    parser.add_argument('--max-turns', type=int, default=200)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--out', help="write JSON lines here instead of stdout")
+    parser.add_argument('--record', action='store_true', help="include each game's action stream and fingerprint")
+    parser.add_argument('--replay', type=int, metavar='GAME',
+                        help="play only this game again (same other arguments) and check it against --out")
+    args = parser.parse_args(argv)
+
+    jobs = make_jobs(args.games, parse_units(args.aggressor), parse_units(args.defender),
+                     tuple(args.policies), args.seed, args.board, args.max_turns, args.size, args.record)
+    if args.replay is not None:
+        return _replay_game(list(jobs)[args.replay], args.out)
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    wins = {'aggressor': 0, 'defender': 0, None: 0}
+    started = time.perf_counter()
+    try:
+        for record in run_batch(jobs, args.processes):
+            wins[record.get('side')] += 1
+            out.write(json.dumps(record) + '\n')
+    finally:
+        if args.out:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(f"{args.games} games in {elapsed:.1f}s: aggressor {wins['aggressor']}, "
+          f"defender {wins['defender']}, unfinished {wins[None]}", file=sys.stderr)
+
+
+def _replay_game(job, results_path):
+    # Find the game's original record, if the results file has one, and replay against it.
+    original = None
+    if results_path:
+        with open(results_path, encoding='utf-8') as f:
+            original = next((r for r in map(json.loads, f) if r.get('game') == job['game']), None)
+    record = replay(job, original)
+    status = "reproduced identically" if original and 'fingerprint' in original else "replayed"
+    print(f"Game {job['game']} (seed {job['seed']}) {status} in {record['elapsed']:.3f}s: "
+          f"winner {record.get('winner')}, {record.get('turns')} turns, fingerprint {record['fingerprint'][:16]}",
+          file=sys.stderr)
+    print(json.dumps(record))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+"""Round-robin and Swiss tournaments of simulated battles with Elo ratings.
+
+``Tournament`` pits roster entries (a name, a unit composition and a
+policy) against each other with ``simulation.run_batch``, so games are
+spread over a process pool. Each pairing plays ``games_per_pair`` games,
+the entries swapping aggressor and defender every game. Everything lands
+in an output directory as it happens:
+
+- ``tournament.json``: the roster and settings, checked when resuming;
+- ``results.jsonl``: one line per finished game, appended as games finish;
+- ``standings.csv``: ratings and scores, rewritten after every round.
+
+The results file doubles as the checkpoint. Running the same tournament
+into the same directory again skips every game already recorded and
+rebuilds the ratings from it, so a crash only loses the games in flight.
+
+Run ``python -m game.tournament --help`` for a command line front end.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from game.simulation import DEFAULT_ARMY, derive_seed, make_policy, parse_units, run_batch
+from game.win_probability import normalize_units
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+FORMATS = ('round-robin', 'swiss')
+
+
+class TournamentError(ValueError):
+    """Raised for an invalid roster or a results directory from a different tournament."""
+
+
+def load_roster(entries):
+    """Normalize roster entries to {'name', 'army', 'policy'}.
+
+    ``army`` may be a {'type', 'count'} list or a "infantry:5,commander:1"
+    string and defaults to the simulation's default army; ``policy`` is a
+    policy spec as accepted by ``simulation.make_policy`` (default greedy).
+    """
+    roster = []
+    for entry in entries:
+        name = entry.get('name')
+        army = entry.get('army', DEFAULT_ARMY)
+        if isinstance(army, str):
+            army = parse_units(army)
+        policy = entry.get('policy', 'greedy')
+        try:
+            make_policy(policy if isinstance(policy, str) else tuple(policy))
+            key = normalize_units(army)
+        except (TypeError, ValueError) as e:
+            raise TournamentError(f"Roster entry {name!r}: {e}")
+        if not name or not key:
+            raise TournamentError(f"Roster entry {name!r} needs a name and at least one unit.")
+        roster.append({"name": str(name), "army": [{"type": t, "count": int(c)} for t, c in
+                                                   (part.split(':') for part in key.split(','))],
+                       "policy": policy})
+    names = [entry['name'] for entry in roster]
+    if len(set(names)) != len(names):
+        raise TournamentError("Roster names must be unique.")
+    if len(names) < 2:
+        raise TournamentError("A tournament needs at least two entries.")
+    return roster
+
+
+def expected_score(rating, opponent_rating):
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+
+
+def round_robin_rounds(names):
+    """Pairings of every entry against every other, grouped into rounds by the circle method."""
+    players = list(names) + ([None] if len(names) % 2 else [])
+    rounds = []
+    for _ in range(len(players) - 1):
+        half = len(players) // 2
+        pairs = [(players[i], players[-1 - i]) for i in range(half)]
+        rounds.append([pair for pair in pairs if None not in pair])
+        # Keep the first player fixed and rotate the rest.
+        players = [players[0], players[-1]] + players[1:-1]
+    return rounds
+
+
+def swiss_pairings(standings, played, byes):
+    """Pair entries with close scores, avoiding rematches where possible.
+
+    ``standings`` lists names best first, ``played`` is a set of frozenset
+    pairs already met and ``byes`` the names that already sat a round out.
+    Returns (pairs, bye) where bye is None for an even field.
+    """
+    order = list(standings)
+    bye = None
+    if len(order) % 2:
+        bye = next((name for name in reversed(order) if name not in byes), order[-1])
+        order.remove(bye)
+    pairs = []
+    while order:
+        first = order.pop(0)
+        opponent = next((name for name in order if frozenset((first, name)) not in played), order[0])
+        order.remove(opponent)
+        pairs.append((first, opponent))
+    return pairs, bye
+
+
+class Tournament:
+    """A tournament between roster entries, written to and resumable from ``out_dir``."""
+
+    def __init__(self, roster, out_dir, format='round-robin', rounds=None, games_per_pair=2, seed=0,
+                 max_turns=200, board='bitboard', size=9, k_factor=K_FACTOR):
+        if format not in FORMATS:
+            raise TournamentError(f"Unknown format '{format}'. Choose from: {', '.join(FORMATS)}.")
+        self.roster = load_roster(roster)
+        self.entries = {entry['name']: entry for entry in self.roster}
+        self.out_dir = Path(out_dir)
+        self.settings = {
+            "format": format,
+            "rounds": rounds if format == 'swiss' else None,
+            "games_per_pair": games_per_pair,
+            "seed": seed,
+            "max_turns": max_turns,
+            "board": board,
+            "size": size,
+            "k_factor": k_factor,
+        }
+        if format == 'swiss' and not rounds:
+            # Enough rounds to separate the field, as in chess Swiss events.
+            self.settings['rounds'] = max(1, (len(self.roster) - 1).bit_length())
+
+        self.ratings = {name: INITIAL_RATING for name in self.entries}
+        self.scores = {name: 0.0 for name in self.entries}
+        # Games the engine failed to play are counted as errors, not draws, and leave ratings alone
+        self.tallies = {name: {"wins": 0, "losses": 0, "draws": 0, "errors": 0} for name in self.entries}
+        self.played = set()
+        self.byes = set()
+        self.rounds_done = 0
+        # Finished game records by key, including those read back on resume
+        self.results = {}
+
+    @property
+    def results_path(self):
+        return self.out_dir / "results.jsonl"
+
+    @property
+    def standings_path(self):
+        return self.out_dir / "standings.csv"
+
+    def standings(self):
+        """Entry names best first: by score, then rating, then name."""
+        return sorted(self.entries, key=lambda name: (-self.scores[name], -self.ratings[name], name))
+
+    def run(self, processes=None, progress=None):
+        """Play every game not yet recorded and return the final standings rows.
+
+        ``progress``, if given, is called with each new result record.
+        """
+        self._prepare()
+        if self.settings['format'] == 'round-robin':
+            self._play(list(enumerate(round_robin_rounds(list(self.entries)), 1)), processes, progress)
+        else:
+            for number in range(1, self.settings['rounds'] + 1):
+                pairs, bye = swiss_pairings(self.standings(), self.played, self.byes)
+                if bye is not None:
+                    self.byes.add(bye)
+                    self.scores[bye] += self.settings['games_per_pair']
+                self._play([(number, pairs)], processes, progress)
+        return self.table()
+
+    def table(self):
+        rows = []
+        for rank, name in enumerate(self.standings(), 1):
+            tally = self.tallies[name]
+            rows.append({"rank": rank, "name": name, "rating": round(self.ratings[name], 1), "score": self.scores[name],
+                         "games": tally['wins'] + tally['losses'] + tally['draws'], **tally})
+        return rows
+
+    def _jobs(self, number, pairs):
+        games = self.settings['games_per_pair']
+        for first, second in pairs:
+            for game in range(games):
+                aggressor, defender = (first, second) if game % 2 == 0 else (second, first)
+                key = f"{number}:{first}:{second}:{game}"
+                yield key, {
+                    "game": key,
+                    "seed": derive_seed(self.settings['seed'], key),
+                    "aggressor": self.entries[aggressor]['army'],
+                    "defender": self.entries[defender]['army'],
+                    "policies": (self.entries[aggressor]['policy'], self.entries[defender]['policy']),
+                    "board": self.settings['board'],
+                    "size": self.settings['size'],
+                    "max_turns": self.settings['max_turns'],
+                }, aggressor, defender
+
+    def _play(self, rounds, processes, progress):
+        """Play the missing games of ``rounds`` and apply each round, in order, once it is complete."""
+        order, meta, missing = [], {}, []
+        for number, pairs in rounds:
+            keys = []
+            for key, job, aggressor, defender in self._jobs(number, pairs):
+                keys.append(key)
+                meta[key] = (number, aggressor, defender)
+                if key not in self.results:
+                    missing.append(job)
+            order.append((number, pairs, keys))
+
+        def apply_ready():
+            while order and all(key in self.results for key in order[0][2]):
+                number, pairs, keys = order.pop(0)
+                self._apply_round(number, pairs, keys)
+
+        apply_ready()
+        if not missing:
+            return
+        with self.results_path.open("a", encoding="utf-8") as out:
+            for record in run_batch(iter(missing), processes, chunksize=1):
+                number, aggressor, defender = meta[record['game']]
+                winner = {'aggressor': aggressor, 'defender': defender}.get(record.get('side'))
+                result = {"key": record['game'], "round": number, "aggressor": aggressor, "defender": defender,
+                          "winner": winner, "turns": record.get('turns'), "finished": record.get('finished', False),
+                          "error": record.get('error'), "elapsed": round(record['elapsed'], 4)}
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                self.results[result['key']] = result
+                if progress:
+                    progress(result)
+                if order and all(key in self.results for key in order[0][2]):
+                    os.fsync(out.fileno())
+                    apply_ready()
+
+    def _apply_round(self, number, pairs, keys):
+        k = self.settings['k_factor']
+        # Elo is updated game by game in schedule order, so ratings do not depend on finishing order.
+        for key in keys:
+            result = self.results[key]
+            aggressor, defender = result['aggressor'], result['defender']
+            if result.get('error'):
+                self.tallies[aggressor]['errors'] += 1
+                self.tallies[defender]['errors'] += 1
+                continue
+            score = 0.5 if result['winner'] is None else 1.0 if result['winner'] == aggressor else 0.0
+            change = k * (score - expected_score(self.ratings[aggressor], self.ratings[defender]))
+            self.ratings[aggressor] += change
+            self.ratings[defender] -= change
+            self.scores[aggressor] += score
+            self.scores[defender] += 1.0 - score
+            if score == 0.5:
+                self.tallies[aggressor]['draws'] += 1
+                self.tallies[defender]['draws'] += 1
+            else:
+                winner, loser = (aggressor, defender) if score == 1.0 else (defender, aggressor)
+                self.tallies[winner]['wins'] += 1
+                self.tallies[loser]['losses'] += 1
+        self.played.update(frozenset(pair) for pair in pairs)
+        self.rounds_done = number
+        self._write_standings()
+
+    def _prepare(self):
+        """Create the output directory, or check it belongs to this tournament and read back its results."""
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        config_path = self.out_dir / "tournament.json"
+        config = {"roster": self.roster, "settings": self.settings}
+        if config_path.exists():
+            with config_path.open("r", encoding="utf-8") as f:
+                if json.load(f) != json.loads(json.dumps(config)):
+                    raise TournamentError(f"{self.out_dir} holds a different tournament; use another directory.")
+        else:
+            _write_atomic(config_path, json.dumps(config, indent=2))
+        self.results = self._read_results()
+
+    def _read_results(self):
+        try:
+            data = self.results_path.read_bytes()
+        except FileNotFoundError:
+            return {}
+        # A crash can leave half a line at the end; drop it so new lines start cleanly.
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):
+            with self.results_path.open("r+b") as f:
+                f.truncate(len(complete))
+        results = {}
+        for line in complete.decode("utf-8").splitlines():
+            if line.strip():
+                result = json.loads(line)
+                results[result['key']] = result
+        return results
+
+    def _write_standings(self):
+        rows = self.table()
+        fields = ["rank", "name", "rating", "score", "games", "wins", "losses", "draws", "errors"]
+        tmp = self.standings_path.with_suffix(".csv.tmp")
+        with tmp.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        tmp.replace(self.standings_path)
+
+
+def _write_atomic(path, text):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+    tmp.replace(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a tournament of simulated battles with Elo ratings.")
+    parser.add_argument('roster', help="JSON file with a list of {name, army, policy} entries")
+    parser.add_argument('--out', required=True, help="directory for results; rerun with the same one to resume")
+    parser.add_argument('--format', choices=FORMATS, default='round-robin')
+    parser.add_argument('--rounds', type=int, default=None, help="Swiss rounds (default: log2 of the field)")
+    parser.add_argument('--games-per-pair', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board', default='bitboard')
+    parser.add_argument('--size', type=int, default=9)
+    parser.add_argument('--max-turns', type=int, default=200)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    with open(args.roster, encoding='utf-8') as f:
+        roster = json.load(f)
+    tournament = Tournament(roster, args.out, args.format, args.rounds, args.games_per_pair, args.seed,
+                            args.max_turns, args.board, args.size)
+    started = time.perf_counter()
+    rows = tournament.run(args.processes)
+    for row in rows:
+        errors = f", {row['errors']} failed" if row['errors'] else ""
+        print(f"{row['rank']:>3}. {row['name']:<24} {row['rating']:>7.1f}  {row['score']:>5.1f} "
+              f"({row['wins']}-{row['losses']}-{row['draws']}{errors})")
+    failed = sum(1 for result in tournament.results.values() if result.get('error'))
+    print(f"{len(tournament.results)} games ({failed} failed) in {time.perf_counter() - started:.1f}s; "
+          f"standings in {tournament.standings_path}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
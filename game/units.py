@@ -0,0 +1,87 @@
+from types import MappingProxyType
+from typing import FrozenSet, NamedTuple
+
+from game.enums import UnitType
+
+
+class UnitSpec(NamedTuple):
+    """Immutable rules for one unit type."""
+    unit_type: UnitType
+    movement: int
+    hp: int = 1
+    can_attack: bool = False
+    cardinal_only: bool = False
+    range: int = 0
+    charge_bonus: bool = False
+    can_trample: bool = False
+    immune_to: FrozenSet[UnitType] = frozenset()
+
+
+UNIT_SPECS = {
+    UnitType.INFANTRY: UnitSpec(UnitType.INFANTRY, movement=1, can_attack=True),
+    UnitType.SHOCK: UnitSpec(UnitType.SHOCK, movement=1, can_attack=True,
+                             immune_to=frozenset({UnitType.INFANTRY, UnitType.CAVALRY, UnitType.COMMANDER})),
+    UnitType.ARCHER: UnitSpec(UnitType.ARCHER, movement=1, cardinal_only=True, range=3),
+    UnitType.COMMANDER: UnitSpec(UnitType.COMMANDER, movement=1, can_attack=True,
+                                 immune_to=frozenset({UnitType.INFANTRY, UnitType.CAVALRY})),
+    UnitType.CAVALRY: UnitSpec(UnitType.CAVALRY, movement=3, can_attack=True),
+    UnitType.CHARIOT: UnitSpec(UnitType.CHARIOT, movement=3, can_attack=True, charge_bonus=True, can_trample=True),
+}
+
+# Unit types that make melee attacks during end-of-turn resolution.
+ATTACKERS = tuple(t for t, spec in UNIT_SPECS.items() if spec.can_attack)
+
+# Unit types that shoot along the direction they face, up to their range.
+RANGED = tuple(t for t, spec in UNIT_SPECS.items() if spec.range)
+
+# For each attacker type, the target types that are immune to it.
+IMMUNE_AGAINST = {
+    attacker: frozenset(t for t, spec in UNIT_SPECS.items() if attacker in spec.immune_to)
+    for attacker in UnitType
+}
+
+
+def _properties(spec):
+    # Same keys as the dicts Battle.get_unit_properties used to build on every call.
+    props = {"movement": spec.movement, "hp": spec.hp, "can_attack": spec.can_attack}
+    if spec.cardinal_only:
+        props["cardinal_only"] = True
+    if spec.range:
+        props["range"] = spec.range
+    if spec.charge_bonus:
+        props["charge_bonus"] = True
+    if spec.can_trample:
+        props["can_trample"] = True
+    if spec.immune_to:
+        props["immune_to"] = tuple(t for t in UnitType if t in spec.immune_to)
+    return MappingProxyType(props)
+
+
+# Read-only property mappings, shared by every caller.
+UNIT_PROPERTIES = {t: _properties(spec) for t, spec in UNIT_SPECS.items()}
+
+# Every spelling we accept for a unit type: the enum itself, its value and its lower-case value.
+_TYPE_LOOKUP = {}
+for _t in UnitType:
+    _TYPE_LOOKUP[_t] = _t
+    _TYPE_LOOKUP[_t.value] = _t
+    _TYPE_LOOKUP[_t.value.lower()] = _t
+
+
+def resolve_unit_type(value):
+    """Return the UnitType for an enum or a case-insensitive string, or None if unknown."""
+    try:
+        return _TYPE_LOOKUP[value]
+    except (KeyError, TypeError):
+        pass
+    if isinstance(value, str):
+        return _TYPE_LOOKUP.get(value.strip().upper())
+    return None
+
+
+def unit_spec(value):
+    """Return the UnitSpec for an enum or string unit type; raises ValueError if unknown."""
+    unit_type = resolve_unit_type(value)
+    if unit_type is None:
+        raise ValueError(f"{value!r} is not a valid UnitType")
+    return UNIT_SPECS[unit_type]
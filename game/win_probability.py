@@ -0,0 +1,178 @@
+"""Monte Carlo win-probability estimates for army compositions.
+
+``estimate_win_probability`` plays simulated battles between two unit
+compositions, alternating who attacks, and returns the first army's win
+probability with a 95% Wilson confidence interval. Game counts are
+memoized on disk per normalized composition pair and simulation settings,
+so repeated queries return instantly and bigger requests only play the
+missing games. Games are counted in order, so an entry of N games always
+covers games 0..N-1 and a later request resumes at game N.
+"""
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+from game.simulation import derive_seed, run_batch
+from game.units import resolve_unit_type
+
+# z-score of the two-sided 95% confidence interval
+Z_95 = 1.959963984540054
+
+_cache_lock = threading.Lock()
+
+
+def default_cache_path():
+    return Path(os.getenv("BATTLE_SIM_DATA_DIR", "data")) / "win_probability.json"
+
+
+def normalize_units(units):
+    """Canonical 'TYPE:count' string for a {'type', 'count'} list, independent of order and spelling."""
+    counts = {}
+    for unit in units:
+        unit_type = resolve_unit_type(unit['type'])
+        if unit_type is None:
+            raise ValueError(f"Unknown unit type {unit['type']!r}")
+        if int(unit['count']) > 0:
+            counts[unit_type.value] = counts.get(unit_type.value, 0) + int(unit['count'])
+    return ','.join(f"{t}:{c}" for t, c in sorted(counts.items()))
+
+
+def _parse_normalized(text):
+    return [{"type": t, "count": int(c)} for t, c in (part.split(':') for part in text.split(',') if part)]
+
+
+def wilson_interval(successes, games, z=Z_95):
+    """Wilson score interval for a binomial proportion; draws may be counted as half successes."""
+    if games == 0:
+        return 0.0, 1.0
+    p = successes / games
+    denominator = 1 + z * z / games
+    centre = (p + z * z / (2 * games)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def _load_cache(path):
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"[Win Probability] Failed to read {path.name}: {e}")
+        return {}
+
+
+def _save_cache(path, cache):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(cache, f, separators=(',', ':'))
+        tmp.replace(path)
+    except Exception as e:
+        print(f"[Win Probability] Failed to write {path.name}: {e}")
+
+
+def _cache_key(first, second, settings):
+    return '|'.join((first, second, *map(str, settings)))
+
+
+def _cached_counts(cache, first, second, settings):
+    """Return (wins, losses, draws) of ``first`` against ``second`` from the cache."""
+    entry = cache.get(_cache_key(first, second, settings))
+    if entry:
+        return entry['wins'], entry['losses'], entry['draws']
+    return 0, 0, 0
+
+
+def estimate_win_probability(army_a, army_b, games=200, time_budget=None, policy='greedy',
+                             processes=None, max_turns=200, cache_path=None, seed=0, executor=None):
+    """Estimate how often ``army_a`` beats ``army_b``.
+
+    ``army_a`` and ``army_b`` are unit lists in the {'type', 'count'} format.
+    Up to ``games`` battles are simulated across a process pool, with the
+    armies swapping aggressor and defender every game. Play stops early once
+    ``time_budget`` seconds have passed; the interval then reflects the games
+    actually played. Unfinished games count as half a win. A game the engine
+    failed to play fails the whole estimate, and nothing is cached.
+
+    Pass a long-lived ``executor`` to play on its workers instead of a new
+    pool, and ``cache_path=False`` to skip the on-disk memo.
+    """
+    started = time.perf_counter()
+    key_a, key_b = normalize_units(army_a), normalize_units(army_b)
+    if not key_a or not key_b:
+        return {"success": False, "message": "Both armies need at least one unit."}
+
+    # Games are played and counted for the pair in sorted order, so both ways round share one entry.
+    first, second = sorted((key_a, key_b))
+    path = default_cache_path() if cache_path is None else cache_path
+    settings = (policy, max_turns, seed)
+    with _cache_lock:
+        cache = _load_cache(path) if path else {}
+        wins, losses, draws = _cached_counts(cache, first, second, settings)
+    cached_games = wins + losses + draws
+
+    missing = games - cached_games
+    if missing > 0:
+        units_first, units_second = _parse_normalized(first), _parse_normalized(second)
+
+        def jobs():
+            for i in range(cached_games, games):
+                # Even games: the first army attacks. Odd games: the second does.
+                first_attacks = i % 2 == 0
+                yield {"game": i, "seed": derive_seed(seed, i),
+                       "aggressor": units_first if first_attacks else units_second,
+                       "defender": units_second if first_attacks else units_first,
+                       "policies": (policy, policy), "max_turns": max_turns}
+
+        # In job order: stopping on the time budget must leave games cached_games..played-1 done.
+        for record in run_batch(jobs(), processes, chunksize=4, ordered=True, executor=executor):
+            if record.get('error'):
+                # Not a draw: a broken policy or engine bug must not end up in the odds or the cache.
+                return {"success": False,
+                        "message": f"Simulated battle {record['game']} failed: {record['error']}"}
+            side = record.get('side')
+            if side is None:
+                draws += 1
+            elif (side == 'aggressor') == (record['game'] % 2 == 0):
+                wins += 1
+            else:
+                losses += 1
+            if time_budget is not None and time.perf_counter() - started >= time_budget:
+                break
+
+        if path:
+            with _cache_lock:
+                # Re-read so concurrent estimates for other pairs are not lost.
+                cache = _load_cache(path)
+                previous = sum(_cached_counts(cache, first, second, settings))
+                if wins + losses + draws > previous:
+                    cache[_cache_key(first, second, settings)] = {"wins": wins, "losses": losses, "draws": draws}
+                    _save_cache(path, cache)
+
+    if key_a != first:
+        wins, losses = losses, wins
+
+    played = wins + losses + draws
+    probability = (wins + 0.5 * draws) / played if played else 0.5
+    low, high = wilson_interval(wins + 0.5 * draws, played)
+    return {
+        "success": True,
+        "games": played,
+        "wins": wins,
+        "losses": losses,
+        "draws": draws,
+        "win_probability": probability,
+        "confidence_interval": (low, high),
+        "cached": missing <= 0,
+        "elapsed": time.perf_counter() - started,
+        "message": (
+            f"Estimated win chance: {probability:.0%} "
+            f"(95% CI {low:.0%}-{high:.0%} over {played} simulated battles)."
+        ),
+    }
@@ -0,0 +1,54 @@
+"""Zobrist keys for battle positions.
+
+A position hash is the XOR of one 64-bit key per occupied tile, chosen by
+(cell, owner slot, unit type, orientation, status), plus ``SIDE_TO_MOVE``
+when the defender is to move. Keys are derived on demand by hashing those
+fields with a fixed seed, so hashes are stable across processes and runs
+and a board of any size costs nothing until its tiles are used. Recently
+used keys are kept in a bounded cache, since search hashes the same few
+tiles over and over.
+"""
+import random
+from functools import lru_cache
+from itertools import product
+
+from game.enums import Orientation, UnitStatus, UnitType
+
+SEED = 0x5A0B_71C5
+
+SIDE_TO_MOVE = random.Random(SEED).getrandbits(64)
+
+# Owner slots: 0 for the aggressor, 1 for the defender.
+OWNER_SLOTS = 2
+
+# Bounds the derived keys held at once: about 250 bytes each.
+KEY_CACHE_SIZE = 1 << 14
+
+_MASK = (1 << 64) - 1
+
+# Small integer per (slot, unit type, orientation, status); the last one marks a unit that has acted.
+_COMBOS = {combo: i for i, combo in enumerate(product(range(OWNER_SLOTS), UnitType, Orientation, UnitStatus))}
+_ACTED = len(_COMBOS)
+
+
+def _mix(z):
+    """The splitmix64 finalizer: spreads every input bit over the whole 64-bit result."""
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & _MASK
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & _MASK
+    return z ^ (z >> 31)
+
+
+def _derive(width, height, cell, combo):
+    return _mix(_mix(_mix(SEED ^ (width << 32) ^ height) ^ cell) ^ combo)
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def zobrist_key(width, height, cell, slot, unit_type, orientation, status):
+    """Key of a unit with these properties on ``cell`` (row-major) of a ``width`` x ``height`` board."""
+    return _derive(width, height, cell, _COMBOS[(slot, unit_type, orientation, status)])
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def acted_key(width, height, cell):
+    """Key of a unit on ``cell`` that has already acted this turn, for hashes that must tell them apart."""
+    return _derive(width, height, cell, _ACTED)
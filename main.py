@@ -1,8 +1,10 @@
+import asyncio
 import os
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 from utils.keep_alive import start_keepalive
+from utils.sheets_sync import flush, index_players
 
 load_dotenv()
 
@@ -14,6 +16,9 @@ intents.message_content = True
 # Subclass Bot to load extensions asynchronously  
 class BattleBot(commands.Bot):
     async def setup_hook(self):
+        # Index stored players off the event loop; each player is loaded on first use.
+        await asyncio.to_thread(index_players)
+
         # Load cogs - in discord.py load_extension is async
         cog_files = os.listdir('./cogs')
         for filename in cog_files:
@@ -31,6 +36,11 @@ class BattleBot(commands.Bot):
         except Exception as e:
             print(f'Failed to sync commands: {e}')
 
+    async def close(self):
+        await super().close()
+        # Write out any army, battle and checkpoint writes still queued.
+        flush()
+
 bot = BattleBot(command_prefix="!", intents=intents)
 
 
@@ -43,14 +53,16 @@ async def on_ready():
     print('-------------------')
 
 
-# Check if token is available
-token = os.getenv('TOKEN')
-if not token:
-    print("Error: TOKEN environment variable not found!")
-    print("Please check your .env file or set the TOKEN environment variable.")
-    exit(1)
+# Simulation workers are spawned and import this module again; only the bot process runs it.
+if __name__ == "__main__":
+    # Check if token is available
+    token = os.getenv('TOKEN')
+    if not token:
+        print("Error: TOKEN environment variable not found!")
+        print("Please check your .env file or set the TOKEN environment variable.")
+        exit(1)
 
-# Start keep-alive components if configured (no-op if env not set)
-start_keepalive()
+    # Start keep-alive components if configured (no-op if env not set)
+    start_keepalive()
 
-bot.run(token)
+    bot.run(token)
@@ -0,0 +1,18 @@
+import pytest
+import utils.sheets_sync as store
+
+
+@pytest.fixture(autouse=True)
+def local_store(tmp_path, monkeypatch):
+    """Keep the JSON files and checkpoints each test writes in its own directory."""
+    monkeypatch.setattr(store, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(store, 'ARMIES_FILE', tmp_path / "armies.json")
+    monkeypatch.setattr(store, 'BATTLES_FILE', tmp_path / "battles.json")
+    monkeypatch.setattr(store, 'ACTIVE_BATTLES_FILE', tmp_path / "active_battles.json")
+    monkeypatch.setattr(store, 'RESOURCES_FILE', tmp_path / "resources.json")
+    monkeypatch.setattr(store, 'CHECKPOINT_DIR', tmp_path / "checkpoints")
+    monkeypatch.setattr(store, 'DATABASE_FILE', tmp_path / "battle_sim.db")
+    monkeypatch.setattr(store, 'STORAGE', "")
+    yield tmp_path
+    # Queued writes belong to this test's directory.
+    store.flush()
@@ -0,0 +1,113 @@
+from game.ai import AIPlayer, TranspositionTable, evaluate, plan_turn, WIN
+from game.enums import Orientation, Phase, UnitType
+from game.simulation import apply_action, build_battle
+import pytest
+import time
+
+SMALL_ARMY = [{"type": 'infantry', "count": 2}, {"type": 'commander', "count": 1}]
+
+
+def placed_battle():
+    battle = build_battle([{"type": 'commander', "count": 1}, {"type": 'shock', "count": 1}],
+                          [{"type": 'commander', "count": 1}, {"type": 'infantry', "count": 1}])
+    battle.place_unit(1, UnitType.COMMANDER, 0, 8, 'north')
+    battle.place_unit(2, UnitType.COMMANDER, 4, 1, 'south')
+    battle.place_unit(1, UnitType.SHOCK, 3, 7, 'north')
+    battle.place_unit(2, UnitType.INFANTRY, 8, 0, 'south')
+    # Walk the shock unit up next to the defender's commander.
+    battle._remove_unit(3, 7)
+    battle._put_unit(3, 1, UnitType.SHOCK, 1, Orientation.NORTH)
+    return battle
+
+
+def test_transposition_table_evicts_least_recently_used():
+    table = TranspositionTable(max_entries=2)
+    table.put(1, 1, 0.0, 0, None)
+    table.put(2, 1, 0.0, 0, None)
+    table.get(1)
+    table.put(3, 1, 0.0, 0, None)
+    assert len(table) == 2
+    assert table.get(2) is None
+    assert table.get(1) is not None
+
+
+def test_transposition_table_keeps_deeper_entries():
+    table = TranspositionTable()
+    table.put(1, 3, 1.0, 0, ('end_turn',))
+    table.put(1, 1, 2.0, 0, None)
+    assert table.get(1) == (3, 1.0, 0, ('end_turn',))
+
+
+def test_unknown_difficulty():
+    with pytest.raises(ValueError):
+        AIPlayer(1, 'impossible')
+
+
+def test_ai_takes_a_winning_attack():
+    battle = placed_battle()
+    player = AIPlayer(1, 'hard', seed=0)
+    player.time_budget = 0.5
+    assert player.choose_action(battle) == ('turn', 3, 1, 'east')
+    apply_action(battle, 1, ('turn', 3, 1, 'east'))
+    assert evaluate(battle, 1) > WIN / 4
+
+
+def test_choose_action_respects_time_budget():
+    battle = build_battle(SMALL_ARMY * 2, SMALL_ARMY * 2)
+    while battle.phase == Phase.PLACEMENT:
+        for action in plan_turn(battle, battle.current_player, 'easy', seed=0):
+            assert apply_action(battle, battle.current_player, action)['success']
+    player = AIPlayer(1, 'hard', seed=0)
+    player.time_budget = 0.2
+    started = time.perf_counter()
+    action = player.choose_action(battle)
+    assert time.perf_counter() - started < 0.5
+    assert action is not None
+    assert player.depth_reached >= 1
+
+
+def test_noise_only_picks_among_real_scores():
+    battle = build_battle(SMALL_ARMY * 2, SMALL_ARMY * 2)
+    while battle.phase == Phase.PLACEMENT:
+        for action in plan_turn(battle, battle.current_player, 'easy', seed=0):
+            assert apply_action(battle, battle.current_player, action)['success']
+    exact = AIPlayer(1, 'hard', seed=0)
+    exact._deadline = float('inf')
+    actions = exact._actions(battle)
+    real = {a: exact._value_after(battle, a, 1, -float('inf'), float('inf')) for a in actions}
+    for seed in range(5):
+        noisy = AIPlayer(1, 'easy', seed=seed)
+        noisy._deadline = float('inf')
+        best, scores = noisy._search_root(battle, actions, 2)
+        # Every move the noise could pick was scored exactly, and the pick is one of them.
+        close = [a for a in actions if real[a] > max(real.values()) - 2 * noisy.noise]
+        assert {a: scores[a] for a in close} == {a: real[a] for a in close}
+        assert best in close
+        assert noisy.table.get(noisy._key(battle))[1] == max(real.values())
+
+
+def test_plan_turn_leaves_the_battle_untouched():
+    battle = build_battle(SMALL_ARMY, SMALL_ARMY)
+    while battle.phase == Phase.PLACEMENT:
+        for action in plan_turn(battle, battle.current_player, 'easy', seed=0):
+            assert apply_action(battle, battle.current_player, action)['success']
+    before = battle.zobrist
+    actions = plan_turn(battle, 1, 'normal', seed=0)
+    assert battle.zobrist == before
+    assert actions[-1] == ('end_turn',)
+    for action in actions:
+        assert apply_action(battle, 1, action)['success']
+    assert battle.current_player == 2
+
+
+def test_battle_is_sent_to_workers_without_its_reach_cache():
+    import copy
+    import pickle
+
+    battle = placed_battle()
+    battle.reachable_tiles(3, 1)
+    assert '_reach' not in battle.__getstate__()
+    for copied in (pickle.loads(pickle.dumps(battle)), copy.deepcopy(battle)):
+        assert copied.zobrist == battle.zobrist
+        assert copied.legal_actions() == battle.legal_actions()
+        assert copied._reach is not battle._reach
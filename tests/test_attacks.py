@@ -0,0 +1,131 @@
+import random
+
+import pytest
+from game.game_manager import Battle, UnitType, UnitStatus, Orientation
+from game.attacks import resolve_attacks
+from game.board import make_board
+
+BACKENDS = ['dict', 'array', 'bitboard', 'sparse']
+
+
+STEPS = {Orientation.NORTH: (0, -1), Orientation.SOUTH: (0, 1), Orientation.EAST: (1, 0), Orientation.WEST: (-1, 0)}
+
+
+def legacy_resolve(board, get_props):
+    """The original per-cell loop from Battle.end_turn, plus a per-tile walk for ranged units, kept as a reference."""
+    to_remove = []
+    for y in range(9):
+        for x in range(9):
+            unit = board.get(x, y)
+            if not unit:
+                continue
+            props = get_props(unit['type'])
+            reach = 1 if props.get('can_attack') else props.get('range', 0)
+            dx, dy = STEPS[unit['orientation']]
+            tx, ty, target = x, y, None
+            for _ in range(reach):
+                tx, ty = tx + dx, ty + dy
+                if not (0 <= tx <= 8 and 0 <= ty <= 8):
+                    break
+                target = board.get(tx, ty)
+                if target:
+                    break
+            if not target or target['owner'] == unit['owner']:
+                continue
+            props = get_props(target['type'])
+            if 'immune_to' in props and unit['type'] in props['immune_to']:
+                if target.get('status') == UnitStatus.DAMAGED:
+                    to_remove.append((tx, ty))
+                else:
+                    board.set_status(tx, ty, UnitStatus.DAMAGED)
+            else:
+                to_remove.append((tx, ty))
+    return set(to_remove)
+
+
+def random_board(kind, rng, density):
+    board = make_board(kind)
+    for y in range(9):
+        for x in range(9):
+            if rng.random() < density:
+                board.place(x, y, rng.choice(list(UnitType)), rng.choice([1, 2]),
+                            rng.choice(list(Orientation)), rng.choice([UnitStatus.HEALTHY, UnitStatus.DAMAGED]))
+    return board
+
+
+def statuses(board):
+    return {(x, y): unit['status'] for x, y, unit in board.units()}
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_resolver_matches_legacy_loop(kind):
+    get_props = Battle(1, 2, []).get_unit_properties
+    rng = random.Random(1234)
+    for _ in range(300):
+        density = rng.choice([0.2, 0.5, 0.9])
+        seed = rng.random()
+        expected_board = random_board(kind, random.Random(seed), density)
+        actual_board = random_board(kind, random.Random(seed), density)
+
+        expected = legacy_resolve(expected_board, get_props)
+        destroyed, damaged = resolve_attacks(actual_board)
+        for x, y in damaged:
+            actual_board.set_status(x, y, UnitStatus.DAMAGED)
+
+        assert set(destroyed) == expected
+        assert len(destroyed) == len(expected)
+        survivors = lambda board: {pos: s for pos, s in statuses(board).items() if pos not in expected}
+        assert survivors(actual_board) == survivors(expected_board)
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_two_immune_hits_destroy_a_healthy_unit(kind):
+    board = make_board(kind)
+    board.place(4, 4, UnitType.SHOCK, 2, Orientation.NORTH)
+    board.place(3, 4, UnitType.INFANTRY, 1, Orientation.EAST)
+    assert resolve_attacks(board) == ([], [(4, 4)])
+
+    board.place(5, 4, UnitType.CAVALRY, 1, Orientation.WEST)
+    assert resolve_attacks(board) == ([(4, 4)], [])
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_attacks_do_not_wrap_around_edges(kind):
+    board = make_board(kind)
+    board.place(8, 3, UnitType.INFANTRY, 1, Orientation.EAST)
+    board.place(0, 4, UnitType.INFANTRY, 2, Orientation.WEST)
+    board.place(0, 0, UnitType.INFANTRY, 1, Orientation.NORTH)
+    board.place(0, 8, UnitType.INFANTRY, 2, Orientation.SOUTH)
+    assert resolve_attacks(board) == ([], [])
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_archer_hits_first_unit_in_range(kind):
+    board = make_board(kind)
+    board.place(4, 8, UnitType.ARCHER, 1, Orientation.NORTH)
+    board.place(4, 5, UnitType.INFANTRY, 2, Orientation.SOUTH)
+    board.place(4, 4, UnitType.INFANTRY, 2, Orientation.SOUTH)
+    assert resolve_attacks(board) == ([(4, 5)], [])
+
+    # Out of range: three tiles is the limit.
+    board.remove(4, 5)
+    assert resolve_attacks(board) == ([], [])
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_archer_line_of_sight_is_blocked(kind):
+    board = make_board(kind)
+    board.place(0, 4, UnitType.ARCHER, 1, Orientation.EAST)
+    board.place(1, 4, UnitType.CAVALRY, 1, Orientation.NORTH)
+    board.place(2, 4, UnitType.INFANTRY, 2, Orientation.NORTH)
+    assert resolve_attacks(board) == ([], [])
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_archer_shots_do_not_wrap_around_edges(kind):
+    board = make_board(kind)
+    board.place(7, 3, UnitType.ARCHER, 1, Orientation.EAST)
+    board.place(0, 4, UnitType.INFANTRY, 2, Orientation.WEST)
+    board.place(1, 0, UnitType.ARCHER, 2, Orientation.NORTH)
+    board.place(1, 8, UnitType.INFANTRY, 1, Orientation.SOUTH)
+    assert resolve_attacks(board) == ([], [])
@@ -0,0 +1,325 @@
+import pytest
+from game.game_manager import Battle, Phase, UnitType
+
+
+def make_battle(aggressor_units, defender_units, board='dict'):
+    armies = [
+        {"id": 1, "owner": 1, "units": [{"type": t, "count": c} for t, c in aggressor_units]},
+        {"id": 1, "owner": 2, "units": [{"type": t, "count": c} for t, c in defender_units]},
+    ]
+    return Battle(1, 2, armies, board=board)
+
+
+def test_placement_counts_are_tracked_incrementally():
+    battle = make_battle([('infantry', 2), (UnitType.COMMANDER, 1)], [(UnitType.SHOCK, 1), ('COMMANDER', 1)])
+    assert battle.remaining_units[1] == {UnitType.INFANTRY: 2, UnitType.COMMANDER: 1}
+
+    result = battle.place_unit(1, 'infantry', 0, 8, 'north')
+    assert result['success']
+    assert "You have 2 units left to place: 1 INFANTRY, 1 COMMANDER." in result['message']
+    assert "Total units left to place: 4 (1 INFANTRY, 2 COMMANDER, 1 SHOCK)." in result['message']
+    assert battle.armies[0]['units'][0]['count'] == 1
+
+    assert battle.place_unit(2, UnitType.SHOCK, 0, 0, 'south')['success']
+    assert battle.remaining_units[2] == {UnitType.SHOCK: 0, UnitType.COMMANDER: 1}
+
+
+def test_placement_draws_from_every_army_of_the_player():
+    armies = [
+        {"id": 1, "owner": 1, "units": [{"type": UnitType.INFANTRY, "count": 1}]},
+        {"id": 2, "owner": 1, "units": [{"type": 'infantry', "count": 1}]},
+        {"id": 1, "owner": 2, "units": [{"type": UnitType.COMMANDER, "count": 2}]},
+    ]
+    battle = Battle(1, 2, armies)
+    assert battle.place_unit(1, UnitType.INFANTRY, 0, 8, 'north')['success']
+    assert battle.place_unit(2, UnitType.COMMANDER, 0, 0, 'south')['success']
+    assert battle.place_unit(1, UnitType.INFANTRY, 1, 8, 'north')['success']
+    assert [u['count'] for a in armies[:2] for u in a['units']] == [0, 0]
+    assert battle.place_unit(2, UnitType.COMMANDER, 1, 0, 'south')['phase'] == Phase.BATTLE.value
+
+
+def test_placement_rejects_missing_units_and_bad_orientation():
+    battle = make_battle([(UnitType.INFANTRY, 1)], [(UnitType.INFANTRY, 1)])
+    result = battle.place_unit(1, UnitType.CAVALRY, 0, 8, 'north')
+    assert not result['success']
+    assert "Army 1: [INFANTRY:1]" in result['message']
+    assert not battle.place_unit(1, UnitType.INFANTRY, 0, 8, 'up')['success']
+    assert battle.remaining_units[1][UnitType.INFANTRY] == 1
+    assert battle.placed_count == 0
+
+
+@pytest.mark.parametrize("kind", ['dict', 'array', 'bitboard'])
+def test_position_index_follows_place_move_and_destroy(kind):
+    battle = make_battle([(UnitType.COMMANDER, 1), (UnitType.INFANTRY, 1)],
+                         [(UnitType.COMMANDER, 1), (UnitType.INFANTRY, 1)], board=kind)
+    battle.place_unit(1, UnitType.COMMANDER, 0, 8, 'north')
+    battle.place_unit(2, UnitType.COMMANDER, 8, 0, 'south')
+    battle.place_unit(1, UnitType.INFANTRY, 4, 7, 'north')
+    battle.place_unit(2, UnitType.INFANTRY, 4, 1, 'south')
+    assert battle.positions == {1: {(0, 8), (4, 7)}, 2: {(8, 0), (4, 1)}}
+    assert battle.commander_position(2) == (8, 0)
+
+    assert battle.move_unit(1, 4, 7, 4, 6)['success']
+    assert battle.positions[1] == {(0, 8), (4, 6)}
+    battle.end_turn(1)
+    battle.move_unit(2, 4, 1, 4, 2)
+    battle.end_turn(2)
+    battle.move_unit(1, 4, 6, 4, 5)
+    battle.end_turn(1)
+    battle.move_unit(2, 4, 2, 4, 3)
+    battle.end_turn(2)
+    battle.move_unit(1, 4, 5, 4, 4)
+    battle.end_turn(1)
+    # Both infantry attacked each other in the same resolution
+    assert battle.positions == {1: {(0, 8)}, 2: {(8, 0)}}
+    assert battle.phase == Phase.ENDED
+    assert battle.log[-1]['message'].startswith("Only commanders remain!")
+
+
+def test_commander_pointer_notices_direct_board_edits():
+    battle = make_battle([(UnitType.COMMANDER, 1)], [(UnitType.COMMANDER, 1)])
+    battle.place_unit(1, UnitType.COMMANDER, 0, 8, 'north')
+    battle.place_unit(2, UnitType.COMMANDER, 0, 0, 'south')
+    battle.board[0][0] = None
+    result = battle.check_battle_end()
+    assert result['ended'] and result['winner'] == 1
+
+
+def test_placement_continues_when_opponent_is_done():
+    battle = make_battle([(UnitType.INFANTRY, 1)], [(UnitType.INFANTRY, 2)])
+    battle.place_unit(1, UnitType.INFANTRY, 0, 8, 'north')
+    result = battle.place_unit(2, UnitType.INFANTRY, 0, 0, 'south')
+    assert "it is your turn again" in result['message']
+    assert battle.current_player == 2
+    assert battle.place_unit(2, UnitType.INFANTRY, 1, 0, 'south')['phase'] == Phase.BATTLE.value
+    assert battle.current_player == 1
+
+
+def _cavalry_battle(kind='dict'):
+    battle = make_battle([(UnitType.CAVALRY, 1), (UnitType.INFANTRY, 2), (UnitType.COMMANDER, 1)],
+                         [(UnitType.COMMANDER, 1)], board=kind)
+    battle.place_unit(1, UnitType.CAVALRY, 0, 8, 'north')
+    battle.place_unit(2, UnitType.COMMANDER, 8, 0, 'south')
+    battle.place_unit(1, UnitType.INFANTRY, 0, 7, 'north')
+    battle.place_unit(1, UnitType.INFANTRY, 1, 7, 'north')
+    battle.place_unit(1, UnitType.COMMANDER, 2, 8, 'north')
+    return battle
+
+
+@pytest.mark.parametrize("kind", ['dict', 'array', 'bitboard'])
+def test_reachable_tiles_route_around_blockers(kind):
+    battle = _cavalry_battle(kind)
+    # Boxed in by its own infantry and commander, the cavalry can only step east
+    assert battle.reachable_tiles(0, 8) == [(1, 8)]
+    result = battle.move_unit(1, 0, 8, 0, 6)
+    assert not result['success'] and "path is blocked" in result['message']
+    assert battle.move_unit(1, 0, 7, 0, 6)['success']
+    # The cache entry for the cavalry is dropped when a neighbouring tile empties
+    assert battle.reachable_tiles(0, 8) == [(0, 7), (1, 8)]
+
+
+def test_move_unit_rejects_occupied_and_unmoved_destinations():
+    battle = _cavalry_battle()
+    assert battle.move_unit(1, 0, 8, 1, 7)['message'] == "That tile is already occupied."
+    assert not battle.move_unit(1, 0, 8, 0, 8)['success']
+    assert battle.board.get(0, 8)['has_acted'] is False
+
+
+def test_legal_actions_match_what_the_engine_accepts():
+    battle = _cavalry_battle('bitboard')
+    actions = battle.legal_actions()
+    assert battle.legal_actions(2) == []
+    moves = {a for a in actions if a[0] == 'move'}
+    assert ('move', 0, 8, 1, 8) in moves and ('move', 0, 8, 0, 6) not in moves
+    assert sum(1 for a in actions if a[0] == 'turn') == 4 * 3
+    for action in actions:
+        probe = _cavalry_battle('bitboard')
+        method = probe.move_unit if action[0] == 'move' else probe.turn_unit
+        assert method(1, *action[1:])['success'], action
+
+
+@pytest.mark.parametrize("kind", ['dict', 'array', 'bitboard'])
+def test_zobrist_hash_is_updated_incrementally(kind):
+    import random
+    from game.simulation import GreedyPolicy, apply_action, build_battle
+
+    battle = build_battle([{"type": UnitType.SHOCK, "count": 2}, {"type": UnitType.CAVALRY, "count": 2},
+                           {"type": UnitType.COMMANDER, "count": 1}],
+                          [{"type": UnitType.INFANTRY, "count": 4}, {"type": UnitType.COMMANDER, "count": 1}],
+                          board=kind)
+    rng, policy, hashes = random.Random(3), GreedyPolicy(), set()
+    while battle.phase == Phase.PLACEMENT:
+        battle.place_unit(battle.current_player, *policy.place(battle, battle.current_player, rng))
+        assert battle.zobrist == battle.compute_zobrist()
+    for _ in range(60):
+        if battle.phase != Phase.BATTLE:
+            break
+        player = battle.current_player
+        action = policy.act(battle, player, rng)
+        if action is None:
+            battle.end_turn(player)
+        else:
+            apply_action(battle, player, action)
+        assert battle.zobrist == battle.compute_zobrist()
+        hashes.add(battle.zobrist)
+    assert len(hashes) > 10
+
+
+def test_large_boards_build_per_cell_tables_lazily():
+    from game.enums import Orientation
+    from game.movegen import reach_tables
+
+    armies = [{"id": 1, "owner": owner, "units": [{"type": UnitType.CAVALRY, "count": 1}]} for owner in (1, 2)]
+    battle = Battle(1, 2, armies, board='sparse', width=64, height=64)
+    battle._put_unit(63, 63, UnitType.CAVALRY, 1, Orientation.NORTH)
+    battle._put_unit(62, 63, UnitType.CAVALRY, 2, Orientation.SOUTH)
+    assert battle.zobrist == battle.compute_zobrist()
+    assert battle.reachable_tiles(63, 63) == [(63, 60), (62, 61), (63, 61), (61, 62), (62, 62), (63, 62)]
+    assert len(reach_tables(64, 64)._neighbors) < 64
+
+
+def test_zobrist_hash_depends_on_position_not_history():
+    first = make_battle([(UnitType.INFANTRY, 1), (UnitType.COMMANDER, 1)], [(UnitType.COMMANDER, 1)])
+    second = make_battle([(UnitType.INFANTRY, 1), (UnitType.COMMANDER, 1)], [(UnitType.COMMANDER, 1)])
+    first.place_unit(1, UnitType.INFANTRY, 0, 8, 'north')
+    first.place_unit(2, UnitType.COMMANDER, 4, 0, 'south')
+    first.place_unit(1, UnitType.COMMANDER, 1, 8, 'north')
+    second.place_unit(1, UnitType.COMMANDER, 1, 8, 'north')
+    second.place_unit(2, UnitType.COMMANDER, 4, 0, 'south')
+    second.place_unit(1, UnitType.INFANTRY, 0, 8, 'north')
+    assert first.zobrist == second.zobrist
+    first.turn_unit(1, 0, 8, 'east')
+    assert first.zobrist != second.zobrist
+    first.turn_unit(1, 1, 8, 'north')
+    second.turn_unit(1, 0, 8, 'east')
+    assert first.zobrist == second.zobrist
+    first.end_turn(1)
+    assert first.current_player == 2 and first.zobrist != second.zobrist
+
+
+def snapshot(battle):
+    return (sorted((x, y, tuple(sorted(unit.items(), key=lambda kv: kv[0]))) for x, y, unit in battle.board.units()),
+            battle.zobrist, battle.phase, battle.winner, battle.current_player, battle.placed_count,
+            {p: dict(r) for p, r in battle.remaining_units.items()},
+            {p: set(s) for p, s in battle.positions.items()},
+            {p: set(s) for p, s in battle.commander_positions.items()},
+            len(battle.log), battle.legal_actions())
+
+
+@pytest.mark.parametrize("kind", ['dict', 'array', 'bitboard'])
+def test_unmake_restores_every_earlier_position(kind):
+    import random
+    from game.simulation import GreedyPolicy, apply_action, build_battle
+
+    battle = build_battle([{"type": UnitType.SHOCK, "count": 2}, {"type": UnitType.CAVALRY, "count": 2},
+                           {"type": UnitType.COMMANDER, "count": 1}],
+                          [{"type": UnitType.INFANTRY, "count": 4}, {"type": UnitType.COMMANDER, "count": 1}],
+                          board=kind)
+    rng, policy, history = random.Random(5), GreedyPolicy(), [snapshot(battle)]
+    while battle.phase == Phase.PLACEMENT:
+        battle.place_unit(battle.current_player, *policy.place(battle, battle.current_player, rng))
+        history.append(snapshot(battle))
+    for _ in range(60):
+        if battle.phase != Phase.BATTLE:
+            break
+        player = battle.current_player
+        action = policy.act(battle, player, rng)
+        if action is None:
+            battle.end_turn(player)
+        else:
+            apply_action(battle, player, action)
+        history.append(snapshot(battle))
+
+    history.pop()
+    while history:
+        assert battle.unmake()
+        assert snapshot(battle) == history.pop()
+        assert battle.zobrist == battle.compute_zobrist()
+    assert not battle.unmake()
+    assert battle.total_unit_count == sum(u['count'] for army in battle.armies for u in army['units'])
+
+
+def test_unmake_reverts_a_forfeit():
+    battle = make_battle([(UnitType.COMMANDER, 1)], [(UnitType.COMMANDER, 1)])
+    battle.forfeit_battle(1)
+    assert battle.unmake()
+    assert battle.phase == Phase.PLACEMENT and battle.winner is None
+    assert battle.log == []
+
+
+def test_undo_only_takes_back_own_moves_this_turn():
+    battle = make_battle([(UnitType.INFANTRY, 1), (UnitType.COMMANDER, 1)], [(UnitType.COMMANDER, 1)])
+    battle.place_unit(1, UnitType.INFANTRY, 4, 7, 'north')
+    battle.place_unit(2, UnitType.COMMANDER, 4, 0, 'south')
+    battle.place_unit(1, UnitType.COMMANDER, 0, 8, 'north')
+    assert not battle.undo(1)['success']
+
+    battle.move_unit(1, 4, 7, 4, 6)
+    assert not battle.undo(2)['success']
+    result = battle.undo(1)
+    assert result['success']
+    assert battle.board.get(4, 7)['has_acted'] is False
+    assert not battle.board.is_occupied(4, 6)
+
+    battle.turn_unit(1, 4, 7, 'east')
+    battle.end_turn(1)
+    assert not battle.undo(2)['success']
+
+
+def coalition_battle():
+    # Players 1 and 3 fight player 2 and their ally 4; player 3 fields two armies.
+    armies = [
+        {"id": 1, "owner": 1, "units": [{"type": UnitType.COMMANDER, "count": 1}]},
+        {"id": 1, "owner": 3, "units": [{"type": UnitType.INFANTRY, "count": 1}]},
+        {"id": 2, "owner": 3, "units": [{"type": UnitType.INFANTRY, "count": 1}]},
+        {"id": 1, "owner": 2, "units": [{"type": UnitType.COMMANDER, "count": 1}]},
+        {"id": 1, "owner": 4, "units": [{"type": UnitType.SHOCK, "count": 1}]},
+    ]
+    return Battle(1, 2, armies, allies={3: 1, 4: 2})
+
+
+def test_allies_place_and_command_their_side():
+    battle = coalition_battle()
+    assert battle.remaining_units[3] == {UnitType.INFANTRY: 2}
+    assert not battle.place_unit(4, UnitType.SHOCK, 0, 0, 'south')['success']
+    assert battle.place_unit(3, UnitType.INFANTRY, 4, 7, 'north')['success']
+    assert battle.place_unit(4, UnitType.SHOCK, 4, 1, 'south')['success']
+    assert battle.place_unit(1, UnitType.COMMANDER, 4, 8, 'north')['success']
+    assert battle.place_unit(2, UnitType.COMMANDER, 4, 0, 'south')['success']
+    # The defenders have nothing left, so the aggressors place the rest.
+    assert battle.place_unit(3, UnitType.INFANTRY, 5, 7, 'north')['phase'] == Phase.BATTLE.value
+
+    assert battle.board.get(4, 7)['owner'] == 1
+    assert battle.positions[1] == {(4, 7), (5, 7), (4, 8)}
+    assert battle.placed_units[3] == [{"type": UnitType.INFANTRY, "x": 4, "y": 7},
+                                      {"type": UnitType.INFANTRY, "x": 5, "y": 7}]
+    assert not battle.move_unit(4, 4, 1, 4, 2)['success']
+    assert battle.move_unit(3, 4, 8, 3, 8)['success']
+    assert not battle.undo(1)['success']
+    assert battle.undo(3)['success']
+    assert battle.end_turn(3)['success']
+    assert battle.current_player == 2
+    assert battle.log[-1]['player_id'] == 1
+
+
+def test_unmake_restores_side_counts():
+    battle = coalition_battle()
+    assert battle.place_unit(3, UnitType.INFANTRY, 4, 7, 'north')['success']
+    assert battle.unmake()
+    assert battle._remaining_by_side == {1: 3, 2: 2}
+    assert battle.remaining_units[3] == {UnitType.INFANTRY: 2}
+
+
+def test_ally_forfeit_concedes_for_their_side():
+    battle = coalition_battle()
+    result = battle.forfeit_battle(4)
+    assert result['winner'] == 1
+    assert not coalition_battle().forfeit_battle(5)['success']
+
+
+def test_armies_must_belong_to_a_side():
+    armies = [{"id": 1, "owner": 3, "units": [{"type": UnitType.INFANTRY, "count": 1}]}]
+    with pytest.raises(ValueError):
+        Battle(1, 2, armies)
+    with pytest.raises(ValueError):
+        Battle(1, 2, [], allies={3: 5})
@@ -0,0 +1,79 @@
+import json
+import pickle
+import random
+
+import pytest
+from game.battle_log import BattleLog, DeferredResult, LogEvent
+from game.enums import Phase, UnitType
+from game.simulation import GreedyPolicy, apply_action, build_battle
+
+
+def test_events_read_like_the_old_dicts():
+    event = LogEvent('move', (1, UnitType.SHOCK, 0, 8, 0, 7))
+    assert event == {"type": 'move', "player_id": 1, "unit_type": UnitType.SHOCK, "from_x": 0, "from_y": 8,
+                     "to_x": 0, "to_y": 7, "message": "Moved UnitType.SHOCK from (0,8) to (0,7)."}
+    assert event.get('winner') is None
+    end = LogEvent('end', (2,), text="The defender wins!")
+    assert end['message'] == "The defender wins!"
+    assert pickle.loads(pickle.dumps(end)) == end
+
+
+def test_log_spills_to_the_archive_and_reads_back():
+    log = BattleLog(cap=10, chunk=4)
+    for i in range(25):
+        log.add('damage', i, 0)
+    assert len(log) == 25
+    assert len(log._events) <= 10
+    assert [event['x'] for event in log] == list(range(25))
+    assert log[3]['x'] == 3 and log[-1]['x'] == 24
+    assert [event['x'] for event in log[5:8]] == [5, 6, 7]
+
+    del log[2:]
+    assert len(log) == 2 and [event['x'] for event in log] == [0, 1]
+    log.append({"type": 'custom', "note": 'kept as a dict'})
+    assert log[2] == {"type": 'custom', "note": 'kept as a dict'}
+    assert log == [log[0], log[1], log[2]]
+
+
+def test_deferred_result_formats_on_first_read():
+    calls = []
+    result = DeferredResult(lambda: calls.append(1) or "done", success=True)
+    assert result['success'] and not calls
+    assert 'message' in result
+    assert result['message'] == result.get('message') == "done"
+    assert calls == [1]
+
+
+@pytest.mark.parametrize('view', [dict, len, list, json.dumps, lambda r: r == {"success": True, "message": "done"},
+                                  lambda r: {"success": True, "message": "done"} == r, lambda r: list(r.items())])
+def test_deferred_result_is_whole_when_seen_whole(view):
+    unread, read = (DeferredResult(lambda: "done", success=True) for _ in range(2))
+    read['message']
+    assert view(unread) == view(read)
+    assert dict(unread) == {"success": True, "message": "done"}
+    assert DeferredResult(lambda: "done", success=True) == DeferredResult(lambda: "done", success=True)
+
+
+def test_capped_battle_log_matches_an_uncapped_one():
+    battles = [build_battle([{"type": 'infantry', "count": 4}, {"type": 'commander', "count": 1}],
+                            [{"type": 'infantry', "count": 4}, {"type": 'commander', "count": 1}]) for _ in range(2)]
+    battles[1].log = BattleLog(cap=8, chunk=3)
+    for battle in battles:
+        rng, policy = random.Random(4), GreedyPolicy()
+        while battle.phase == Phase.PLACEMENT:
+            battle.place_unit(battle.current_player, *policy.place(battle, battle.current_player, rng))
+        for _ in range(40):
+            if battle.phase != Phase.BATTLE:
+                break
+            action = policy.act(battle, battle.current_player, rng)
+            if action is None:
+                battle.end_turn(battle.current_player)
+            else:
+                apply_action(battle, battle.current_player, action)
+    full, capped = battles
+    assert capped.log._offset > 0
+    assert capped.log.export() == full.log.export()
+    while full.unmake():
+        assert capped.unmake()
+        assert capped.log == full.log
+    assert len(capped.log) == 0
@@ -0,0 +1,199 @@
+import pytest
+from game.game_manager import Battle, Phase, UnitType, UnitStatus, Orientation
+from game.board import ArrayBoard, BitBoard, DictBoard, SparseBoard, make_board
+
+BACKENDS = ['dict', 'array', 'bitboard', 'sparse']
+
+
+def make_armies(aggressor_units, defender_units):
+    return [
+        {"id": 1, "owner": 1, "units": [{"type": t, "count": c} for t, c in aggressor_units]},
+        {"id": 1, "owner": 2, "units": [{"type": t, "count": c} for t, c in defender_units]},
+    ]
+
+
+def board_snapshot(battle):
+    return [[battle.board.get(x, y) for x in range(9)] for y in range(9)]
+
+
+def play_skirmish(board):
+    """Place two small armies face to face and resolve a couple of turns."""
+    armies = make_armies(
+        [(UnitType.COMMANDER, 1), (UnitType.INFANTRY, 2)],
+        [(UnitType.COMMANDER, 1), (UnitType.SHOCK, 2)],
+    )
+    battle = Battle(1, 2, armies, board=board)
+    placements = [
+        (1, UnitType.COMMANDER, 0, 8, 'north'),
+        (2, UnitType.COMMANDER, 8, 0, 'south'),
+        (1, UnitType.INFANTRY, 4, 7, 'north'),
+        (2, UnitType.SHOCK, 4, 1, 'south'),
+        (1, UnitType.INFANTRY, 5, 7, 'north'),
+        (2, UnitType.SHOCK, 5, 1, 'south'),
+    ]
+    for player, unit_type, x, y, orientation in placements:
+        assert battle.place_unit(player, unit_type, x, y, orientation)['success']
+    assert battle.phase == Phase.BATTLE
+
+    results = []
+    for step in range(5):
+        results.append(battle.move_unit(1, 4, 7 - step, 4, 6 - step))
+        results.append(battle.end_turn(1))
+        results.append(battle.end_turn(2))
+    return battle, results
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_make_board(kind):
+    board = make_board(kind)
+    assert board.width == 9 and board.height == 9
+    assert len(board) == 9
+    assert all(unit is None for row in board for unit in row)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        make_board('hex')
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_place_move_and_remove(kind):
+    board = make_board(kind)
+    board.place(3, 4, UnitType.CAVALRY, 12345678901234, Orientation.EAST)
+    unit = board.get(3, 4)
+    assert unit == {
+        "type": UnitType.CAVALRY,
+        "owner": 12345678901234,
+        "orientation": Orientation.EAST,
+        "has_acted": False,
+        "status": UnitStatus.HEALTHY
+    }
+    assert board[4][3] == unit
+
+    board.move(3, 4, 3, 5)
+    assert not board.is_occupied(3, 4)
+    board.set_acted(3, 5, True)
+    board.set_status(3, 5, UnitStatus.DAMAGED)
+    assert board.get(3, 5)['has_acted']
+    assert board.get(3, 5)['status'] == UnitStatus.DAMAGED
+
+    board.reset_acted(12345678901234)
+    assert not board.get(3, 5)['has_acted']
+    assert [(x, y) for x, y, _ in board.units()] == [(3, 5)]
+    assert board.remove(3, 5)['type'] == UnitType.CAVALRY
+    assert list(board.units()) == []
+
+
+def test_array_reset_acted_only_touches_owner():
+    board = ArrayBoard()
+    board.place(0, 0, UnitType.INFANTRY, 1, Orientation.NORTH, has_acted=True)
+    board.place(1, 0, UnitType.INFANTRY, 2, Orientation.NORTH, has_acted=True)
+    board.reset_acted(1)
+    assert not board.get(0, 0)['has_acted']
+    assert board.get(1, 0)['has_acted']
+
+
+def test_array_row_assignment_removes_unit():
+    board = ArrayBoard()
+    board.place(2, 2, UnitType.ARCHER, 1, Orientation.WEST)
+    board[2][2] = None
+    assert board.get(2, 2) is None
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_count(kind):
+    board = make_board(kind)
+    board.place(0, 0, UnitType.COMMANDER, 1, Orientation.NORTH)
+    board.place(1, 0, UnitType.INFANTRY, 1, Orientation.NORTH)
+    board.place(2, 0, UnitType.INFANTRY, 2, Orientation.NORTH)
+    assert board.count(1) == 2
+    assert board.count(1, UnitType.COMMANDER) == 1
+    assert board.count(2, UnitType.COMMANDER) == 0
+    assert board.count(3) == 0
+
+
+def test_bitboard_masks_follow_mutations():
+    board = BitBoard()
+    board.place(1, 1, UnitType.SHOCK, 1, Orientation.SOUTH)
+    board.move(1, 1, 1, 2)
+    board.set_orientation(1, 2, Orientation.EAST)
+    bit = 1 << (2 * 9 + 1)
+    assert board.occupied == bit
+    assert board.owners[1] == bit
+    assert board.types[UnitType.SHOCK] == bit
+    assert board.orientations[Orientation.EAST] == bit
+    assert board.orientations[Orientation.SOUTH] == 0
+    board.remove(1, 2)
+    assert board.occupied == 0 and board.owners[1] == 0
+
+
+def test_backends_play_identically():
+    dict_battle, dict_results = play_skirmish('dict')
+    assert isinstance(dict_battle.board, DictBoard)
+    for kind, board_class in (('array', ArrayBoard), ('bitboard', BitBoard), ('sparse', SparseBoard)):
+        battle, results = play_skirmish(kind)
+        assert isinstance(battle.board, board_class)
+        assert results == dict_results
+        assert board_snapshot(battle) == board_snapshot(dict_battle)
+        assert battle.phase == dict_battle.phase
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_turn_unit(kind):
+    armies = make_armies([(UnitType.COMMANDER, 1)], [(UnitType.COMMANDER, 1)])
+    battle = Battle(1, 2, armies, board=kind)
+    battle.place_unit(1, UnitType.COMMANDER, 4, 8, 'north')
+    battle.place_unit(2, UnitType.COMMANDER, 4, 0, 'south')
+
+    result = battle.turn_unit(1, 4, 8, 'sideways')
+    assert not result['success']
+    result = battle.turn_unit(1, 4, 8, 'east')
+    assert result['success']
+    assert battle.board.get(4, 8)['orientation'] == Orientation.EAST
+    assert not battle.turn_unit(1, 4, 8, 'west')['success']
+    assert battle.log[-1]['type'] == 'turn'
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_units_in_rectangle(kind):
+    board = make_board(kind, 20, 20)
+    for x, y in [(0, 0), (7, 7), (8, 8), (15, 9), (19, 19)]:
+        board.place(x, y, UnitType.INFANTRY, 1, Orientation.NORTH)
+    assert [(x, y) for x, y, _ in board.units_in(7, 7, 15, 9)] == [(7, 7), (8, 8), (15, 9)]
+    assert [(x, y) for x, y, _ in board.units_in(-5, -5, 30, 30)] == [(0, 0), (7, 7), (8, 8), (15, 9), (19, 19)]
+    board.move(8, 8, 16, 16)
+    assert [(x, y) for x, y, _ in board.units_in(9, 9, 19, 19)] == [(15, 9), (16, 16), (19, 19)]
+
+
+def test_sparse_board_only_stores_units():
+    board = SparseBoard(64, 64)
+    board.place(63, 63, UnitType.CAVALRY, 1, Orientation.WEST)
+    board.move(63, 63, 0, 0)
+    board.remove(0, 0)
+    assert board.cells == {} and board.buckets == {}
+
+
+def test_large_board_battle():
+    armies = make_armies([(UnitType.COMMANDER, 1), (UnitType.ARCHER, 1)], [(UnitType.COMMANDER, 1)])
+    battle = Battle(1, 2, armies, board='sparse', width=64, height=64, deployment_depth=4)
+    assert battle.deployment_zones == {1: (60, 63), 2: (0, 3)}
+    result = battle.place_unit(1, UnitType.COMMANDER, 10, 59, 'north')
+    assert not result['success'] and 'y: 60-63' in result['message']
+    assert battle.place_unit(1, UnitType.COMMANDER, 63, 63, 'north')['success']
+    assert battle.place_unit(2, UnitType.COMMANDER, 40, 3, 'south')['success']
+    assert battle.place_unit(1, UnitType.ARCHER, 40, 60, 'north')['success']
+    assert battle.phase == Phase.BATTLE
+
+    for y in range(60, 7, -1):
+        assert battle.move_unit(1, 40, y, 40, y - 1)['success']
+        assert battle.end_turn(1)['success']
+        assert battle.end_turn(2)['success']
+    # Three tiles from the defender's commander, the archer is in range.
+    assert battle.move_unit(1, 40, 7, 40, 6)['success']
+    result = battle.end_turn(1)
+    assert result.get('battle_ended') and result['winner'] == 1
+
+
+def test_deployment_depth_must_fit_the_board():
+    with pytest.raises(ValueError):
+        Battle(1, 2, [], deployment_depth=5)
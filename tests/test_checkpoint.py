@@ -0,0 +1,185 @@
+import json
+import random
+import pytest
+from game.battle_log import LogEvent
+from game.checkpoint import CheckpointError, decode_battle, decode_game, encode_battle, encode_game, encode_log
+from game.enums import Phase, UnitType
+from game.game_manager import GameManager, GameState
+from game.simulation import GreedyPolicy, apply_action, build_battle
+
+AGGRESSOR_ID, DEFENDER_ID = 301234567890123456, 401234567890123456
+ARMIES = ([{"type": UnitType.SHOCK, "count": 2}, {"type": UnitType.CAVALRY, "count": 2},
+           {"type": UnitType.COMMANDER, "count": 1}],
+          [{"type": 'infantry', "count": 4}, {"type": UnitType.COMMANDER, "count": 1}])
+
+
+def state(battle):
+    return (sorted((x, y, tuple(sorted(unit.items(), key=lambda kv: kv[0]))) for x, y, unit in battle.board.units()),
+            battle.zobrist, battle.phase, battle.winner, battle.current_player, battle.placed_count,
+            battle.total_unit_count, battle.remaining_units, battle.positions, battle.commander_positions,
+            battle.placed_units, battle.armies, battle.log, battle.legal_actions())
+
+
+def played(kind='dict', actions=30, seed=2, size=9):
+    battle = build_battle(*ARMIES, board=kind, aggressor_id=AGGRESSOR_ID, defender_id=DEFENDER_ID, size=size)
+    rng, policy = random.Random(seed), GreedyPolicy()
+    for _ in range(4):
+        battle.place_unit(battle.current_player, *policy.place(battle, battle.current_player, rng))
+    yield battle
+    while battle.phase == Phase.PLACEMENT:
+        battle.place_unit(battle.current_player, *policy.place(battle, battle.current_player, rng))
+    for _ in range(actions):
+        if battle.phase != Phase.BATTLE:
+            break
+        player = battle.current_player
+        action = policy.act(battle, player, rng)
+        if action is None:
+            battle.end_turn(player)
+        else:
+            apply_action(battle, player, action)
+    yield battle
+
+
+@pytest.mark.parametrize("kind, size", [('dict', 9), ('array', 9), ('bitboard', 9), ('sparse', 9), ('sparse', 64)])
+def test_battle_round_trip(kind, size):
+    for battle in played(kind, size=size):
+        restored = decode_battle(encode_battle(battle))
+        assert restored.board.kind == kind
+        assert (restored.board.width, restored.board.height) == (size, size)
+        assert restored.deployment_zones == battle.deployment_zones
+        assert state(restored) == state(battle)
+
+
+def test_restored_battle_plays_on_identically():
+    for battle in played(actions=10):
+        pass
+    restored = decode_battle(encode_battle(battle))
+    rng_a, rng_b, policy = random.Random(9), random.Random(9), GreedyPolicy()
+    for _ in range(30):
+        if battle.phase != Phase.BATTLE:
+            break
+        player = battle.current_player
+        action = policy.act(battle, player, rng_a)
+        assert policy.act(restored, player, rng_b) == action
+        for b in (battle, restored):
+            b.end_turn(player) if action is None else apply_action(b, player, action)
+        assert state(restored) == state(battle)
+
+
+def test_checkpoints_are_compact():
+    for battle in played(actions=200):
+        pass
+    data = encode_battle(battle)
+    as_json = json.dumps(battle.log.export(), default=lambda value: value.value)
+    assert len(data) * 8 < len(as_json)
+
+
+def test_forfeit_and_end_messages_survive():
+    battle = build_battle(*ARMIES, aggressor_id=AGGRESSOR_ID, defender_id=DEFENDER_ID)
+    battle.forfeit_battle(AGGRESSOR_ID)
+    assert decode_battle(encode_battle(battle)).log == battle.log
+
+
+def test_game_round_trip():
+    game = GameState({'id': AGGRESSOR_ID, 'name': 'A'}, {'id': DEFENDER_ID, 'name': 'B'})
+    game.add_army(AGGRESSOR_ID)
+    game.resources[DEFENDER_ID]['unique_resources'] = {"Amber": "Shiny"}
+    assert decode_game(encode_game(game)).__dict__ == game.__dict__
+    for game.battle in played():
+        restored = decode_game(encode_game(game))
+        assert state(restored.battle) == state(game.battle)
+
+
+def test_bad_checkpoints_are_rejected():
+    with pytest.raises(CheckpointError):
+        decode_battle(b'nope')
+    with pytest.raises(CheckpointError):
+        decode_game(encode_game(GameState({'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}))[:-3])
+
+
+def test_games_are_restored_lazily_after_a_restart():
+    gm = GameManager()
+    game = gm.create_game(555, {'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'})
+    game.battle = next(played())
+    gm.checkpoint(555)
+
+    restarted = GameManager()
+    assert restarted.games == {}
+    restored = restarted.get_game(555)
+    assert restored is not None and restarted.games == {555: restored}
+    assert state(restored.battle) == state(game.battle)
+    assert restarted.create_game(555, {'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}) is None
+
+    assert restarted.end_game(555)
+    assert GameManager().get_game(555) is None
+
+
+def test_coalition_battle_round_trip():
+    from game.game_manager import Battle
+    from game.replay import BattleReplay
+    ally = 501234567890123456
+    armies = [{"id": 1, "owner": AGGRESSOR_ID, "units": [{"type": UnitType.COMMANDER, "count": 1}]},
+              {"id": 1, "owner": DEFENDER_ID, "units": [{"type": UnitType.COMMANDER, "count": 1}]},
+              {"id": 4, "owner": ally, "units": [{"type": UnitType.INFANTRY, "count": 2}]}]
+    battle = Battle(AGGRESSOR_ID, DEFENDER_ID, armies, allies={ally: DEFENDER_ID})
+    assert battle.place_unit(AGGRESSOR_ID, UnitType.COMMANDER, 4, 8, 'north')['success']
+    assert battle.place_unit(ally, UnitType.INFANTRY, 4, 1, 'south')['success']
+    restored = decode_battle(encode_battle(battle))
+    assert restored.sides == battle.sides
+    assert restored._remaining_by_side == battle._remaining_by_side
+    assert state(restored) == state(battle)
+    assert BattleReplay.from_battle(restored).position(2).units[13][1] == DEFENDER_ID
+
+
+
+def test_checkpoints_only_append_new_log_events(monkeypatch):
+    import game.game_manager as manager
+    import utils.sheets_sync as store
+    monkeypatch.setattr(manager, 'LOG_SEGMENT_RECORDS', 8)
+    gm = GameManager()
+    game = gm.create_game(556, {'id': AGGRESSOR_ID, 'name': 'A'}, {'id': DEFENDER_ID, 'name': 'B'})
+    for game.battle in played(actions=40):
+        pass
+    battle, rng, policy = game.battle, random.Random(4), GreedyPolicy()
+    gm.checkpoint(556)
+    sizes = [len(store.load_log_segment(556))]
+    for _ in range(12):
+        battle.end_turn(battle.current_player)
+        gm.checkpoint(556)
+        sizes.append(len(store.load_log_segment(556)))
+        assert state(GameManager().get_game(556).battle) == state(battle)
+    # Each checkpoint appends the few events its action logged, until the segment is rewritten as one record.
+    growth = [b - a for a, b in zip(sizes, sizes[1:])]
+    assert all(0 < n < 40 for n in growth[:7]) and growth[7] < 0
+    assert sizes[8] < sizes[0] + sum(growth[:7])
+
+
+def test_log_segment_follows_undo_and_crashes():
+    import utils.sheets_sync as store
+    gm = GameManager()
+    game = gm.create_game(557, {'id': AGGRESSOR_ID, 'name': 'A'}, {'id': DEFENDER_ID, 'name': 'B'})
+    for game.battle in played(actions=6):
+        pass
+    battle = game.battle
+    gm.checkpoint(557)
+    length = len(battle.log)
+    del battle.log[length - 3:]
+    gm.checkpoint(557)
+    assert len(GameManager().get_game(557).battle.log) == length - 3
+    battle.log.add('forfeit', AGGRESSOR_ID, text="A forfeits.")
+    gm.checkpoint(557)
+    assert GameManager().get_game(557).battle.log == battle.log
+
+    # A crash mid-append leaves part of a record behind, which is dropped.
+    segment = store.load_log_segment(557)
+    store.save_log_segment(557, segment + b'\x00\x05\x01')
+    assert GameManager().get_game(557).battle.log == battle.log
+    # So are events of a record written just before a crash cut the checkpoint off.
+    extra = encode_log(battle, len(battle.log), [LogEvent('end_turn', (DEFENDER_ID,))])
+    store.save_log_segment(557, segment + extra)
+    restored = GameManager()
+    assert restored.get_game(557).battle.log == battle.log
+    # The first checkpoint after a restart rewrites the segment.
+    restored.checkpoint(557)
+    assert store.load_log_segment(557) == encode_log(battle, 0, battle.log)
+    assert GameManager().get_game(557).battle.log == battle.log
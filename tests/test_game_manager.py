@@ -84,3 +84,149 @@ def test_placement_to_battle_phase_transition(setup_game):
         placed[player] += 1
     assert b.phase == Phase.BATTLE, "Battle phase did not start after placement"
 
+
+
+def test_coalition_battle_removes_losing_side_armies():
+    from game.game_manager import game_manager
+    aggressor, defender, ally = {'id': 901, 'name': 'A'}, {'id': 902, 'name': 'B'}, 903
+    for player_id in (aggressor['id'], defender['id'], ally, ally):
+        game_manager.add_global_army(player_id)
+    game = game_manager.create_game(9001, aggressor, defender)
+    assert not game.join_war(ally, defender['id'], 7)['success']
+    assert game.join_war(ally, defender['id'], 1)['success']
+    assert game.join_war(ally, defender['id'], 2)['success']
+    assert not game.join_war(ally, aggressor['id'], 1)['success']
+
+    res = game.start_battle([1], 1)
+    assert res['success']
+    assert game.battle.sides[ally] == defender['id']
+    assert game.battle.total_unit_count == 24
+    assert game.battle.forfeit_battle(ally)['winner'] == aggressor['id']
+    assert game_manager.end_battle(9001)['success']
+
+    assert game_manager.get_player_armies(defender['id']) == []
+    assert game_manager.get_player_armies(ally) == []
+    assert [a['id'] for a in game_manager.get_player_armies(aggressor['id'])] == [1]
+    # New ids follow the highest one in use, so they never collide with a surviving army.
+    assert game_manager.add_global_army(aggressor['id'])['id'] == 2
+    assert game_manager.disband_global_army(aggressor['id'], 1)['success']
+    assert game_manager.add_global_army(aggressor['id'])['id'] == 3
+    game_manager.end_game(9001)
+
+
+def test_defeated_ally_leaves_the_war():
+    from game.game_manager import game_manager
+    aggressor, defender, ally, friend = {'id': 911, 'name': 'A'}, {'id': 912, 'name': 'B'}, 913, 914
+    for player_id in (aggressor['id'], defender['id'], ally, friend):
+        game_manager.add_global_army(player_id)
+    game = game_manager.create_game(9011, aggressor, defender)
+    assert game.join_war(ally, defender['id'], 1)['success']
+    assert game.join_war(friend, aggressor['id'], 1)['success']
+    assert game.start_battle(1, 1)['success']
+    assert game.battle.forfeit_battle(defender['id'])['winner'] == aggressor['id']
+    assert game_manager.end_battle(9011)['success']
+    assert game.allies == {friend: {"side": aggressor['id'], "armies": [1]}}
+
+    # The war goes on with a fresh defending army and without the defeated ally.
+    game_manager.add_global_army(defender['id'])
+    res = game.start_battle(1, 1)
+    assert res['success'], res['message']
+    assert set(game.battle.sides) == {aggressor['id'], defender['id'], friend}
+    game_manager.end_game(9011)
+
+
+@pytest.mark.parametrize('loser', ["bot", "player"])
+def test_practice_battles_do_not_leave_bot_armies_behind(loser):
+    from game.game_manager import game_manager
+    player, bot = {'id': 921 if loser == "bot" else 923, 'name': 'A'}, {'id': 922, 'name': 'Bot'}
+    game_manager.add_global_army(player['id'])
+    game = game_manager.create_game(9021, player, bot)
+    game.bot_difficulty = 'easy'
+    bot_army = game_manager.add_global_army(bot['id'])
+    assert game.start_battle(1, bot_army['id'])['success']
+    game.battle.forfeit_battle(bot['id'] if loser == "bot" else player['id'])
+    assert game_manager.end_battle(9021)['success']
+    assert game_manager.get_player_armies(bot['id']) == []
+    assert len(game_manager.get_player_armies(player['id'])) == (loser == "bot")
+    game_manager.end_game(9021)
+
+
+def test_commands_persist_only_dirty_records(monkeypatch):
+    import utils.sheets_sync as store
+    writes = []
+    monkeypatch.setattr(store, 'sync_records', lambda **changes: writes.append(changes))
+    gm = GameManager()
+    for _ in range(3):
+        gm.add_global_army(5)
+    writes.clear()
+
+    assert gm.disband_global_army(5, 2)['success']
+    assert writes == [{"armies": [], "removed_armies": [(5, 2)], "resources": {}, "battles": []}]
+    writes.clear()
+    assert gm.modify_global_army(5, 3, 'archer')['success']
+    assert len(writes) == 1
+    assert [a['id'] for a in writes[0]['armies']] == [3]
+    assert writes[0]['resources'] == {5: gm.global_players[5]['resources']}
+    writes.clear()
+    assert not gm.craft_global_bronze(5, 50)['success']
+    assert writes == []
+
+
+def test_disbanded_army_is_removed_from_store():
+    import utils.sheets_sync as store
+    gm = GameManager()
+    for _ in range(3):
+        gm.add_global_army(6)
+    gm.disband_global_army(6, 1)
+    gm.add_global_resources(6, food=5)
+    assert [a['id'] for a in store.get_armies(6)] == [2, 3]
+    assert store.load_resources() == [{"player": 6, "resources": gm.global_players[6]['resources']}]
+
+
+@pytest.mark.parametrize('storage', ["journal", "sqlite"])
+def test_players_are_restored_after_restart(monkeypatch, storage):
+    import utils.sheets_sync as store
+    monkeypatch.setattr(store, 'STORAGE', storage)
+    gm = GameManager()
+    for player_id in (11, 12, 13):
+        gm.add_global_army(player_id)
+        gm.add_global_army(player_id)
+    gm.modify_global_army(11, 2, 'archer')
+    store.compact()
+    gm.disband_global_army(11, 1)
+    gm.add_global_army(11)
+    gm.add_global_resources(12, coins=5)
+
+    # A new process: nothing is loaded until a player is used.
+    monkeypatch.setattr(store, '_player_indexes', None)
+    restarted = GameManager()
+    assert restarted.global_players == {}
+    armies = restarted.get_player_armies(11)
+    assert [a['id'] for a in armies] == [2, 3]
+    assert armies[0]['units'][-1] == {"type": UnitType.ARCHER, "count": 3}
+    # Units bought after the restart join the restored ones instead of listing the type twice.
+    assert restarted.modify_global_army(11, 2, 'archer')['success']
+    assert armies[0]['units'][-1] == {"type": UnitType.ARCHER, "count": 6}
+    assert len(armies[0]['units']) == 3
+    assert restarted.get_global_resources(11)['resources']['timber'] == 3
+    assert restarted.get_global_resources(12)['resources']['coins'] == 15
+    assert restarted.add_global_army(13)['id'] == 3
+    assert set(restarted.global_players) == {11, 12, 13}
+    assert restarted.get_player_armies(14) == []
+
+
+def test_idle_players_are_dropped_and_read_back(monkeypatch):
+    import game.game_manager as manager
+    monkeypatch.setattr(manager, 'PLAYER_CACHE_SIZE', 2)
+    gm = GameManager()
+    gm.add_global_army(31)
+    gm.modify_global_army(31, 1, 'archer')
+    gm.add_global_army(32)
+    gm.get_player_armies(31)
+    gm.add_global_army(33)
+    assert list(gm.global_players) == [31, 33]
+    assert 32 not in gm._army_index
+    assert [a['id'] for a in gm.get_player_armies(32)] == [1]
+    assert list(gm.global_players) == [33, 32]
+    assert gm.get_player_armies(31)[0]['units'][-1] == {"type": UnitType.ARCHER, "count": 3}
+    assert gm.add_global_army(31)['id'] == 2
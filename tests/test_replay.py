@@ -0,0 +1,81 @@
+import json
+import random
+import pytest
+from game.enums import Phase, UnitType
+from game.replay import BattleReplay
+from game.simulation import GreedyPolicy, apply_action, build_battle
+
+ARMIES = ([{"type": UnitType.SHOCK, "count": 2}, {"type": UnitType.CAVALRY, "count": 2},
+           {"type": UnitType.COMMANDER, "count": 1}],
+          [{"type": UnitType.INFANTRY, "count": 4}, {"type": UnitType.COMMANDER, "count": 1}])
+
+
+def units(board):
+    return sorted((x, y, unit['type'], unit['owner'], unit['orientation'], unit['status'], unit['has_acted'])
+                  for x, y, unit in board.units())
+
+
+def play_recording(kind='dict', seed=3):
+    """Play a greedy game and return the battle plus the board and phase after every log event."""
+    battle = build_battle(*ARMIES, board=kind)
+    rng, policy = random.Random(seed), GreedyPolicy()
+    seen = {0: (units(battle.board), battle.phase)}
+    while battle.phase == Phase.PLACEMENT:
+        battle.place_unit(battle.current_player, *policy.place(battle, battle.current_player, rng))
+        seen[len(battle.log)] = (units(battle.board), battle.phase)
+    for _ in range(80):
+        if battle.phase != Phase.BATTLE:
+            break
+        player = battle.current_player
+        action = policy.act(battle, player, rng)
+        if action is None:
+            battle.end_turn(player)
+        else:
+            apply_action(battle, player, action)
+        seen[len(battle.log)] = (units(battle.board), battle.phase)
+    return battle, seen
+
+
+@pytest.mark.parametrize("kind", ['dict', 'array', 'bitboard'])
+def test_replay_rebuilds_every_recorded_position(kind):
+    battle, seen = play_recording(kind)
+    replay = BattleReplay.from_battle(battle, keyframe_interval=5)
+    for index, (expected, phase) in seen.items():
+        state = replay.position(index)
+        assert units(state.to_board(kind)) == expected
+        assert state.phase == phase
+    assert replay.position(len(battle.log)).winner == battle.winner
+    with pytest.raises(IndexError):
+        replay.position(len(battle.log) + 1)
+
+
+def test_replay_seeks_by_turn():
+    battle, _ = play_recording()
+    replay = BattleReplay.from_battle(battle)
+    assert replay.turn_start(0) == 0
+    ends = [i + 1 for i, event in enumerate(battle.log) if event['type'] == 'end_turn']
+    assert [replay.turn_start(t) for t in range(1, replay.turns)] == ends
+    assert replay.position_at_turn(2).turn == 2
+    with pytest.raises(IndexError):
+        replay.turn_start(replay.turns)
+
+
+def test_replay_follows_log_growth_and_rollback():
+    battle, seen = play_recording()
+    replay = BattleReplay.from_battle(battle, keyframe_interval=4)
+    length = len(battle.log)
+    for _ in range(6):
+        battle.unmake()
+    replay.sync()
+    assert len(replay) == len(battle.log) < length
+    assert units(replay.board_at(len(battle.log))) == units(battle.board)
+    for index, (expected, _) in seen.items():
+        if index <= len(battle.log):
+            assert units(replay.board_at(index)) == expected
+
+
+def test_replay_reads_logs_stored_as_json():
+    battle, seen = play_recording()
+    log = json.loads(json.dumps(battle.log.export(), default=lambda value: value.value))
+    replay = BattleReplay(log, battle.aggressor_id, battle.defender_id, total_units=battle.total_unit_count)
+    assert units(replay.board_at(len(log))) == seen[len(log)][0]
@@ -0,0 +1,203 @@
+import json
+
+import pytest
+import utils.sheets_sync as store
+from game.enums import UnitType
+
+
+def army(army_id, owner, count):
+    return {"id": army_id, "owner": owner, "units": [{"type": UnitType.INFANTRY, "count": count}]}
+
+
+def test_writes_are_queued_and_coalesced(local_store, monkeypatch):
+    monkeypatch.setattr(store, 'FLUSH_WINDOW', 60)
+    record = army(1, 7, 2)
+    store.sync_army(record)
+    store.sync_army(army(2, 7, 1))
+    record["units"][0]["count"] = 5
+    store.sync_army(army(1, 7, 6))
+    store.sync_battle({"winner": 7})
+    store.save_checkpoint(3, b"first")
+    store.save_checkpoint(3, b"second")
+    assert not (local_store / "armies.journal").exists()
+    # Reads see queued writes without waiting for them.
+    assert store.load_checkpoint(3) == b"second"
+    assert [a["units"][0]["count"] for a in store.load_armies()] == [6, 1]
+    assert (local_store / "armies.journal").read_bytes() == b""
+
+    assert store.flush(timeout=5)
+    lines = (local_store / "armies.journal").read_text().splitlines()
+    assert [json.loads(line)["seq"] for line in lines] == [1, 2]
+    assert json.loads(lines[0])["record"]["units"][0] == {"type": 'INFANTRY', "count": 6}
+    assert [a["units"][0]["count"] for a in store.load_armies()] == [6, 1]
+    assert store.load_battles() == [{"winner": 7}]
+    assert store.load_checkpoint(3) == b"second"
+    store.delete_checkpoint(3)
+    assert store.load_checkpoint(3) is None
+
+
+def test_compaction_folds_journal_into_snapshot(local_store, monkeypatch):
+    monkeypatch.setattr(store, 'COMPACT_EVERY', 3)
+    for i in range(7):
+        store.sync_army(army(i % 2, 7, i))
+        store.sync_battle({"game": i})
+    store.compact()
+
+    assert not (local_store / "armies.journal.old").exists()
+    assert (local_store / "armies.journal").read_bytes() == b""
+    snapshot = json.loads((local_store / "battles.json").read_text())
+    assert snapshot["seq"] == 7
+    assert [b["game"] for b in snapshot["records"]] == list(range(7))
+    assert [a["units"][0]["count"] for a in store.load_armies()] == [6, 5]
+
+
+def test_recovery_replays_journal_after_crash(local_store):
+    store.sync_battle({"game": 0})
+    store.sync_battle({"game": 1})
+    store.compact()
+    store.sync_battle({"game": 2})
+    store._battles.close()
+    # A compaction that wrote its snapshot but died before removing the set-aside journal,
+    # and an append cut off halfway through a line.
+    (local_store / "battles.journal.old").write_text('{"seq":2,"record":{"game":1}}\n')
+    with (local_store / "battles.journal").open("a") as f:
+        f.write('{"seq":4,"rec')
+
+    store.sync_battle({"game": 3})
+    assert [b["game"] for b in store.load_battles()] == [0, 1, 2, 3]
+    store.compact()
+    assert [b["game"] for b in store.load_battles()] == [0, 1, 2, 3]
+
+
+def test_reads_legacy_list_snapshot(local_store):
+    legacy = [army(1, 7, 2), army(2, 8, 3)]
+    (local_store / "armies.json").write_text(json.dumps(legacy, indent=2, default=lambda e: e.value))
+    store.sync_army(army(2, 8, 4))
+    store.compact()
+    assert [a["units"][0]["count"] for a in store.load_armies()] == [2, 4]
+    assert json.loads((local_store / "armies.json").read_text())["seq"] == 1
+
+
+def battle(battle_id, aggressor, defender, winner, sides=None):
+    return {"id": battle_id, "aggressor": aggressor, "defender": defender, "winner": winner,
+            "armies": [{"id": 1, "owner": aggressor, "units": []}, {"id": 1, "owner": defender, "units": []}],
+            "sides": sides or {}, "log": []}
+
+
+def test_sqlite_backend_indexed_queries(local_store, monkeypatch):
+    monkeypatch.setattr(store, 'STORAGE', "sqlite")
+    store.sync_army(army(1, 7, 2))
+    store.sync_army(army(2, 7, 1))
+    store.sync_army(army(1, 7, 5))
+    store.sync_army(army(1, 8, 3))
+    store.sync_battle(battle("a", 7, 8, None))
+    store.sync_battle(battle("a", 7, 8, 7))
+    store.sync_battle(battle("b", 8, 9, 9, sides={7: 9}))
+
+    store.flush()
+    assert not (local_store / "armies.journal").exists()
+    assert store._database.db.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert store.get_army(7, "1")["units"] == [{"type": 'INFANTRY', "count": 5}]
+    assert store.get_army(9, 1) is None
+    assert [a["id"] for a in store.get_armies(7)] == [1, 2]
+    assert [b["id"] for b in store.find_battles(player=7)] == ["b", "a", "a"]
+    assert [b["id"] for b in store.find_battles(winner=9)] == ["b"]
+    assert store.battle_record(7) == {"battles": 2, "wins": 2}
+    assert store.battle_record(8) == {"battles": 2, "wins": 0}
+
+
+def test_queries_match_between_backends(local_store, monkeypatch):
+    for record in (battle("a", 7, 8, 8), battle("b", 8, 9, 9, sides={7: 9})):
+        store.sync_battle(record)
+    store.sync_army(army(3, 7, 1))
+    journaled = (store.battle_record(7), store.find_battles(player=7, limit=1), store.get_armies(7))
+
+    # Selecting SQLite on a journaled data directory imports the records once.
+    monkeypatch.setattr(store, 'STORAGE', "sqlite")
+    assert (store.battle_record(7), store.find_battles(player=7, limit=1), store.get_armies(7)) == journaled
+    assert journaled[0] == {"battles": 2, "wins": 1}
+    assert len(store.load_battles()) == 2
+
+
+def test_existing_database_selects_sqlite(local_store, monkeypatch):
+    monkeypatch.setattr(store, 'STORAGE', "sqlite")
+    store.sync_army(army(1, 7, 2))
+    monkeypatch.setattr(store, 'STORAGE', "")
+    store.sync_army(army(2, 7, 2))
+    assert not (local_store / "armies.journal").exists()
+    assert len(store.get_armies(7)) == 2
+
+
+@pytest.mark.parametrize('storage', ["journal", "sqlite"])
+def test_removed_armies_and_resources(local_store, monkeypatch, storage):
+    monkeypatch.setattr(store, 'STORAGE', storage)
+    store.sync_records(armies=[army(1, 7, 2), army(2, 7, 3)], resources={7: {"food": 1}})
+    store.sync_records(removed_armies=[(7, 1)], resources={7: {"food": 4}})
+    store.remove_army(7, 9)
+    store.compact()
+    assert [a["id"] for a in store.load_armies()] == [2]
+    assert store.load_resources() == [{"player": 7, "resources": {"food": 4}}]
+
+
+@pytest.mark.parametrize('storage', ["journal", "sqlite"])
+def test_reads_include_queued_writes(local_store, monkeypatch, storage):
+    monkeypatch.setattr(store, 'STORAGE', storage)
+    store.sync_records(armies=[army(1, 7, 2), army(2, 7, 3)], battles=[battle("a", 7, 8, 8)])
+    store.flush()
+    store.index_players()
+    monkeypatch.setattr(store, 'FLUSH_WINDOW', 60)
+    store.sync_records(armies=[army(1, 7, 5)], removed_armies=[(7, 2)], resources={7: {"food": 1}},
+                       battles=[battle("b", 8, 7, 7)])
+    store.set_active_battle_threads([5])
+
+    def everything():
+        return (store.load_armies(), store.load_resources(), store.get_army(7, 1), store.get_army(7, 2),
+                store.get_armies(7), store.find_battles(player=7, limit=1), store.battle_record(7),
+                store.get_active_battle_threads(), store.load_player(7))
+    queued = everything()
+    assert queued[0] == [{"id": 1, "owner": 7, "units": [{"type": 'INFANTRY', "count": 5}]}]
+    assert queued[8] == (queued[0], {"food": 1})
+    assert queued[3] is None and [b["id"] for b in queued[5]] == ["b"]
+    assert queued[6] == {"battles": 2, "wins": 1} and queued[7] == {"5"}
+    # What readers get is theirs to change; the queued records are written as they were.
+    queued[2]["units"].clear()
+    store.flush()
+    stored = everything()
+    assert stored[2] == {"id": 1, "owner": 7, "units": [{"type": 'INFANTRY', "count": 5}]}
+    assert stored[:2] + stored[3:] == queued[:2] + queued[3:]
+
+
+def test_compaction_reindexes_players(local_store, monkeypatch):
+    monkeypatch.setattr(store, '_player_indexes', None)
+    store.sync_records(armies=[army(1, 7, 2), army(1, 8, 1)], resources={7: {"food": 1}})
+    store.flush()
+    assert store.index_players() == 2
+    indexes = store._player_indexes
+    assert indexes[0].changes and indexes[1].changes
+    store.sync_army(army(2, 7, 4))
+    store.compact()
+    # The journals are in the snapshots now, and so are the changes the index held.
+    assert all(new is not old and not new.changes for new, old in zip(store._player_indexes, indexes))
+    store.remove_army(7, 1)
+    store.flush()
+    assert store.load_player(7) == ([{"id": 2, "owner": 7, "units": [{"type": 'INFANTRY', "count": 4}]}],
+                                    {"food": 1})
+    assert store.load_player(9) == ([], None)
+
+
+def test_appends_join_queued_file_writes(local_store, monkeypatch):
+    monkeypatch.setattr(store, 'FLUSH_WINDOW', 60)
+    store.save_log_segment(4, b"ab")
+    store.save_log_segment(4, b"cd", append=True)
+    assert store.load_log_segment(4) == b"abcd"
+    store.flush()
+    store.save_log_segment(4, b"ef", append=True)
+    store.save_log_segment(4, b"gh", append=True)
+    assert store.load_log_segment(4) == b"abcdefgh"
+    store.flush()
+    assert (local_store / "checkpoints" / "4.log").read_bytes() == b"abcdefgh"
+    store.delete_checkpoint(4)
+    store.save_log_segment(4, b"ij", append=True)
+    assert store.load_log_segment(4) == b"ij"
+    store.flush()
+    assert store.load_log_segment(4) == b"ij"
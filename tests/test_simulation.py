@@ -0,0 +1,95 @@
+import json
+import random
+
+import pytest
+from game.enums import Phase, UnitType
+from game.simulation import (GreedyPolicy, RandomPolicy, ScriptedPolicy, SimulationError, battle_fingerprint,
+                             build_battle, derive_seed, make_jobs, make_policy, play, replay, replay_stream,
+                             run_batch, simulate)
+
+SMALL_ARMY = [{"type": 'infantry', "count": 2}, {"type": 'commander', "count": 1}]
+
+
+def test_build_battle_copies_compositions():
+    battle = build_battle(SMALL_ARMY, SMALL_ARMY)
+    battle.place_unit(1, UnitType.INFANTRY, 0, 8, 'north')
+    assert SMALL_ARMY[0]['count'] == 2
+    assert battle.remaining_units[1][UnitType.INFANTRY] == 1
+
+
+def test_simulate_is_reproducible_for_a_seed():
+    job = {"seed": 42, "aggressor": SMALL_ARMY, "defender": SMALL_ARMY, "policies": ('random', 'greedy')}
+    first, second = simulate(job), simulate(job)
+    for record in (first, second):
+        record.pop('elapsed')
+    assert first == second
+    assert first['finished']
+
+
+def test_scripted_policy_plays_its_script():
+    aggressor = ScriptedPolicy(
+        placements=[(UnitType.COMMANDER, 0, 8, 'north'), (UnitType.INFANTRY, 4, 7, 'north')],
+        turns=[[('move', 4, 7, 4, 6)], [('turn', 4, 6, 'east')]],
+    )
+    defender = ScriptedPolicy(placements=[(UnitType.COMMANDER, 8, 0, 'south'), (UnitType.INFANTRY, 0, 0, 'east')])
+    battle = build_battle([{"type": 'commander', "count": 1}, {"type": 'infantry', "count": 1}],
+                          [{"type": 'commander', "count": 1}, {"type": 'infantry', "count": 1}])
+    summary = play(battle, {1: aggressor, 2: defender}, random.Random(0), max_turns=4)
+    assert summary['actions'] == 2
+    assert summary['turns'] == 4
+    assert not summary['finished']
+    assert battle.board.get(4, 6)['orientation'].value == 'east'
+
+
+def test_uneven_armies_finish_placement():
+    job = {"seed": 1, "aggressor": [{"type": 'infantry', "count": 6}, {"type": 'commander', "count": 1}],
+           "defender": SMALL_ARMY, "policies": ('random', 'random'), "max_turns": 1}
+    record = simulate(job)
+    assert 'error' not in record
+    assert record['turns'] == 1
+
+
+def test_run_batch_streams_every_game():
+    jobs = list(make_jobs(6, SMALL_ARMY, SMALL_ARMY, seed=10))
+    inline = sorted(run_batch(jobs, processes=1), key=lambda r: r['game'])
+    pooled = sorted(run_batch(jobs, processes=2, chunksize=1), key=lambda r: r['game'])
+    assert [r['game'] for r in pooled] == list(range(6))
+    assert [r['winner'] for r in pooled] == [r['winner'] for r in inline]
+
+
+def test_make_policy():
+    assert isinstance(make_policy('random'), RandomPolicy)
+    assert make_policy(('random', {"end_turn_chance": 0.5})).end_turn_chance == 0.5
+    greedy = GreedyPolicy()
+    assert make_policy(greedy) is greedy
+
+
+def test_derive_seed_is_stable_and_independent():
+    assert derive_seed(10, 3) == derive_seed(10, 3)
+    assert len({derive_seed(10, game) for game in range(100)} | {derive_seed(11, game) for game in range(100)}) == 200
+    assert 0 <= derive_seed(10, 'worker', 2) < 2 ** 64
+
+
+def test_recorded_stream_replays_bit_for_bit():
+    job = {"seed": 7, "aggressor": SMALL_ARMY, "defender": SMALL_ARMY, "policies": ('random', 'greedy'),
+           "record": True}
+    record = json.loads(json.dumps(simulate(job)))
+    assert record['stream'][0][0] == 'place'
+    assert record['stream'].count(['end_turn']) == record['turns']
+    battle = replay_stream(job, record['stream'])
+    assert battle_fingerprint(battle) == record['fingerprint']
+    assert battle.winner == record['winner']
+    assert replay(job, record)['fingerprint'] == record['fingerprint']
+
+    record['stream'] = record['stream'][:-1]
+    record['fingerprint'] = battle_fingerprint(replay_stream(job, record['stream']))
+    with pytest.raises(SimulationError):
+        replay(job, record)
+
+
+def test_pooled_runs_match_inline_runs():
+    jobs = list(make_jobs(4, SMALL_ARMY, SMALL_ARMY, policies=('random', 'random'), seed=3, record=True))
+    inline = {r['game']: r['fingerprint'] for r in run_batch(jobs, processes=1)}
+    pooled = {r['game']: r['fingerprint'] for r in run_batch(jobs, processes=2, chunksize=1)}
+    assert pooled == inline
+    assert len(set(inline.values())) == 4
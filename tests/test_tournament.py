@@ -0,0 +1,110 @@
+import csv
+import json
+
+import pytest
+from game.tournament import (INITIAL_RATING, Tournament, TournamentError, expected_score, load_roster,
+                             round_robin_rounds, swiss_pairings)
+
+ROSTER = [
+    {"name": "shock", "army": "shock:2,commander:1"},
+    {"name": "infantry", "army": [{"type": 'infantry', "count": 2}, {"type": 'commander', "count": 1}]},
+    {"name": "cavalry", "army": "cavalry:2,commander:1", "policy": "random"},
+]
+
+
+def make(tmp_path, **settings):
+    settings.setdefault('max_turns', 12)
+    return Tournament(ROSTER, tmp_path / "cup", **settings)
+
+
+def test_round_robin_meets_everyone_once():
+    names = ['a', 'b', 'c', 'd', 'e']
+    rounds = round_robin_rounds(names)
+    pairs = [frozenset(pair) for round_pairs in rounds for pair in round_pairs]
+    assert len(pairs) == len(set(pairs)) == 10
+    for round_pairs in rounds:
+        seated = [name for pair in round_pairs for name in pair]
+        assert len(seated) == len(set(seated))
+
+
+def test_swiss_avoids_rematches_and_rotates_byes():
+    pairs, bye = swiss_pairings(['a', 'b', 'c', 'd', 'e'], {frozenset('ab')}, {'e'})
+    assert bye == 'd'
+    assert pairs == [('a', 'c'), ('b', 'e')]
+
+
+def test_roster_validation():
+    with pytest.raises(TournamentError):
+        load_roster([ROSTER[0], ROSTER[0]])
+    with pytest.raises(TournamentError):
+        load_roster([ROSTER[0], {"name": "x", "army": "dragon:1"}])
+    with pytest.raises(TournamentError):
+        load_roster([ROSTER[0], {"name": "x", "policy": "psychic"}])
+
+
+def test_round_robin_keeps_elo_and_writes_results(tmp_path):
+    tournament = make(tmp_path)
+    rows = tournament.run(processes=1)
+    assert len(tournament.results) == 6
+    assert sum(row['games'] for row in rows) == 12
+    # Elo only moves points between entries.
+    assert sum(tournament.ratings.values()) == pytest.approx(3 * INITIAL_RATING)
+    assert sum(tournament.scores.values()) == 6
+
+    lines = tournament.results_path.read_text().splitlines()
+    assert {json.loads(line)['key'] for line in lines} == set(tournament.results)
+    with tournament.standings_path.open() as f:
+        table = list(csv.DictReader(f))
+    assert [row['name'] for row in table] == [row['name'] for row in rows]
+
+
+def test_errored_games_are_not_draws(tmp_path, monkeypatch):
+    import game.simulation as simulation
+    play = simulation.play
+
+    def crashing(battle, policies, rng, **kwargs):
+        if any(isinstance(policy, simulation.RandomPolicy) for policy in policies.values()):
+            raise simulation.SimulationError("random policy crashed")
+        return play(battle, policies, rng, **kwargs)
+    monkeypatch.setattr(simulation, 'play', crashing)
+    tournament = make(tmp_path)
+    rows = {row['name']: row for row in tournament.run(processes=1)}
+    assert rows['cavalry']['errors'] == 4 and rows['cavalry']['games'] == 0
+    assert rows['cavalry']['rating'] == INITIAL_RATING and rows['cavalry']['score'] == 0
+    assert rows['shock']['errors'] == rows['infantry']['errors'] == 2
+    assert rows['shock']['games'] == rows['infantry']['games'] == 2
+    assert sum(tournament.scores.values()) == 2
+
+
+def test_resume_plays_only_missing_games(tmp_path):
+    full = make(tmp_path).run(processes=1)
+    path = tmp_path / "cup" / "results.jsonl"
+    lines = path.read_text().splitlines(keepends=True)
+    # Lose two games and leave half a line behind, as a crash would.
+    path.write_text(''.join(lines[:4]) + lines[4][:10])
+
+    played = []
+    resumed = make(tmp_path).run(processes=1, progress=played.append)
+    assert len(played) == 2
+    assert resumed == full
+    assert len(path.read_text().splitlines()) == 6
+
+
+def test_resume_refuses_other_settings(tmp_path):
+    make(tmp_path).run(processes=1)
+    with pytest.raises(TournamentError):
+        make(tmp_path, games_per_pair=4).run(processes=1)
+
+
+def test_swiss_tournament(tmp_path):
+    tournament = make(tmp_path, format='swiss', rounds=3, games_per_pair=1)
+    tournament.run(processes=1)
+    assert tournament.rounds_done == 3
+    assert tournament.byes == {'shock', 'infantry', 'cavalry'}
+    assert len(tournament.results) == 3
+    assert sum(tournament.scores.values()) == 6
+
+
+def test_expected_score_is_symmetric():
+    assert expected_score(1600, 1400) + expected_score(1400, 1600) == pytest.approx(1.0)
+    assert expected_score(1500, 1500) == 0.5
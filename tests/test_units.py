@@ -0,0 +1,42 @@
+import pytest
+from game.enums import UnitType
+from game.game_manager import Battle
+from game.units import IMMUNE_AGAINST, UNIT_SPECS, resolve_unit_type, unit_spec
+
+
+def test_resolve_unit_type_spellings():
+    assert resolve_unit_type(UnitType.SHOCK) is UnitType.SHOCK
+    assert resolve_unit_type('SHOCK') is UnitType.SHOCK
+    assert resolve_unit_type('shock') is UnitType.SHOCK
+    assert resolve_unit_type(' Shock ') is UnitType.SHOCK
+    assert resolve_unit_type('dragon') is None
+    assert resolve_unit_type(None) is None
+
+
+def test_unit_spec_rejects_unknown_types():
+    assert unit_spec('cavalry').movement == 3
+    with pytest.raises(ValueError):
+        unit_spec('dragon')
+
+
+def test_specs_are_immutable():
+    spec = UNIT_SPECS[UnitType.COMMANDER]
+    with pytest.raises(AttributeError):
+        spec.movement = 5
+    assert not hasattr(spec, '__dict__')
+    assert isinstance(spec.immune_to, frozenset)
+
+
+def test_immunity_table():
+    assert IMMUNE_AGAINST[UnitType.INFANTRY] == {UnitType.SHOCK, UnitType.COMMANDER}
+    assert IMMUNE_AGAINST[UnitType.COMMANDER] == {UnitType.SHOCK}
+    assert IMMUNE_AGAINST[UnitType.CHARIOT] == frozenset()
+
+
+def test_get_unit_properties_is_shared_and_read_only():
+    battle = Battle(1, 2, [])
+    props = battle.get_unit_properties('shock')
+    assert props is battle.get_unit_properties(UnitType.SHOCK)
+    assert UnitType.CAVALRY in props['immune_to']
+    with pytest.raises(TypeError):
+        props['movement'] = 2
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from game.win_probability import estimate_win_probability, normalize_units, wilson_interval
+
+ARMY = [{"type": 'infantry', "count": 2}, {"type": 'commander', "count": 1}]
+STRONGER = [{"type": 'COMMANDER', "count": 1}, {"type": 'shock', "count": 3}, {"type": 'infantry', "count": 2}]
+
+
+def test_normalize_units_ignores_order_and_spelling():
+    assert normalize_units(ARMY) == "COMMANDER:1,INFANTRY:2"
+    assert normalize_units([{"type": 'Commander', "count": 1}, {"type": 'INFANTRY', "count": 1},
+                            {"type": 'infantry', "count": 1}, {"type": 'shock', "count": 0}]) == "COMMANDER:1,INFANTRY:2"
+    with pytest.raises(ValueError):
+        normalize_units([{"type": 'dragon', "count": 1}])
+
+
+def test_wilson_interval():
+    low, high = wilson_interval(50, 100)
+    assert low < 0.5 < high
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    assert wilson_interval(10, 10)[1] == pytest.approx(1.0)
+
+
+def test_estimate_is_memoized_on_disk(tmp_path):
+    cache = tmp_path / "odds.json"
+    first = estimate_win_probability(STRONGER, ARMY, games=20, processes=1, cache_path=cache)
+    assert first['success'] and first['games'] == 20 and not first['cached']
+    low, high = first['confidence_interval']
+    assert low <= first['win_probability'] <= high
+
+    again = estimate_win_probability(STRONGER, ARMY, games=20, processes=1, cache_path=cache)
+    assert again['cached'] and again['wins'] == first['wins']
+
+    # The reverse matchup is served from the same entry
+    reverse = estimate_win_probability(ARMY, STRONGER, games=10, processes=1, cache_path=cache)
+    assert reverse['cached']
+    assert reverse['wins'] == first['losses'] and reverse['losses'] == first['wins']
+
+
+def test_time_budget_stops_early(tmp_path):
+    result = estimate_win_probability(STRONGER, ARMY, games=10_000, time_budget=0.2, processes=1, cache_path=False)
+    assert 0 < result['games'] < 10_000
+
+
+def test_resumed_estimate_matches_an_uninterrupted_one(tmp_path):
+    cache = tmp_path / "odds.json"
+    full = estimate_win_probability(ARMY, STRONGER, games=12, processes=1, cache_path=False)
+    partial = estimate_win_probability(STRONGER, ARMY, games=12, time_budget=0, processes=1, cache_path=cache)
+    assert partial['games'] == 1
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        resumed = estimate_win_probability(ARMY, STRONGER, games=12, cache_path=cache, executor=executor)
+    assert (resumed['wins'], resumed['losses'], resumed['draws']) == (full['wins'], full['losses'], full['draws'])
+    # Other simulation settings are estimated separately.
+    assert not estimate_win_probability(ARMY, STRONGER, games=12, processes=1, cache_path=cache, seed=1)['cached']
+
+
+def test_failed_games_are_not_counted_as_draws(tmp_path, monkeypatch):
+    import game.simulation as simulation
+    play = simulation.play
+
+    def flaky(battle, policies, rng, **kwargs):
+        if rng.random() < 0.3:
+            raise simulation.SimulationError("policy crashed")
+        return play(battle, policies, rng, **kwargs)
+    monkeypatch.setattr(simulation, 'play', flaky)
+    cache = tmp_path / "odds.json"
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        result = estimate_win_probability(STRONGER, ARMY, games=20, cache_path=cache, executor=executor)
+    assert not result['success'] and "policy crashed" in result['message']
+    assert not cache.exists()
@@ -4,21 +4,33 @@ from typing import List, Optional, Dict, Any
 from game.enums import UnitType, Orientation
 
 
+# Largest image side in pixels; tiles shrink on boards bigger than 9x9 to stay within it.
+MAX_IMAGE_SIZE = 9 * 64
+# Smallest tile, in pixels, that still fits a unit label; smaller tiles show a coloured marker instead.
+MIN_LABEL_TILE_SIZE = 16
+
+
 class BattlefieldRenderer:
     def __init__(self, board: List[List[Optional[Dict[str, Any]]]],
                  tile_size: int = 64):
         self.board = board
-        self.tile_size = tile_size
-        self.width = 9 * tile_size
-        self.height = 9 * tile_size
+        self.columns = getattr(board, 'width', None) or len(board[0])
+        self.rows = getattr(board, 'height', None) or len(board)
+        self.tile_size = max(8, min(tile_size, MAX_IMAGE_SIZE // max(self.columns, self.rows)))
+        self.width = self.columns * self.tile_size
+        self.height = self.rows * self.tile_size
         self.image = Image.new('RGB', (self.width, self.height), 'white')
         self.draw = ImageDraw.Draw(self.image)
+        self.show_labels = self.tile_size >= MIN_LABEL_TILE_SIZE
         # Use a larger font size for better emoji visibility
         try:
             self.font = ImageFont.truetype("seguiemj.ttf", self.tile_size // 2)
         except Exception:
-            # Fallback to default font if truetype font is not available
-            self.font = ImageFont.load_default()
+            # Fallback to default font if truetype font is not available; Pillow 10.1+ can size it too
+            try:
+                self.font = ImageFont.load_default(size=self.tile_size // 2)
+            except TypeError:
+                self.font = ImageFont.load_default()
         self.unit_emojis = {
             UnitType.INFANTRY: '🛡️',
             UnitType.COMMANDER: '👑',
@@ -27,42 +39,62 @@ class BattlefieldRenderer:
             UnitType.CAVALRY: '🐎',
             UnitType.CHARIOT: '🏛️',
         }
+        self.unit_colors = {
+            UnitType.INFANTRY: 'steelblue',
+            UnitType.COMMANDER: 'gold',
+            UnitType.SHOCK: 'firebrick',
+            UnitType.ARCHER: 'forestgreen',
+            UnitType.CAVALRY: 'saddlebrown',
+            UnitType.CHARIOT: 'purple',
+        }
 
     def draw_grid(self):
-        for i in range(10):
+        for i in range(self.columns + 1):
             self.draw.line(
                 [(i * self.tile_size, 0), (i * self.tile_size, self.height)],
                 fill='black'
             )
+        for i in range(self.rows + 1):
             self.draw.line(
                 [(0, i * self.tile_size), (self.width, i * self.tile_size)],
                 fill='black'
             )
 
+    def _units(self):
+        # Boards list their units directly; plain grids of rows are scanned.
+        if hasattr(self.board, 'units'):
+            return self.board.units()
+        return ((x, y, unit) for y, row in enumerate(self.board) for x, unit in enumerate(row) if unit)
+
     def draw_units(self):
-        for y, row in enumerate(self.board):
-            for x, unit in enumerate(row):
-                if unit:
-                    unit_type = unit['type'] if isinstance(unit['type'], UnitType) else UnitType(unit['type'])
-                    emoji = self.unit_emojis.get(unit_type, '❓')
-                    pos_x = x * self.tile_size + self.tile_size // 4
-                    pos_y = y * self.tile_size + self.tile_size // 4
+        for x, y, unit in self._units():
+            unit_type = unit['type'] if isinstance(unit['type'], UnitType) else UnitType(unit['type'])
+            if not self.show_labels:
+                left, top = x * self.tile_size, y * self.tile_size
+                self.draw.rectangle(
+                    [(left + 1, top + 1), (left + self.tile_size - 2, top + self.tile_size - 2)],
+                    fill=self.unit_colors.get(unit_type, 'gray')
+                )
+                continue
+            emoji = self.unit_emojis.get(unit_type, '❓')
+            pos_x = x * self.tile_size + self.tile_size // 4
+            pos_y = y * self.tile_size + self.tile_size // 4
 
-                    # This is a simplified way to draw emojis.
-                    # For better quality, you might need a library
-                    # that can handle emoji rendering properly,
-                    # or use images for units.
-                    try:
-                        self.draw.text(
-                            (pos_x, pos_y), emoji, font=self.font,
-                            fill="black"
-                        )
-                    except Exception as e:
-                        print(f"Could not render emoji {emoji}: {e}")
-                        self.draw.text(
-                            (pos_x, pos_y), "?", font=self.font,
-                            fill="black"
-                        )
+            # This is a simplified way to draw emojis.
+            # For better quality, you might need a library
+            # that can handle emoji rendering properly,
+            # or use images for units.
+            try:
+                self.draw.text(
+                    (pos_x, pos_y), emoji, font=self.font,
+                    fill="black"
+                )
+            except Exception as e:
+                print(f"Could not render emoji {emoji}: {e}")
+                self.draw.text(
+                    (pos_x, pos_y), "?", font=self.font,
+                    fill="black"
+                )
 
     def render_board(self):
         self.draw_grid()
@@ -1,7 +1,13 @@
+import atexit
+import copy
 import json
 import os
 from pathlib import Path
+import re
 import threading
+import time
+
+from utils.sqlite_store import SQLiteStore, battle_participants
 
 # Local JSON storage directory (create if missing)
 DATA_DIR = Path(os.getenv("BATTLE_SIM_DATA_DIR", "data")).resolve()
@@ -10,6 +16,13 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 ARMIES_FILE = DATA_DIR / "armies.json"
 BATTLES_FILE = DATA_DIR / "battles.json"
 ACTIVE_BATTLES_FILE = DATA_DIR / "active_battles.json"
+RESOURCES_FILE = DATA_DIR / "resources.json"
+
+# Armies and battles go to JSON journals ("journal") or to an SQLite database
+# ("sqlite", see utils/sqlite_store.py). Left unset, a data directory that
+# already holds the database uses it.
+STORAGE = os.getenv("BATTLE_SIM_STORAGE", "")
+DATABASE_FILE = DATA_DIR / "battle_sim.db"
 
 _lock = threading.Lock()
 
@@ -37,52 +50,839 @@ def _enum_to_str(obj):
         return str(obj.value)
     return obj
 
-def _atomic_write_json(path: Path, data) -> None:
+
+# --- Append-only journals for armies and battles ---
+# Each record set is a snapshot file holding the state at the last compaction
+# plus a journal with one compact JSON line per change since. Writes only
+# append to the journal. Once COMPACT_EVERY changes have piled up the journal
+# is set aside (".journal.old") and merged into a new snapshot on a background
+# thread while writes go on in a fresh journal. Journal lines carry a sequence
+# number and the snapshot records the last one it includes, so a compaction
+# cut short by a crash is simply run again on the next start.
+COMPACT_EVERY = 1000
+
+_SNAPSHOT_HEADER = re.compile(rb'\{"seq": ?(\d+)')
+
+
+def _read_journal(path: Path):
+    """Return the entries of a journal file and the byte length of its complete lines.
+
+    A crash mid-append can leave a partial last line; it is ignored.
+    """
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return [], 0
+    entries, end = [], 0
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        end += len(line)
+        try:
+            entries.append(json.loads(line))
+        except ValueError as e:
+            print(f"[Local Store] Skipping a bad line in {path.name}: {e}")
+    return entries, end
+
+
+class _Journal:
+    """Snapshot plus append-only journal of one record set.
+
+    ``snapshot_path`` is called for the snapshot's current path, so the
+    module-level file settings can be changed at runtime. ``key`` gives a
+    record's identity (a tuple) for upserts and deletes; without it every
+    record is appended. ``compacted``, if given, is called with the snapshot
+    path after each compaction, while the compaction lock is still held.
+    Call ``append`` with ``_lock`` held.
+    """
+
+    def __init__(self, snapshot_path, key=None, compacted=None):
+        self._snapshot_path = snapshot_path
+        self.key = key
+        self.compacted = compacted
+        self.path = None
+        self.seq = 0
+        self.pending = 0
+        self._file = None
+        self._compactor = None
+        self._compact_lock = threading.Lock()
+
+    @staticmethod
+    def _journal_path(path: Path) -> Path:
+        return path.with_suffix(".journal")
+
+    @staticmethod
+    def _old_path(path: Path) -> Path:
+        return path.with_suffix(".journal.old")
+
+    def _open(self):
+        # Recover on first use: find the last sequence number and cut off a partial last line.
+        path = self._snapshot_path()
+        if path == self.path and self._file is not None:
+            return
+        self.close()
+        journal = self._journal_path(path)
+        entries, end = _read_journal(journal)
+        old_entries, _ = _read_journal(self._old_path(path))
+        self.seq = max([_snapshot_seq(path)] + [e["seq"] for e in old_entries + entries])
+        self.pending = len(entries)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = journal.open("ab")
+        self._file.truncate(end)
+        self.path = path
+        if old_entries or self.pending >= COMPACT_EVERY:
+            self.start_compaction()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.path = None
+
+    def append(self, records, deleted=()):
+        """Journal a batch of JSON-ready records and keys of deleted records with a single write."""
+        changes = [{"record": record} for record in records] + [{"delete": key} for key in deleted]
+        if not changes:
+            return
+        self._open()
+        lines = []
+        for change in changes:
+            self.seq += 1
+            lines.append(json.dumps({"seq": self.seq, **change}, ensure_ascii=False, separators=(",", ":")))
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._file.flush()
+        self.pending += len(changes)
+        if self.pending >= COMPACT_EVERY:
+            self.start_compaction()
+
+    def start_compaction(self):
+        """Set the journal aside and merge it into the snapshot in the background; call with ``_lock`` held.
+
+        Returns the compaction thread, or None when there is nothing to compact.
+        """
+        if self._compactor is not None and self._compactor.is_alive():
+            return self._compactor
+        path = self.path
+        old = self._old_path(path)
+        # A journal left over from an interrupted compaction is merged first; the live one waits its turn.
+        if not old.exists():
+            if not self.pending:
+                return None
+            self._file.close()
+            self._journal_path(path).replace(old)
+            self._file = self._journal_path(path).open("ab")
+            self.pending = 0
+        self._compactor = threading.Thread(target=self._compact, args=(path,), daemon=True,
+                                           name=f"compact-{path.stem}")
+        self._compactor.start()
+        return self._compactor
+
+    def _compact(self, path: Path):
+        with self._compact_lock:
+            old = self._old_path(path)
+            try:
+                seq, records = self._merge(path, _read_journal(old)[0])
+                _write_snapshot(path, seq, records)
+                old.unlink(missing_ok=True)
+            except Exception as e:
+                # The set-aside journal is kept, so the next compaction tries again.
+                print(f"[Local Store] Failed to compact {path.name}: {e}")
+                return
+            if self.compacted is not None:
+                self.compacted(path)
+
+    def _merge(self, path: Path, entries):
+        # Unlike _read_json this raises on a damaged snapshot rather than compacting over it.
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = []
+        if isinstance(data, dict):
+            seq, records = data.get("seq", 0), data.get("records", [])
+        else:
+            seq, records = 0, data
+        applied = [e for e in entries if e["seq"] > seq]
+        if self.key is None:
+            records.extend(e["record"] for e in applied)
+        else:
+            by_key = {self.key(r): r for r in records}
+            for entry in applied:
+                if "delete" in entry:
+                    by_key.pop(tuple(entry["delete"]), None)
+                else:
+                    by_key[self.key(entry["record"])] = entry["record"]
+            records = list(by_key.values())
+        return max([seq] + [e["seq"] for e in applied]), records
+
+    def records(self):
+        """All records: the snapshot with any set-aside and live journal replayed on top, and the queued changes.
+
+        Returns (records, pending) with ``pending`` from ``_queue.pending()``,
+        taken while the files cannot change.
+        """
+        with self._compact_lock, _lock:
+            self._open()
+            return self.read(self.path), _queue.pending()
+
+    def read(self, path: Path):
+        # Merge the files as they are; records() holds the locks that keep them still.
+        entries = _read_journal(self._old_path(path))[0] + _read_journal(self._journal_path(path))[0]
+        try:
+            return self._merge(path, entries)[1]
+        except Exception as e:
+            print(f"[Local Store] Failed to read {path.name}: {e}")
+            return []
+
+
+def _snapshot_seq(path: Path) -> int:
+    # The header is on the snapshot's first line, so a large snapshot is not parsed just for it.
+    try:
+        with path.open("rb") as f:
+            match = _SNAPSHOT_HEADER.match(f.readline())
+    except FileNotFoundError:
+        return 0
+    return int(match.group(1)) if match else 0
+
+
+def _write_snapshot(path: Path, seq: int, records) -> None:
+    # One record per line after a {"seq": N, "records": [ header; still a plain JSON document.
     tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(f'{{"seq": {seq}, "records": [')
+        for i, record in enumerate(records):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        f.write("\n]}\n")
+    tmp.replace(path)
+
+
+def _army_key(record):
+    return str(record.get("id")), str(record.get("owner"))
+
+
+def _resources_key(record):
+    return str(record.get("player")),
+
+
+_armies = _Journal(lambda: ARMIES_FILE, key=_army_key, compacted=lambda path: _reindex(0, path))
+_battles = _Journal(lambda: BATTLES_FILE)
+_resources = _Journal(lambda: RESOURCES_FILE, key=_resources_key, compacted=lambda path: _reindex(1, path))
+_database = None
+
+
+def _sqlite():
+    """Return the SQLite store if it is the selected backend, else None; call with ``_lock`` held."""
+    global _database
+    if (STORAGE or ("sqlite" if DATABASE_FILE.exists() else "journal")) != "sqlite":
+        return None
+    if _database is None or _database.path != DATABASE_FILE:
+        if _database is not None:
+            _database.close()
+        _database = SQLiteStore(DATABASE_FILE)
+        if _database.is_empty():
+            # Switching an existing data directory over: bring the journaled records along.
+            armies, battles = _armies.read(ARMIES_FILE), _battles.read(BATTLES_FILE)
+            resources = _resources.read(RESOURCES_FILE)
+            if armies or battles or resources:
+                _database.write(armies, battles, resources=resources)
+                print(f"[Local Store] Imported {len(armies)} armies, {len(battles)} battles and "
+                      f"{len(resources)} players' resources into {DATABASE_FILE.name}")
+    return _database
+
+
+# --- Write-behind queue ---
+# Writes return as soon as they are queued; a worker thread persists them in
+# batches. Writes arriving within FLUSH_WINDOW seconds of each other share a
+# batch: the newest version of each army, player's resources and file wins,
+# appends to a file join the version queued before them, battles are kept in
+# order, and the batch is one journal write per record set or one SQLite
+# transaction.
+# Readers never wait for the writer: they lay the changes still queued or
+# being written over what they read from the store.
+FLUSH_WINDOW = 0.05
+
+
+def _write_file(path: Path, data) -> None:
+    # Atomically replace a file with ``data``, or delete it when ``data`` is None.
     try:
-        # Convert enums to strings before saving
-        safe_data = _enum_to_str(data)
-        with tmp.open("w", encoding="utf-8") as f:
-            json.dump(safe_data, f, ensure_ascii=False, indent=2)
+        if data is None:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(data)
         tmp.replace(path)
     except Exception as e:
         print(f"[Local Store] Failed to write {path.name}: {e}")
 
 
+def _append_file(path: Path, data) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("ab") as f:
+            f.write(data)
+    except Exception as e:
+        print(f"[Local Store] Failed to append to {path.name}: {e}")
+
+
+def _write_batch(armies, resources, battles, files):
+    # ``armies`` maps each army's key to its record, or to None if it was removed; ``resources`` maps
+    # each player's key to their record and ``files`` each path to (data, whether to append it), in the
+    # order they were last written.
+    removed = [key for key, record in armies.items() if record is None]
+    armies = [record for record in armies.values() if record is not None]
+    resources = list(resources.values())
+    with _lock:
+        try:
+            database = _sqlite()
+            if database is None:
+                _armies.append(armies, removed)
+                _resources.append(resources)
+                _battles.append(battles)
+                if _player_indexes is not None and _player_indexes[0].path == ARMIES_FILE:
+                    _player_indexes[0].apply(armies, removed)
+                    _player_indexes[1].apply(resources)
+            else:
+                database.write(armies, battles, removed, resources)
+        except Exception as e:
+            print(f"[Local Store] Failed to write {len(armies) + len(removed)} armies, {len(resources)} players' "
+                  f"resources and {len(battles)} battles: {e}")
+        # Still under the lock: readers now find these records in the store instead of the batch.
+        _queue.records_stored()
+    with _queue.files_lock:
+        for path, (data, append) in files.items():
+            (_append_file if append else _write_file)(path, data)
+        _queue.files_stored()
+
+
+class _WriteBehind:
+    """Pending army, resource, battle and file writes, persisted in batches by one worker thread."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # Held while a batch's files are written, so readers never see a batch half on disk
+        self.files_lock = threading.Lock()
+        self._armies = {}
+        self._resources = {}
+        self._battles = []
+        self._files = {}
+        # The batch being written: its records until they are stored, its files until they are replaced
+        self._writing = ({}, {}, [], {})
+        # Writes queued and written so far; flush() waits for the second to catch up with the first.
+        self._queued = 0
+        self._written = 0
+        self._flushers = 0
+        self._worker = None
+
+    def put(self, armies=(), removed_armies=(), resources=(), battles=()):
+        """Queue records (and keys of removed armies) together, so they land in the same batch."""
+        with self._cond:
+            for record in armies:
+                self._armies[_army_key(record)] = record
+            for key in removed_armies:
+                self._armies[key] = None
+            for record in resources:
+                self._resources[_resources_key(record)] = record
+            self._battles.extend(battles)
+            self._queued_one()
+
+    def put_file(self, path: Path, data, append=False):
+        """Queue a replacement of a file with ``data`` (None deletes it), or with ``append`` an append to it."""
+        with self._cond:
+            if append and path in self._files:
+                queued, queued_append = self._files[path]
+                data, append = (queued or b"") + data, queued_append
+            # Moved to the end, so files are written in the order they were last changed.
+            self._files.pop(path, None)
+            self._files[path] = (data, append)
+            self._queued_one()
+
+    def _queued_one(self):
+        self._queued += 1
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, daemon=True, name="store-writer")
+            self._worker.start()
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queued > self._written)
+                # Give later writes the rest of the window to join the batch, unless a flush is waiting.
+                deadline = time.monotonic() + FLUSH_WINDOW
+                while not self._flushers and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                batch = self._writing = self._armies, self._resources, self._battles, self._files
+                self._armies, self._resources, self._battles, self._files = {}, {}, [], {}
+                written = self._queued
+            _write_batch(*batch)
+            with self._cond:
+                self._writing = ({}, {}, [], {})
+                self._written = written
+                self._cond.notify_all()
+
+    def records_stored(self):
+        # Called by _write_batch with ``_lock`` held once the batch's records are in the store.
+        with self._cond:
+            self._writing = ({}, {}, [], self._writing[3])
+
+    def files_stored(self):
+        # Called by _write_batch with ``files_lock`` held once the batch's files are written.
+        with self._cond:
+            self._writing = self._writing[:3] + ({},)
+
+    def pending(self):
+        """Return (armies, resources, battles) not in the store yet, the batch being written included.
+
+        ``armies`` and ``resources`` map record keys to the newest record (None
+        for a removed army) and ``battles`` lists battle records in order.
+        Call with ``_lock`` held, so no batch lands between reading the store
+        and this.
+        """
+        with self._cond:
+            writing = self._writing
+            return ({**writing[0], **self._armies}, {**writing[1], **self._resources},
+                    writing[2] + self._battles)
+
+    def read_file(self, path: Path):
+        """Return the contents of a file with its queued and unwritten changes applied, or None if there is none."""
+        with self.files_lock:
+            with self._cond:
+                changes = [files[path] for files in (self._writing[3], self._files) if path in files]
+            data = None
+            if all(append for _, append in changes):
+                # Read under files_lock: the batch being written is either all on disk or not at all.
+                try:
+                    data = path.read_bytes()
+                except FileNotFoundError:
+                    pass
+        for change, append in changes:
+            data = (data or b"") + change if append else change
+        return data
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written; False if ``timeout`` ran out first."""
+        with self._cond:
+            target = self._queued
+            self._flushers += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._written >= target, timeout)
+            finally:
+                self._flushers -= 1
+
+
+_queue = _WriteBehind()
+
+
+def flush(timeout=None):
+    """Write out every queued change now and wait for it; call before shutdown."""
+    return _queue.flush(timeout)
+
+
+atexit.register(flush)
+
+
 # Sync an army to local storage
 # army_dict: {id, owner, units: [{type, count}, ...]}
 def sync_army(army_dict):
-    with _lock:
-        armies = _read_json(ARMIES_FILE, [])
-        # Find by (id, owner)
-        idx = next((i for i, rec in enumerate(armies)
-                    if str(rec.get("id")) == str(army_dict.get("id")) and str(rec.get("owner")) == str(army_dict.get("owner"))), None)
-        if idx is None:
-            armies.append(army_dict)
-        else:
-            armies[idx] = army_dict
-        _atomic_write_json(ARMIES_FILE, armies)
+    # Copied (with enums as strings) now, so later changes to the army don't race the writer.
+    _queue.put(armies=[_enum_to_str(army_dict)])
 
 
 # Sync a battle result to local storage
 def sync_battle(battle_dict):
+    _queue.put(battles=[_enum_to_str(battle_dict)])
+
+
+def remove_army(owner, army_id):
+    """Delete a disbanded or lost army from local storage."""
+    _queue.put(removed_armies=[(str(army_id), str(owner))])
+
+
+def sync_resources(player_id, resources):
+    """Store a player's resources, replacing the previous version."""
+    _queue.put(resources=[{"player": player_id, "resources": _enum_to_str(resources)}])
+
+
+def sync_records(armies=(), removed_armies=(), resources=None, battles=()):
+    """Store several changes as one write.
+
+    ``armies`` are army dicts, ``removed_armies`` (owner, army_id) pairs,
+    ``resources`` maps player ids to their resources and ``battles`` are
+    battle records.
+    """
+    resources = [{"player": player, "resources": _enum_to_str(res)} for player, res in (resources or {}).items()]
+    _queue.put(armies=[_enum_to_str(army) for army in armies],
+               removed_armies=[(str(army_id), str(owner)) for owner, army_id in removed_armies],
+               resources=resources, battles=[_enum_to_str(battle) for battle in battles])
+
+
+def _overlay(records, changes, key):
+    # Lay queued changes (record key -> record, or None if removed) over stored records. The queued
+    # records are copied, as they are written out later and callers may change what they get.
+    if not changes:
+        return records
+    by_key = {key(record): record for record in records}
+    for record_key, record in changes.items():
+        by_key[record_key] = copy.deepcopy(record)
+    return [record for record in by_key.values() if record is not None]
+
+
+def _stored(query, journal):
+    # Run ``query`` on the SQLite store, or read ``journal``, together with the changes still queued.
+    with _lock:
+        database = _sqlite()
+        if database is not None:
+            return query(database), _queue.pending()
+    return journal.records()
+
+
+def load_armies():
+    """Return every stored army record, the latest version of each (id, owner)."""
+    records, pending = _stored(lambda database: database.armies(), _armies)
+    return _overlay(records, pending[0], _army_key)
+
+
+def load_resources():
+    """Return every stored {"player", "resources"} record."""
+    records, pending = _stored(lambda database: database.resources(), _resources)
+    return _overlay(records, pending[1], _resources_key)
+
+
+def load_battles():
+    """Return every stored battle record, oldest first."""
+    records, pending = _stored(lambda database: database.battles(), _battles)
+    return records + copy.deepcopy(pending[2])
+
+
+# --- Loading one player at a time ---
+class _RecordIndex:
+    """Where each player's records are in a journaled record set, to load one player without the rest.
+
+    Built with one pass over the snapshot that only picks each line's
+    ``field`` value out with a regex (records are one per line), plus the
+    journals replayed on top in memory; later writes are applied as they are
+    written. The snapshot it indexed stays open, so a compaction replacing
+    the file does not move the records under it (on POSIX systems). The
+    changes held in memory grow until the next compaction, which replaces
+    the index with one of the new snapshot (see ``_reindex``).
+    """
+
+    def __init__(self, journal, field, player_of_key):
+        self.key = journal.key
+        self.field = field
+        self.player_of_key = player_of_key
+        self.path = journal._snapshot_path()
+        self.offsets = {}
+        # player -> {record key: record, or None if deleted} from the journals and legacy snapshots
+        self.changes = {}
+        # The last journal entry applied
+        self.seq = 0
+        self._file = None
+        self._read_lock = threading.Lock()
+        pattern = re.compile(rb'"%s":(-?\d+|"(?:[^"\\]|\\.)*")' % field.encode())
+
+        try:
+            f = self.path.open("rb")
+        except FileNotFoundError:
+            f = None
+        if f is not None:
+            header = f.readline()
+            match = _SNAPSHOT_HEADER.match(header)
+            if match:
+                self.seq, offset = int(match.group(1)), len(header)
+                offsets = self.offsets
+                for line in f:
+                    found = pattern.search(line)
+                    if found:
+                        # Ids are usually plain numbers; only quoted ones need a JSON decode.
+                        token = found.group(1)
+                        player = json.loads(token) if token[:1] == b'"' else token.decode("ascii")
+                        # Most players have one record: keep a bare offset and only make a list for more.
+                        known = offsets.get(player)
+                        if known is None:
+                            offsets[player] = offset
+                        elif isinstance(known, int):
+                            offsets[player] = [known, offset]
+                        else:
+                            known.append(offset)
+                    offset += len(line)
+                self._file = f
+            else:
+                # A list written before the journals existed; small enough to hold until it is compacted.
+                f.close()
+                for record in _read_json(self.path, []):
+                    self._change(str(record.get(field)), self.key(record), record)
+
+        self.replay(_read_journal(journal._old_path(self.path))[0]
+                    + _read_journal(journal._journal_path(self.path))[0])
+
+    def _change(self, player, key, record):
+        self.changes.setdefault(player, {})[key] = record
+
+    def replay(self, entries):
+        """Apply the journal entries newer than the index."""
+        for entry in entries:
+            if entry["seq"] <= self.seq:
+                continue
+            if "delete" in entry:
+                self.apply((), [tuple(entry["delete"])])
+            else:
+                self.apply([entry["record"]])
+            self.seq = entry["seq"]
+
+    def apply(self, records, deleted=()):
+        """Follow records written (and keys deleted) after the index was built."""
+        for record in records:
+            self._change(str(record.get(self.field)), self.key(record), record)
+        for key in deleted:
+            self._change(self.player_of_key(key), key, None)
+
+    def records(self, player):
+        """Return the current records of one player (a string id)."""
+        by_key = {}
+        offsets = self.offsets.get(player, ())
+        if isinstance(offsets, int):
+            offsets = (offsets,)
+        if offsets:
+            with self._read_lock:
+                for offset in offsets:
+                    self._file.seek(offset)
+                    record = json.loads(self._file.readline().rstrip(b",\r\n"))
+                    by_key[self.key(record)] = record
+        by_key.update(self.changes.get(player, {}))
+        return [record for record in by_key.values() if record is not None]
+
+    def __len__(self):
+        return len(self.offsets.keys() | self.changes.keys())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+_player_indexes = None
+
+
+def _indexed():
+    # Whether _player_indexes covers the current files; call with ``_lock`` held.
+    return (_player_indexes is not None and _player_indexes[0].path == ARMIES_FILE
+            and _player_indexes[1].path == RESOURCES_FILE)
+
+
+def index_players():
+    """Index the stored armies and resources by player, if not done yet; returns how many players have records.
+
+    Meant to run once at startup, off the event loop: it writes out the
+    queued changes and scans both snapshots. ``load_player`` calls it too,
+    in case it did not. Only the journal backend needs it; the SQLite tables
+    are indexed already.
+    """
+    global _player_indexes
+    with _lock:
+        if _sqlite() is not None:
+            return None
+        indexed = _indexed()
+    if not indexed:
+        flush()
+        # The compaction locks keep the snapshots and set-aside journals still while they are read.
+        with _armies._compact_lock, _resources._compact_lock, _lock:
+            if not _indexed():
+                if _player_indexes is not None:
+                    for index in _player_indexes:
+                        index.close()
+                started = time.perf_counter()
+                _player_indexes = (_RecordIndex(_armies, "owner", lambda key: key[1]),
+                                   _RecordIndex(_resources, "player", lambda key: key[0]))
+                print(f"[Local Store] Indexed {len(_player_indexes[0])} players' armies and "
+                      f"{len(_player_indexes[1])} players' resources in {time.perf_counter() - started:.2f}s")
+    with _lock:
+        return len(_player_indexes[0].offsets.keys() | _player_indexes[0].changes.keys()
+                   | _player_indexes[1].offsets.keys() | _player_indexes[1].changes.keys())
+
+
+def _reindex(slot, path):
+    # Run by the compaction of the armies (slot 0) or resources (slot 1) into ``path``, with its
+    # compaction lock held: index the new snapshot, so the changes merged into it leave memory.
+    global _player_indexes
+    with _lock:
+        old = _player_indexes[slot] if _player_indexes is not None else None
+    if old is None or old.path != path:
+        return
+    journal = (_armies, _resources)[slot]
+    # Scanned without _lock, so writes go on meanwhile; they are caught up on from the journal below.
+    index = _RecordIndex(journal, old.field, old.player_of_key)
+    with _lock:
+        if _player_indexes is None or _player_indexes[slot] is not old:
+            index.close()
+            return
+        index.replay(_read_journal(journal._journal_path(path))[0])
+        indexes = list(_player_indexes)
+        indexes[slot] = index
+        _player_indexes = tuple(indexes)
+        old.close()
+
+
+def load_player(player_id):
+    """Return (army records, resources) stored for one player; resources is None when none are stored.
+
+    Changes still queued for writing are included, so nothing is flushed.
+    """
+    index_players()
+    player = str(player_id)
+    with _lock:
+        database = _sqlite()
+        if database is not None:
+            armies, resources = database.armies(player), database.resources(player)
+        else:
+            armies, resources = (index.records(player) for index in _player_indexes)
+        queued_armies, queued_resources, _ = _queue.pending()
+    armies = _overlay(armies, {key: a for key, a in queued_armies.items() if key[1] == player}, _army_key)
+    resources = _overlay(resources, {key: r for key, r in queued_resources.items() if key[0] == player},
+                         _resources_key)
+    return armies, resources[0]["resources"] if resources else None
+
+
+# --- Queries; indexed with the SQLite backend, scans of the journaled records otherwise ---
+def get_army(owner, army_id):
+    """Return the stored record of one army, or None."""
+    key = (str(army_id), str(owner))
     with _lock:
-        battles = _read_json(BATTLES_FILE, [])
-        battles.append(battle_dict)
-        _atomic_write_json(BATTLES_FILE, battles)
+        database = _sqlite()
+        if database is not None:
+            queued = _queue.pending()[0]
+            return copy.deepcopy(queued[key]) if key in queued else database.army(owner, army_id)
+    return next((a for a in load_armies() if _army_key(a) == key), None)
+
+
+def get_armies(owner):
+    """Return the stored army records of one player."""
+    with _lock:
+        database = _sqlite()
+        if database is not None:
+            records, queued = database.armies(owner), _queue.pending()[0]
+            return _overlay(records, {key: a for key, a in queued.items() if key[1] == str(owner)}, _army_key)
+    return [a for a in load_armies() if str(a.get("owner")) == str(owner)]
+
+
+def _battle_matches(battle, player, winner):
+    if player is not None:
+        return str(player) in dict(battle_participants(battle))
+    return str(battle.get("winner")) == str(winner)
+
+
+def find_battles(player=None, winner=None, limit=None):
+    """Return battle records newest first: those ``player`` fought in, or else those ``winner`` won."""
+    with _lock:
+        database = _sqlite()
+        if database is not None:
+            stored, queued = database.find_battles(player, winner, limit), _queue.pending()[2]
+            # Queued battles are newer than every stored one.
+            found = [b for b in reversed(queued) if _battle_matches(b, player, winner)]
+            return (copy.deepcopy(found) + stored)[:limit]
+    return [b for b in reversed(load_battles()) if _battle_matches(b, player, winner)][:limit]
+
+
+def _tally(battles, player, record):
+    # Count the finished battles ``player`` fought in, and won, into ``record``.
+    for battle in battles:
+        side = dict(battle_participants(battle)).get(str(player))
+        if side is not None and battle.get("winner") is not None:
+            record["battles"] += 1
+            record["wins"] += str(battle["winner"]) == side
+    return record
+
+
+def battle_record(player):
+    """Return {"battles", "wins"} over the finished battles ``player`` fought in, allies included."""
+    with _lock:
+        database = _sqlite()
+        if database is not None:
+            return _tally(_queue.pending()[2], player, database.battle_record(player))
+    return _tally(load_battles(), player, {"battles": 0, "wins": 0})
+
+
+def compact():
+    """Merge the army, battle and resource journals into their snapshots and wait for it, e.g. before shutdown."""
+    flush()
+    for journal in (_armies, _battles, _resources):
+        # A journal set aside earlier is merged first, then the live one.
+        for _ in range(2):
+            with _lock:
+                journal._open()
+                thread = journal.start_compaction()
+            if thread is None:
+                break
+            thread.join()
 
 
 # --- Persistent battle thread tracking ---
 def get_active_battle_threads():
     """Return a set of active battle thread IDs from local storage."""
-    with _lock:
-        data = _read_json(ACTIVE_BATTLES_FILE, [])
-        # Normalize to strings for consistency
-        return set(str(x) for x in data if x is not None)
+    try:
+        data = _queue.read_file(ACTIVE_BATTLES_FILE)
+        data = [] if data is None else json.loads(data)
+    except Exception as e:
+        print(f"[Local Store] Failed to read {ACTIVE_BATTLES_FILE.name}: {e}")
+        data = []
+    # Normalize to strings for consistency
+    return set(str(x) for x in data if x is not None)
 
 
 def set_active_battle_threads(thread_ids):
     """Replace the list of active battle thread IDs in local storage."""
-    with _lock:
-        data = [str(t) for t in thread_ids]
-        _atomic_write_json(ACTIVE_BATTLES_FILE, data)
+    data = [str(t) for t in thread_ids]
+    _queue.put_file(ACTIVE_BATTLES_FILE, json.dumps(data, indent=2).encode("utf-8"))
+
+
+# --- Binary checkpoints of games in progress, one file per thread ---
+CHECKPOINT_DIR = DATA_DIR / "checkpoints"
+
+
+def _checkpoint_path(thread_id):
+    return CHECKPOINT_DIR / f"{thread_id}.bin"
+
+
+def _log_segment_path(thread_id):
+    return CHECKPOINT_DIR / f"{thread_id}.log"
+
+
+def save_checkpoint(thread_id, data: bytes) -> None:
+    """Queue an atomic replacement of the checkpoint of one thread."""
+    _queue.put_file(_checkpoint_path(thread_id), bytes(data))
+
+
+def save_log_segment(thread_id, data: bytes, append=False) -> None:
+    """Queue a replacement of the battle log segment of one thread, or with ``append`` an append to it.
+
+    Queue it before the checkpoint it goes with: files are written in the
+    order they were queued, so a crash never leaves a checkpoint whose log
+    is not on disk.
+    """
+    _queue.put_file(_log_segment_path(thread_id), bytes(data), append=append)
+
+
+def _read_file(path: Path, name):
+    try:
+        return _queue.read_file(path)
+    except Exception as e:
+        print(f"[Local Store] Failed to read {name}: {e}")
+        return None
+
+
+def load_checkpoint(thread_id):
+    """Return the checkpoint bytes of a thread, or None if it has none."""
+    return _read_file(_checkpoint_path(thread_id), f"checkpoint {thread_id}")
+
+
+def load_log_segment(thread_id):
+    """Return the battle log segment bytes of a thread, or None if it has none."""
+    return _read_file(_log_segment_path(thread_id), f"log segment {thread_id}")
+
+
+def delete_checkpoint(thread_id) -> None:
+    """Delete the checkpoint of one thread and its log segment."""
+    _queue.put_file(_log_segment_path(thread_id), None)
+    _queue.put_file(_checkpoint_path(thread_id), None)
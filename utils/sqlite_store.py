@@ -0,0 +1,155 @@
+"""SQLite storage for army, resource and battle records.
+
+An alternative to the JSON journals in ``utils.sheets_sync``, selected there
+by ``BATTLE_SIM_STORAGE=sqlite`` or by a database file in the data
+directory. The database runs in WAL mode so readers (reports, backups) never
+block the bot's writes. Armies are keyed by (owner, id) and battles are
+indexed by participant and winner, so lookups and writes are B-tree
+operations instead of scans of the whole history.
+
+Records are stored as their JSON text next to the indexed columns; callers
+pass records already converted to plain JSON values. Ids are compared as
+strings, as the JSON store always did.
+"""
+import json
+import sqlite3
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS armies (
+    owner TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    UNIQUE (owner, id)
+);
+CREATE TABLE IF NOT EXISTS battles (
+    seq INTEGER PRIMARY KEY,
+    id TEXT,
+    winner TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS battles_by_id ON battles (id);
+CREATE INDEX IF NOT EXISTS battles_by_winner ON battles (winner);
+CREATE TABLE IF NOT EXISTS resources (
+    player TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS battle_players (
+    player TEXT NOT NULL,
+    battle INTEGER NOT NULL REFERENCES battles (seq),
+    side TEXT NOT NULL,
+    PRIMARY KEY (player, battle)
+) WITHOUT ROWID;
+"""
+
+# Statements are kept as constants: sqlite3 caches the prepared statement for
+# each SQL string per connection, so every call after the first reuses it.
+UPSERT_ARMY = ("INSERT INTO armies (owner, id, data) VALUES (?, ?, ?) "
+               "ON CONFLICT (owner, id) DO UPDATE SET data = excluded.data")
+DELETE_ARMY = "DELETE FROM armies WHERE owner = ? AND id = ?"
+UPSERT_RESOURCES = ("INSERT INTO resources (player, data) VALUES (?, ?) "
+                    "ON CONFLICT (player) DO UPDATE SET data = excluded.data")
+INSERT_BATTLE = "INSERT INTO battles (id, winner, data) VALUES (?, ?, ?)"
+INSERT_BATTLE_PLAYER = "INSERT OR IGNORE INTO battle_players (player, battle, side) VALUES (?, ?, ?)"
+SELECT_ARMY = "SELECT data FROM armies WHERE owner = ? AND id = ?"
+SELECT_ARMIES_OF = "SELECT data FROM armies WHERE owner = ? ORDER BY rowid"
+SELECT_ARMIES = "SELECT data FROM armies ORDER BY rowid"
+SELECT_RESOURCES = "SELECT data FROM resources ORDER BY rowid"
+SELECT_RESOURCES_OF = "SELECT data FROM resources WHERE player = ?"
+SELECT_BATTLES = "SELECT data FROM battles ORDER BY seq"
+SELECT_BATTLES_OF = ("SELECT b.data FROM battle_players p JOIN battles b ON b.seq = p.battle "
+                     "WHERE p.player = ? ORDER BY p.battle DESC LIMIT ?")
+SELECT_BATTLES_WON = "SELECT data FROM battles WHERE winner = ? ORDER BY seq DESC LIMIT ?"
+SELECT_RECORD = ("SELECT count(b.winner), count(CASE WHEN b.winner = p.side THEN 1 END) "
+                 "FROM battle_players p JOIN battles b ON b.seq = p.battle WHERE p.player = ?")
+
+
+def battle_participants(record):
+    """Yield (player, side) for everyone who fought in a battle record, as strings.
+
+    The record's ``sides`` map (player to side leader) covers allies; without
+    it the leaders and army owners count as fighting for themselves.
+    """
+    sides = {str(player): str(side) for player, side in (record.get('sides') or {}).items()}
+    for player in (record.get('aggressor'), record.get('defender'),
+                   *(army.get('owner') for army in record.get('armies') or ())):
+        if player is not None:
+            sides.setdefault(str(player), str(player))
+    return sides.items()
+
+
+class SQLiteStore:
+    """Army, resource and battle records in one SQLite database file; not thread-safe, callers serialize access."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode a commit only syncs at checkpoints; a crash can lose the last commits but never corrupts.
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def is_empty(self):
+        return all(self.db.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table})").fetchone()[0]
+                   for table in ('armies', 'battles', 'resources'))
+
+    def write(self, armies, battles, removed_armies=(), resources=()):
+        """Apply one batch in one transaction.
+
+        Upserts army and {"player", "resources"} records, deletes the armies
+        keyed (id, owner) in ``removed_armies`` and adds battle records.
+        """
+        with self.db:
+            for record in armies:
+                self._upsert_army(record)
+            self.db.executemany(DELETE_ARMY, ((owner, army_id) for army_id, owner in removed_armies))
+            self.db.executemany(UPSERT_RESOURCES, ((str(record['player']), json.dumps(record, ensure_ascii=False))
+                                                   for record in resources))
+            for record in battles:
+                self._add_battle(record)
+
+    def _upsert_army(self, record):
+        self.db.execute(UPSERT_ARMY, (str(record.get('owner')), str(record.get('id')),
+                                      json.dumps(record, ensure_ascii=False)))
+
+    def _add_battle(self, record):
+        winner = record.get('winner')
+        seq = self.db.execute(INSERT_BATTLE, (None if record.get('id') is None else str(record['id']),
+                                              None if winner is None else str(winner),
+                                              json.dumps(record, ensure_ascii=False))).lastrowid
+        self.db.executemany(INSERT_BATTLE_PLAYER, ((player, seq, side) for player, side in battle_participants(record)))
+
+    def army(self, owner, army_id):
+        row = self.db.execute(SELECT_ARMY, (str(owner), str(army_id))).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def armies(self, owner=None):
+        rows = (self.db.execute(SELECT_ARMIES) if owner is None
+                else self.db.execute(SELECT_ARMIES_OF, (str(owner),)))
+        return [json.loads(data) for data, in rows]
+
+    def resources(self, player=None):
+        """Every {"player", "resources"} record, or only ``player``'s (a list of at most one)."""
+        rows = (self.db.execute(SELECT_RESOURCES) if player is None
+                else self.db.execute(SELECT_RESOURCES_OF, (str(player),)))
+        return [json.loads(data) for data, in rows]
+
+    def battles(self):
+        return [json.loads(data) for data, in self.db.execute(SELECT_BATTLES)]
+
+    def find_battles(self, player=None, winner=None, limit=None):
+        """Newest first: the battles ``player`` fought in, or else those ``winner`` won."""
+        if player is not None:
+            rows = self.db.execute(SELECT_BATTLES_OF, (str(player), -1 if limit is None else limit))
+        else:
+            rows = self.db.execute(SELECT_BATTLES_WON, (str(winner), -1 if limit is None else limit))
+        return [json.loads(data) for data, in rows]
+
+    def battle_record(self, player):
+        """{"battles", "wins"} over the finished battles ``player`` fought in."""
+        battles, wins = self.db.execute(SELECT_RECORD, (str(player),)).fetchone()
+        return {"battles": battles, "wins": wins}